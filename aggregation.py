@@ -0,0 +1,90 @@
+# grouped mean/std/count/confidence interval for several metrics at once
+# one groupby over the wide table collects count, mean and M2 (sum of squared deviations
+# from the mean) per source column, every metric (a source column with an optional linear
+# transform, e.g. the 0-1 normalized scores of the multi-outcome chart) is then derived from
+# those moments. moments of separate groups/partitions are merged with combine_moments()
+# (chan et al.'s parallel update), which unlike raw power sums does not lose precision.
+# no long-format copy of the patient rows is ever made, only the small result is long
+
+import numpy as np
+import pandas as pd
+
+from engine import get_engine
+
+Z_95 = 1.96
+
+
+def metric(column, label=None, scale=1.0, offset=0.0):
+    # value used for the metric = offset + scale * column
+    return {'column': column, 'label': label or column, 'scale': scale, 'offset': offset}
+
+
+def moments_table(frame, by, columns, engine=None):
+    # count, mean_<column> and m2_<column> per group, computed by the configured engine (see engine.py)
+    return get_engine(engine)['group_moments'](frame, list(by), list(dict.fromkeys(columns)))
+
+
+def combine_moments(moments, by, columns, pairs=(), dropna=True):
+    # merge rows of (count, mean_<c>, m2_<c>, comoment_<a>_<b>) into one row per group:
+    # n = sum n_i, mean = sum n_i mean_i / n, M2 = sum M2_i + sum n_i (mean_i - mean)^2,
+    # C_ab = sum C_ab_i + sum n_i (mean_a_i - mean_a) (mean_b_i - mean_b)
+    moments = moments[moments['count'] > 0]
+    if dropna:
+        # cells with a missing key (no literacy group for HealthLiteracy 0) belong to no group
+        moments = moments.dropna(subset=list(by))
+    grouped = moments.groupby(by, observed=True, dropna=dropna)
+    codes = grouped.ngroup().to_numpy()
+    combined = grouped.size().reset_index()[by]
+    n_groups = len(combined)
+    n = moments['count'].to_numpy()
+    total = np.bincount(codes, weights=n, minlength=n_groups)
+    combined['count'] = total.astype(np.int64)
+    deviations = {}
+    for column in dict.fromkeys(list(columns) + [c for pair in pairs for c in pair]):
+        mean = moments[f'mean_{column}'].to_numpy()
+        combined_mean = np.bincount(codes, weights=n * mean, minlength=n_groups) / total
+        deviations[column] = mean - combined_mean[codes]
+        combined[f'mean_{column}'] = combined_mean
+    for column in columns:
+        d = deviations[column]
+        combined[f'm2_{column}'] = np.bincount(codes, weights=moments[f'm2_{column}'].to_numpy() + n * d * d,
+                                               minlength=n_groups)
+    for a, b in pairs:
+        shift = n * deviations[a] * deviations[b]
+        combined[f'comoment_{a}_{b}'] = np.bincount(
+            codes, weights=moments[f'comoment_{a}_{b}'].to_numpy() + shift, minlength=n_groups)
+    return combined
+
+
+def add_confidence_interval(stats, z=Z_95):
+    # normal approximation, z * std / sqrt(count)
+    stats['ci'] = z * stats['std'] / np.sqrt(stats['count'])
+    stats['lower'] = stats['mean'] - stats['ci']
+    stats['upper'] = stats['mean'] + stats['ci']
+    return stats
+
+
+def summarize_moments(moments, by, metrics, z=Z_95):
+    # one row per group x metric: by..., MetricLabel, mean, std, count, ci, lower, upper
+    moments = moments[moments['count'] > 0]
+    count = moments['count'].to_numpy()
+    parts = []
+    for m in metrics:
+        mean = moments[f'mean_{m["column"]}'].to_numpy()
+        m2 = moments[f'm2_{m["column"]}'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = np.where(count > 1, m2 / (count - 1), np.nan)
+        part = moments[by].reset_index(drop=True)
+        part['MetricLabel'] = m['label']
+        part['mean'] = m['offset'] + m['scale'] * mean
+        part['std'] = abs(m['scale']) * np.sqrt(np.clip(variance, 0, None))
+        part['count'] = count
+        parts.append(part)
+    stats = pd.concat(parts, ignore_index=True)
+    return add_confidence_interval(stats, z)
+
+
+def grouped_metric_stats(frame, by, metrics, z=Z_95, engine=None):
+    by = [by] if isinstance(by, str) else list(by)
+    moments = moments_table(frame, by, [m['column'] for m in metrics], engine)
+    return summarize_moments(moments, by, metrics, z)
@@ -0,0 +1,384 @@
+# local json api over the dashboard's data prep
+# the aggregates the dashboard charts (adherence stats, the literacy trends, HbA1c quartiles,
+# the group tests, BRFSS prevalence by education), the predictor grid and batch predictions of
+# the outcome model, from the same cached loaders as diabetes_dashboard.py (see data_loader.py).
+#   GET  /health                      model and cache state
+#   GET  /v1/adherence                ?site= &approximate=1 &bootstrap=1 &<cohort filter>=<label>
+#   GET  /v1/multi-outcome            same parameters
+#   GET  /v1/hba1c-quartiles          ?site= &approximate=1 &<cohort filter>
+#   GET  /v1/group-tests              ?site= &<cohort filter>
+#   GET  /v1/prevalence               BRFSS counts and prevalence by education
+#   GET  /v1/predictor-grid           the 44 literacy x education outcomes the predictor shows
+#   POST /v1/predictions              {"patients": [{"HealthLiteracy": 7, "EducationLevel": 2}, ...]},
+#                                     clipped to the predictor's ranges like the grid
+# cohort filters are the dashboard's (cohort.py) in snake case, a repeated parameter picks several
+# labels (?age_band=50-59&age_band=60-69&gender=Female&match=any).
+# the server is async: a response cache hit is answered on the event loop, everything else runs in
+# the thread pool, so slow builds do not hold up other requests, and concurrent requests for the
+# same entry wait for one build (data_loader's build locks). the json of every GET is kept in an
+# LRU cache of RESPONSE_CACHE_SIZE responses for RESPONSE_TTL seconds, keyed by the version of the
+# files it was built from (the fingerprint data_loader checks on every rerun) and the parsed query
+# parameters, so a changed file is never answered from the cache. predictions are not cached, they
+# are one matrix product on the cached model
+#
+#   python api.py --port 8502
+
+import argparse
+import contextlib
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Route
+
+from brfss import brfss_paths, education_counts_frame, prevalence_frame
+from cohort import COHORT_FILTERS, cohort_description, cohort_key, filter_options
+from data_loader import (cache_info, dataset_version, file_fingerprint, load_brfss_counts, load_group_tests,
+                         load_outcome_model, load_summary_cube, patient_paths, site_name)
+from outcome_model import BASE_FEATURES, clip_predictions, predict
+from predictor import outcome_grid
+from summary_cube import cube_correlation, cube_quantiles
+from warm_up import start_warm_up
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8502
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_TTL = 300
+# patients per prediction request
+MAX_PREDICTION_ROWS = 10_000
+# query parameter -> cohort filter name
+FILTER_PARAMS = {name.lower().replace(' ', '_'): name for name in COHORT_FILTERS}
+TRUE_VALUES = {'1', 'true', 'yes'}
+FALSE_VALUES = {'', '0', 'false', 'no'}
+
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
+_response_stats = {'hits': 0, 'misses': 0}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# response cache
+
+def cached_response(key, now=None):
+    # the json of key if it is younger than RESPONSE_TTL, None otherwise
+    now = time.monotonic() if now is None else now
+    with _responses_lock:
+        entry = _responses.get(key)
+        if entry is None or now - entry['time'] > RESPONSE_TTL:
+            _response_stats['misses'] += 1
+            return None
+        _responses.move_to_end(key)
+        _response_stats['hits'] += 1
+        return entry['body']
+
+
+def store_response(key, body, now=None):
+    now = time.monotonic() if now is None else now
+    with _responses_lock:
+        _responses[key] = {'body': body, 'time': now}
+        _responses.move_to_end(key)
+        while len(_responses) > RESPONSE_CACHE_SIZE:
+            _responses.popitem(last=False)
+        # expired entries of files that changed would otherwise sit there until they are pushed out
+        for old_key in [k for k, e in _responses.items() if now - e['time'] > RESPONSE_TTL]:
+            del _responses[old_key]
+
+
+def response_cache_info():
+    with _responses_lock:
+        return dict(_response_stats, entries=len(_responses), size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_TTL)
+
+
+def clear_responses():
+    with _responses_lock:
+        _responses.clear()
+
+
+# query parameters
+
+def _flag(params, name):
+    value = params.get(name, '').lower()
+    if value not in TRUE_VALUES | FALSE_VALUES:
+        raise RequestError(400, f"{name} must be one of 1, 0, true, false (got {value!r})")
+    return value in TRUE_VALUES
+
+
+def parse_cohort(params):
+    # cohort_key() of the filter parameters, unknown filters and labels are errors
+    selection = {}
+    for param in params:
+        if param in FILTER_PARAMS:
+            name = FILTER_PARAMS[param]
+            labels = params.getlist(param)
+            unknown = [label for label in labels if label not in filter_options(name)]
+            if unknown:
+                raise RequestError(400, f"unknown {param} {', '.join(map(repr, unknown))}, "
+                                        f"expected one of {', '.join(filter_options(name))}")
+            selection[name] = labels
+    match = params.get('match', 'all')
+    if match not in ('all', 'any'):
+        raise RequestError(400, f"match must be all or any (got {match!r})")
+    return cohort_key(selection, match)
+
+
+def parse_query(params, allowed):
+    # the parameters an endpoint takes, in the form the cache key and the loaders use
+    known = allowed - {'cohort'}
+    if 'cohort' in allowed:
+        known |= set(FILTER_PARAMS) | {'match'}
+    unexpected = [p for p in params if p not in known]
+    if unexpected:
+        raise RequestError(400, f"unexpected parameter {', '.join(map(repr, unexpected))}, "
+                                f"expected {', '.join(sorted(known)) or 'none'}")
+    return {
+        'site': params.get('site') or None,
+        'approximate': _flag(params, 'approximate'),
+        'bootstrap': _flag(params, 'bootstrap'),
+        'cohort': parse_cohort(params) if 'cohort' in allowed else None,
+    }
+
+
+def site_paths(source, site):
+    paths = patient_paths(source)
+    if site is not None:
+        paths = [p for p in paths if site_name(p) == site]
+        if not paths:
+            raise RequestError(404, f"unknown site {site!r}, expected one of "
+                                    f"{', '.join(site_name(p) for p in patient_paths(source))}")
+    return paths
+
+
+# json
+
+def records(frame):
+    # rows as dicts, NaN as null
+    return json.loads(frame.to_json(orient='records', double_precision=15))
+
+
+def number(value):
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+def dump(payload):
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def _dataset(paths, query):
+    return {
+        'versions': {site_name(p): dataset_version(p) for p in paths},
+        'cohort': cohort_description(query['cohort']),
+        'site': query['site'],
+    }
+
+
+# endpoints, everything below runs in the thread pool
+
+def adherence_payload(source, query):
+    from charts import adherence_trend, medication_adherence_stats
+    cube = load_summary_cube(source, query['cohort'], query['site'], query['approximate'])
+    payload = {'dataset': _dataset(cube['paths'], query), 'n_rows': cube['n_rows']}
+    if cube['n_rows'] == 0:
+        return dict(payload, groups=[], trend=[], correlation=None)
+    return dict(payload,
+                groups=records(medication_adherence_stats(cube, query['bootstrap'])),
+                trend=records(adherence_trend(cube)),
+                correlation=number(cube_correlation(cube, 'HealthLiteracy', 'MedicationAdherence', diagnosis=1)))
+
+
+def multi_outcome_payload(source, query):
+    from charts import multi_outcome_stats
+    cube = load_summary_cube(source, query['cohort'], query['site'], query['approximate'])
+    payload = {'dataset': _dataset(cube['paths'], query), 'n_rows': cube['n_rows']}
+    if cube['n_rows'] == 0:
+        return dict(payload, metrics=[])
+    return dict(payload, metrics=records(multi_outcome_stats(cube, query['bootstrap'])))
+
+
+def hba1c_quartiles_payload(source, query):
+    cube = load_summary_cube(source, query['cohort'], query['site'], query['approximate'])
+    payload = {'dataset': _dataset(cube['paths'], query), 'n_rows': cube['n_rows']}
+    if cube['n_rows'] == 0:
+        return dict(payload, quartiles=[])
+    return dict(payload, quartiles=records(cube_quantiles(cube, 'hba1c_by_group')))
+
+
+def group_tests_payload(source, query):
+    paths = site_paths(source, query['site'])
+    tests = load_group_tests(cohort=query['cohort'], paths=paths)
+    return {'dataset': _dataset(paths, query), 'n_rows': tests['n_rows'], 'n_permutations': tests['n_permutations'],
+            'permutation_rows': tests['permutation_rows'], 'tests': records(tests['tests'])}
+
+
+def prevalence_payload(source, query):
+    counts = load_brfss_counts()
+    if counts is None:
+        raise RequestError(404, "no BRFSS survey files")
+    return {'files': [site_name(p) for p in brfss_paths()], 'n_rows': int(counts.sum()),
+            'prevalence': records(prevalence_frame(counts)),
+            'education_status': records(education_counts_frame(counts))}
+
+
+def predictor_grid_payload(source, query):
+    model = load_outcome_model(source)
+    cells = [{'HealthLiteracy': level, 'EducationLevelStr': education, 'PredictedHbA1c': outcome['hba1c'],
+              'PredictedQualityOfLifeScore': outcome['qol'], 'PredictedMedicationAdherence': outcome['adherence']}
+             for (level, education), outcome in outcome_grid(model).items()]
+    return {'model_version': model['version'], 'cells': cells}
+
+
+# endpoint -> (payload builder, query parameters it takes, files its answer depends on)
+ENDPOINTS = {
+    '/v1/adherence': (adherence_payload, {'site', 'approximate', 'bootstrap', 'cohort'}, 'patients'),
+    '/v1/multi-outcome': (multi_outcome_payload, {'site', 'approximate', 'bootstrap', 'cohort'}, 'patients'),
+    '/v1/hba1c-quartiles': (hba1c_quartiles_payload, {'site', 'approximate', 'cohort'}, 'patients'),
+    '/v1/group-tests': (group_tests_payload, {'site', 'cohort'}, 'patients'),
+    '/v1/prevalence': (prevalence_payload, set(), 'brfss'),
+    '/v1/predictor-grid': (predictor_grid_payload, set(), 'patients'),
+}
+
+
+def _file_versions(source, files):
+    # what a cached response is valid for: (path, mtime, size) of every file it was built from
+    paths = patient_paths(source) if files == 'patients' else brfss_paths()
+    try:
+        return tuple(file_fingerprint(p) for p in paths)
+    except FileNotFoundError as e:
+        raise RequestError(404, f"missing data file {e.filename}")
+
+
+def _json_response(body, status=200, cache=None):
+    headers = {'X-Cache': cache} if cache else None
+    return Response(body, status_code=status, media_type='application/json', headers=headers)
+
+
+def _error_response(e):
+    return _json_response(dump({'error': str(e)}), status=e.status)
+
+
+def _build_body(build, *args):
+    # (json, status) of build(*args), every failure is a json error like the bad requests
+    try:
+        return dump(build(*args)), 200
+    except RequestError as e:
+        return dump({'error': str(e)}), e.status
+    except FileNotFoundError as e:
+        return dump({'error': str(e)}), 404
+    except Exception as e:
+        # e.g. a data file the schema rejects (schema.py)
+        logger.exception("%s failed", build.__name__)
+        return dump({'error': f"{type(e).__name__}: {e}"}), 500
+
+
+async def aggregate(request):
+    build, allowed, files = ENDPOINTS[request.url.path]
+    source = request.app.state.source
+    try:
+        query = parse_query(request.query_params, allowed)
+        key = (request.url.path, _file_versions(source, files), tuple(sorted(query.items(), key=lambda i: i[0])))
+    except RequestError as e:
+        return _error_response(e)
+    body = cached_response(key)
+    if body is not None:
+        return _json_response(body, cache='hit')
+    body, status = await run_in_threadpool(_build_body, build, source, query)
+    if status == 200:
+        store_response(key, body)
+    return _json_response(body, status=status, cache='miss')
+
+
+def prediction_batch(payload, features):
+    # the patients of a prediction request as a frame of the model features, the base features
+    # are required, a covariate nobody has gets the model's fill value (see outcome_model.predict)
+    patients = payload.get('patients') if isinstance(payload, dict) else None
+    if not isinstance(patients, list) or not all(isinstance(p, dict) for p in patients):
+        raise RequestError(400, 'expected {"patients": [{"HealthLiteracy": ..., "EducationLevel": ...}, ...]}')
+    if len(patients) > MAX_PREDICTION_ROWS:
+        raise RequestError(413, f"at most {MAX_PREDICTION_ROWS:,} patients per request")
+    given = {column for p in patients for column in p}
+    columns = [c for c in features if c in BASE_FEATURES or c in given]
+    batch = pd.DataFrame(patients, columns=columns)
+    for column in columns:
+        values = pd.to_numeric(batch[column], errors='coerce')
+        if values.isna().any():
+            raise RequestError(400, f"patient {int(values.isna().idxmax())}: {column} must be a number")
+        batch[column] = values.astype('float64')
+    return batch
+
+
+def predictions_payload(source, raw):
+    # clipped to the ranges the predictor grid and score_patients.py report (outcome_model.OUTCOME_RANGES)
+    try:
+        payload = json.loads(raw)
+    except ValueError:
+        raise RequestError(400, "request body is not json")
+    model = load_outcome_model(source)
+    batch = prediction_batch(payload, model['features'])
+    return {'model_version': model['version'], 'predictions': records(clip_predictions(predict(model, batch)))}
+
+
+async def predictions(request):
+    body, status = await run_in_threadpool(_build_body, predictions_payload, request.app.state.source,
+                                           await request.body())
+    return _json_response(body, status=status)
+
+
+async def health(request):
+    return _json_response(dump({
+        'status': 'ok',
+        'sites': [site_name(p) for p in patient_paths(request.app.state.source)],
+        'data_cache': cache_info(),
+        'response_cache': response_cache_info(),
+    }))
+
+
+def create_app(source=None, warm_up=True):
+    # source as in data_loader.patient_paths(); warm_up starts loading the shared caches (warm_up.py)
+    routes = [Route('/health', health)]
+    routes += [Route(path, aggregate) for path in ENDPOINTS]
+    routes.append(Route('/v1/predictions', predictions, methods=['POST']))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        if warm_up:
+            start_warm_up(source)
+        yield
+
+    app = Starlette(routes=routes, lifespan=lifespan)
+    app.state.source = source
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the dashboard aggregates and outcome predictions as json.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port (default: {DEFAULT_PORT})")
+    parser.add_argument('--source', help="patient csv, directory or glob (default: DIABETES_DATA or diabetes_data.csv)")
+    parser.add_argument('--no-warm-up', action='store_true', help="load the data on the first requests instead")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"serving on http://{args.host}:{args.port}", file=sys.stderr)
+    uvicorn.run(create_app(args.source, warm_up=not args.no_warm_up), host=args.host, port=args.port,
+                log_level='warning')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,491 @@
+# headless benchmark of the dashboard computations on synthetic cohorts
+# every stage is timed and its peak memory recorded, per cohort size. memory is the peak
+# resident set size above the level at the start of the stage, sampled every few ms from
+# /proc (tracemalloc where there is no /proc; it slows python-heavy stages like altair a lot).
+# the row-level code the dashboard used to run (melt + groupby, scipy pearsonr, row groupbys)
+# is kept here as "legacy" stages so the cube-based replacements can be compared against it.
+# the spec bytes of every chart are compared across cohort sizes, a chart whose spec grows
+# with the data is embedding rows, approximate quartiles are checked against their error bound.
+# the ANOVA / Kruskal-Wallis statistics of group_tests.py are compared against scipy's.
+# every dataframe engine (engine.py) runs what the dashboard routes through it (the csv parse, the
+# BRFSS count and the grouped stats of the bootstrap charts), checked against the pandas engine. the BRFSS count is also timed on the
+# first scan (which writes the sidecar) and on the memory-mapped sidecar.
+# results go to a json file, --baseline compares against an earlier run
+#
+#   python benchmark.py --sizes 10000,100000,1000000 --output benchmark_results.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import altair as alt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import data_loader
+from aggregation import grouped_metric_stats, metric
+from brfss import BRFSS_COLUMNS, aggregate_brfss_file
+from charts import (hba1c_distribution_chart, improved_medication_adherence_chart, multi_outcome_chart,
+                    multi_outcome_stats, outcome_metrics)
+from cohort import build_cohort_index, cohort_key, select_rows
+from correlation import CORRELATION_COLUMNS, correlation_matrices
+from engine import DEFAULT_ENGINE, ENGINE_TOLERANCE, ENGINES, engine_parity, get_engine
+from group_tests import TEST_GROUPINGS, TEST_OUTCOMES, group_difference_tests
+from instrumentation import spec_bytes
+from schema import apply_schema, validate_frame
+from sampling import SAMPLE_POINTS, stratified_sample
+from summary_cube import (build_summary_cube, cube_basis, cube_correlation, cube_from_basis,
+                          cube_keys, literacy_bin_labels, merge_cubes, quantile_error)
+from synthetic_data import generate_cohort, load_marginals, write_cohort_csv
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+# a stage this much slower than the baseline run is reported as a regression
+REGRESSION_RATIO = 1.2
+SAMPLE_INTERVAL = 0.005
+# a chart spec that grows more than this between the smallest and largest cohort embeds row data
+SPEC_GROWTH_LIMIT = 1.1
+# per-pair scipy calls over every column take minutes at 1M rows, the legacy stage uses the first few
+LEGACY_CORRELATION_COLUMNS = CORRELATION_COLUMNS[:8]
+
+
+def _rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _measure(function, args):
+    # returns (value, seconds, peak bytes above the start of the call)
+    if not os.path.exists('/proc/self/statm'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        value = function(*args)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return value, seconds, peak
+
+    baseline = _rss_bytes()
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], _rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    value = function(*args)
+    seconds = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return value, seconds, max(peak[0], _rss_bytes()) - baseline
+
+
+def run_stage(results, rows, name, function, *args):
+    value, seconds, peak = _measure(function, args)
+    results.append({'rows': rows, 'stage': name, 'seconds': seconds, 'peak_bytes': peak})
+    print(f"{rows:>12,}  {name:<28} {seconds * 1000:>10.1f} ms  {peak / 2**20:>9.1f} MiB", file=sys.stderr)
+    return value
+
+
+def legacy_adherence_aggregations(diabetes_data):
+    # improved_medication_adherence_chart before the summary cube
+    diabetic_data = diabetes_data[diabetes_data['Diagnosis'] == 1].copy()
+    diabetic_data['HealthLiteracyBin'] = pd.cut(diabetic_data['HealthLiteracy'], bins=[0, 2, 4, 6, 8, 10],
+                                                labels=literacy_bin_labels, include_lowest=True)
+    adherence_stats = diabetic_data.groupby(['HealthLiteracyBin', 'EducationLevelStr'], observed=True)[
+        'MedicationAdherence'].agg(['mean', 'median', 'std', 'count']).reset_index()
+    trend_data = diabetic_data.groupby('HealthLiteracyBin', observed=True)['MedicationAdherence'].mean()
+    diabetic_data['AdherenceBin'] = pd.cut(diabetic_data['MedicationAdherence'], bins=[0, 2, 4, 6, 8, 10],
+                                           labels=literacy_bin_labels, include_lowest=True)
+    heatmap_data = diabetic_data.groupby(['HealthLiteracyBin', 'AdherenceBin'], observed=True).size()
+    return adherence_stats, trend_data, heatmap_data
+
+
+def legacy_melt_groupby(diabetes_data):
+    # the multi-outcome section before the summary cube: copy, normalize, melt, copy, groupby
+    metrics_df = diabetes_data[diabetes_data['Diagnosis'] == 1].copy()
+    metrics_df['HbA1c_norm'] = 1 - ((metrics_df['HbA1c'] - 4) / 6)
+    metrics_df['QoL_norm'] = metrics_df['QualityOfLifeScore'] / 100
+    metrics_df['Med_norm'] = metrics_df['MedicationAdherence'] / 10
+    metrics_long = pd.melt(metrics_df, id_vars=['HealthLiteracy', 'HealthLiteracyGroup'],
+                           value_vars=['HbA1c_norm', 'QoL_norm', 'Med_norm'],
+                           var_name='Metric', value_name='NormalizedValue')
+    grouped_metrics = metrics_long.copy()
+    grouped_metrics['HealthLiteracyGroup'] = np.round(grouped_metrics['HealthLiteracy']).astype(int)
+    return grouped_metrics.groupby(['HealthLiteracyGroup', 'Metric'])['NormalizedValue'].agg(
+        ['mean', 'std', 'count']).reset_index()
+
+
+def single_pass_multi_metric(diabetes_data):
+    diabetic_data = diabetes_data[diabetes_data['Diagnosis'] == 1]
+    frame = diabetic_data[['HbA1c', 'QualityOfLifeScore', 'MedicationAdherence']].assign(
+        LiteracyScore=np.round(diabetic_data['HealthLiteracy']).astype(int))
+    return grouped_metric_stats(frame, ['LiteracyScore'], outcome_metrics)
+
+
+def write_brfss_csv(path, n_rows, seed=0):
+    # survey rows with the two columns brfss.py reads, as floats like the real file
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        'Diabetes_012': rng.choice([0.0, 1.0, 2.0], size=n_rows, p=[0.84, 0.02, 0.14]),
+        'Education': rng.integers(1, 7, size=n_rows).astype(np.float64),
+    })[BRFSS_COLUMNS].to_csv(path, index=False)
+    return path
+
+
+def bootstrap_point_stats(diabetes_data, by, metrics, engine=None):
+    # the grouped_metric_stats of bootstrap_metric_stats on the frame load_bootstrap_stats builds
+    frame = cube_keys(diabetes_data).assign(**{m['column']: diabetes_data[m['column']] for m in metrics})
+    return grouped_metric_stats(frame[frame['Diagnosis'] == 1], by, metrics, engine=engine)
+
+
+def benchmark_engines(n_rows, results, diabetes_data, csv_path=None, brfss_path=None):
+    # what the dashboard runs through the engine, each stage records how far it is from pandas:
+    # the point estimates of the two bootstrap charts, the patient csv parse and the BRFSS scan.
+    # the summary cube and the group tests do not go through the engines
+    stages = [('engine_adherence_stats',
+               lambda engine: bootstrap_point_stats(diabetes_data, ['HealthLiteracyBin', 'EducationLevelStr'],
+                                                    [metric('MedicationAdherence')], engine)),
+              ('engine_outcome_stats',
+               lambda engine: bootstrap_point_stats(diabetes_data, ['LiteracyScore'], outcome_metrics, engine))]
+    if csv_path is not None:
+        # the csv scan of every engine, the sidecar is timed separately (benchmark_brfss_sidecar)
+        stages.append(('engine_read_csv', lambda engine: get_engine(engine)['read_csv'](csv_path)))
+        stages.append(('engine_brfss_counts',
+                       lambda engine: aggregate_brfss_file(brfss_path, engine=engine, sidecar=False)))
+    for stage, function in stages:
+        by_engine = {}
+        for engine in ENGINES:
+            by_engine[engine] = run_stage(results, n_rows, f'{stage}_{engine}', function, engine)
+        parity = engine_parity(by_engine)
+        for engine in ENGINES:
+            next(r for r in results if r['rows'] == n_rows and r['stage'] == f'{stage}_{engine}')[
+                'engine_parity'] = parity[engine]
+
+
+def benchmark_brfss_sidecar(n_rows, results, brfss_path):
+    # the first scan parses the csv and streams the two columns into the sidecar, later scans
+    # memory-map it (what the dashboard pays after a restart)
+    counts = run_stage(results, n_rows, 'brfss_counts_first_scan', aggregate_brfss_file, brfss_path)
+    run_stage(results, n_rows, 'brfss_counts_sidecar', aggregate_brfss_file, brfss_path)
+    results[-1]['same_counts'] = bool((aggregate_brfss_file(brfss_path) == counts).all())
+
+
+# a typical sidebar selection: women aged 40-59 with hypertension
+BENCHMARK_COHORT = {'Gender': ['Female'], 'Age band': ['40-49', '50-59'], 'Hypertension': ['Yes']}
+
+
+def legacy_cohort_rebuild(diabetes_data):
+    # filtering the frame and building the cube again, what every filter change would cost without bitmaps
+    selected = diabetes_data[(diabetes_data['Gender'] == 1) & diabetes_data['Age'].between(40, 59)
+                             & (diabetes_data['Hypertension'] == 1)]
+    return build_summary_cube(selected.reset_index(drop=True))
+
+
+def quantile_errors(approximate_cube, cube):
+    # largest difference from the exact quartiles per summary, and whether it is within the documented bound
+    errors = {}
+    for name, exact in cube['quantiles'].items():
+        columns = ['min', 'q1', 'median', 'q3', 'max']
+        error = float(np.abs(approximate_cube['quantiles'][name][columns].to_numpy() - exact[columns].to_numpy()).max())
+        errors[name] = {'error': error, 'bound': quantile_error(name), 'within_bound': error <= quantile_error(name)}
+    return errors
+
+
+def cohort_cube(basis, index):
+    return cube_from_basis(basis, select_rows(index, cohort_key(BENCHMARK_COHORT)))
+
+
+def refresh_after_append(csv_path):
+    # what a rerun costs after rows were appended to the file: the cube and the patient table
+    return data_loader.load_summary_cube(csv_path), data_loader.load_patient_data(csv_path)
+
+
+def polyfit_trends(agg_metrics):
+    return [np.polyfit(part['HealthLiteracyGroup'], part['mean'], 1)
+            for _, part in agg_metrics.groupby('MetricLabel')]
+
+
+def scipy_pearsonr(diabetes_data):
+    diabetic_data = diabetes_data[diabetes_data['Diagnosis'] == 1]
+    return stats.pearsonr(diabetic_data['HealthLiteracy'], diabetic_data['MedicationAdherence'])[0]
+
+
+def legacy_pairwise_correlation(diabetes_data, columns):
+    # one pearsonr + spearmanr per pair of columns
+    results = {}
+    for i, x in enumerate(columns):
+        for y in columns[i + 1:]:
+            results[x, y] = (stats.pearsonr(diabetes_data[x], diabetes_data[y]),
+                             stats.spearmanr(diabetes_data[x], diabetes_data[y]))
+    return results
+
+
+def scipy_group_tests(diabetes_data):
+    # f_oneway + kruskal per grouping and outcome, what group_tests.py computes without the permutations
+    results = {}
+    for grouping, by in TEST_GROUPINGS.items():
+        groups = [part for _, part in diabetes_data.groupby(by, observed=True)]
+        for outcome, label in TEST_OUTCOMES.items():
+            samples = [part[outcome].to_numpy(dtype=np.float64) for part in groups]
+            results[grouping, label] = (stats.f_oneway(*samples).statistic, stats.kruskal(*samples).statistic)
+    return results
+
+
+def group_test_difference(tests, reference):
+    # largest relative difference of F and H from scipy's
+    differences = [abs(row[statistic] - expected) / abs(expected)
+                   for row in tests['tests'].to_dict('records')
+                   for statistic, expected in zip(['F', 'H'], reference[row['Grouping'], row['Outcome']])]
+    return float(max(differences))
+
+
+def benchmark_size(n_rows, marginals, results, workdir, seed=0, include_load=True):
+    raw = run_stage(results, n_rows, 'generate', generate_cohort, n_rows, marginals, seed)
+
+    if include_load:
+        csv_path = os.path.join(workdir, f'cohort_{n_rows}.csv')
+        write_cohort_csv(csv_path, n_rows, marginals, seed)
+        run_stage(results, n_rows, 'load_read_csv', pd.read_csv, csv_path)
+        data_loader.clear_cache()
+        run_stage(results, n_rows, 'load_cold', data_loader.load_patient_data, csv_path)
+        data_loader.clear_cache()
+        run_stage(results, n_rows, 'load_sidecar', data_loader.load_patient_data, csv_path)
+        run_stage(results, n_rows, 'load_cached', data_loader.load_patient_data, csv_path)
+        # a nightly append of 1% more patients, only the new rows should be parsed and merged
+        data_loader.load_summary_cube(csv_path)
+        generate_cohort(max(1, n_rows // 100), marginals, seed + 1).to_csv(csv_path, mode='a', header=False,
+                                                                         index=False)
+        run_stage(results, n_rows, 'append_refresh', refresh_after_append, csv_path)
+        data_loader.clear_cache()
+        brfss_path = write_brfss_csv(os.path.join(workdir, f'brfss_{n_rows}.csv'), n_rows, seed)
+
+    diabetes_data = run_stage(results, n_rows, 'derive',
+                              lambda frame: apply_schema(data_loader.derive_patient_columns(validate_frame(frame))),
+                              raw.copy())
+    del raw
+    benchmark_engines(n_rows, results, diabetes_data, *((csv_path, brfss_path) if include_load else ()))
+    if include_load:
+        benchmark_brfss_sidecar(n_rows, results, brfss_path)
+
+    run_stage(results, n_rows, 'legacy_adherence_rows', legacy_adherence_aggregations, diabetes_data)
+    run_stage(results, n_rows, 'legacy_melt_groupby', legacy_melt_groupby, diabetes_data)
+    run_stage(results, n_rows, 'single_pass_multi_metric', single_pass_multi_metric, diabetes_data)
+    run_stage(results, n_rows, 'legacy_pearsonr', scipy_pearsonr, diabetes_data)
+    run_stage(results, n_rows, 'legacy_pairwise_correlation', legacy_pairwise_correlation, diabetes_data,
+              LEGACY_CORRELATION_COLUMNS)
+    run_stage(results, n_rows, 'correlation_matrix_8col', correlation_matrices, diabetes_data,
+              LEGACY_CORRELATION_COLUMNS)
+    run_stage(results, n_rows, 'correlation_matrix', correlation_matrices, diabetes_data)
+    reference = run_stage(results, n_rows, 'legacy_scipy_group_tests', scipy_group_tests, diabetes_data)
+    tests = run_stage(results, n_rows, 'group_tests', group_difference_tests, diabetes_data)
+    results[-1]['max_relative_difference'] = group_test_difference(tests, reference)
+    run_stage(results, n_rows, 'cube_keys', cube_keys, diabetes_data)
+    cube = run_stage(results, n_rows, 'cube_build', build_summary_cube, diabetes_data)
+    basis = run_stage(results, n_rows, 'cube_basis', cube_basis, diabetes_data)
+    index = run_stage(results, n_rows, 'cohort_index', build_cohort_index, diabetes_data)
+    exact_cohort = run_stage(results, n_rows, 'cohort_cube', cohort_cube, basis, index)
+    run_stage(results, n_rows, 'legacy_cohort_rebuild', legacy_cohort_rebuild, diabetes_data)
+    # approximate mode: histogram quartiles, checked against the exact ones
+    approximate_cube = run_stage(results, n_rows, 'cube_build_approx', build_summary_cube, diabetes_data, True)
+    results[-1]['quantile_errors'] = quantile_errors(approximate_cube, cube)
+    basis = run_stage(results, n_rows, 'cube_basis_approx', cube_basis, diabetes_data, True)
+    run_stage(results, n_rows, 'cohort_cube_approx', cohort_cube, basis, index)
+    results[-1]['quantile_errors'] = quantile_errors(cohort_cube(basis, index), exact_cohort)
+    del basis, index, exact_cohort
+    run_stage(results, n_rows, 'stratified_sample', stratified_sample, diabetes_data, 'DiabetesStatus', SAMPLE_POINTS)
+    # the same patients as 4 clinic sites: one cube per site, merged
+    for approximate, stage in [(False, 'merge_site_cubes'), (True, 'merge_site_cubes_approx')]:
+        site_cubes = [build_summary_cube(part.reset_index(drop=True), approximate)
+                      for part in (diabetes_data.iloc[i::4] for i in range(4))]
+        run_stage(results, n_rows, stage, merge_cubes, site_cubes)
+    del site_cubes
+    adherence_chart, heatmap, _ = run_stage(results, n_rows, 'adherence_chart_from_cube',
+                                            improved_medication_adherence_chart, cube)
+    agg_metrics = run_stage(results, n_rows, 'multi_outcome_from_cube', multi_outcome_stats, cube)
+    run_stage(results, n_rows, 'polyfit_trends', polyfit_trends, agg_metrics)
+    run_stage(results, n_rows, 'cube_correlation', cube_correlation, cube, 'HealthLiteracy', 'MedicationAdherence', 1)
+
+    charts = {
+        'multi_outcome': multi_outcome_chart(agg_metrics),
+        'adherence': adherence_chart,
+        'adherence_heatmap': heatmap,
+        'hba1c_distribution': hba1c_distribution_chart(cube),
+    }
+    for name, chart in charts.items():
+        size = run_stage(results, n_rows, f'spec_{name}', spec_bytes, chart)
+        results[-1]['spec_bytes'] = size
+
+
+# run in a fresh interpreter each, so nothing is imported or cached yet
+_IMPORT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import streamlit, data_loader, charts, predictor, instrumentation, warm_up
+print(time.perf_counter() - start)
+'''
+_FIRST_RENDER_SCRIPT = '''
+import sys, time
+from streamlit.testing.v1 import AppTest
+if sys.argv[1] == 'warm':
+    import warm_up
+    warm_up.start_warm_up().join()
+start = time.perf_counter()
+AppTest.from_file(sys.argv[2], default_timeout=600).run()
+print(time.perf_counter() - start)
+'''
+
+
+def _run_fresh(script, *args):
+    output = subprocess.run([sys.executable, '-c', script, *args], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def startup_times():
+    # import time of the dashboard modules, and the first page render of a fresh server process
+    # without and with the background warm-up (serve.py) having finished, on the real data
+    dashboard = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'diabetes_dashboard.py')
+    times = {
+        'import_seconds': _run_fresh(_IMPORT_SCRIPT),
+        'first_render_cold_seconds': _run_fresh(_FIRST_RENDER_SCRIPT, 'cold', dashboard),
+        'first_render_warm_seconds': _run_fresh(_FIRST_RENDER_SCRIPT, 'warm', dashboard),
+    }
+    for name, seconds in times.items():
+        print(f"startup {name:<28} {seconds * 1000:10.1f} ms", file=sys.stderr)
+    return times
+
+
+def check_spec_sizes(results):
+    # spec bytes per chart and cohort size, charts built from aggregates should not grow with the data
+    sizes = {}
+    for r in results:
+        if 'spec_bytes' in r:
+            sizes.setdefault(r['stage'][len('spec_'):], {})[r['rows']] = r['spec_bytes']
+    growing = []
+    for chart, by_rows in sizes.items():
+        line = '  '.join(f"{rows:,}: {size / 1024:.1f} KB" for rows, size in sorted(by_rows.items()))
+        smallest, largest = by_rows[min(by_rows)], by_rows[max(by_rows)]
+        grows = largest > SPEC_GROWTH_LIMIT * smallest
+        if grows:
+            growing.append(chart)
+        print(f"spec {chart:<22} {line}{'  GROWS WITH THE DATA' if grows else ''}", file=sys.stderr)
+    return {'spec_bytes': sizes, 'growing_specs': growing}
+
+
+def check_quantile_errors(results):
+    # approximate quartiles further from the exact ones than quantile_error() documents
+    over = []
+    for r in results:
+        for name, e in r.get('quantile_errors', {}).items():
+            print(f"quantiles {r['stage']:<20} {r['rows']:>10,} {name:<28} error {e['error']:.5f}"
+                  f" (bound {e['bound']:.5f})", file=sys.stderr)
+            if not e['within_bound']:
+                over.append({'rows': r['rows'], 'stage': r['stage'], 'summary': name})
+    return {'quantile_errors_over_bound': over}
+
+
+def check_engine_parity(results):
+    # engines whose results differ from the pandas engine's, and each engine's speedup over pandas
+    differing = []
+    seconds = {(r['rows'], r['stage']): r['seconds'] for r in results}
+    for r in results:
+        # the BRFSS counts read back from the sidecar are the csv's
+        if r.get('same_counts') is False:
+            print(f"sidecar {r['stage']:<21} {r['rows']:>10,} counts DIFFER from the csv scan", file=sys.stderr)
+            differing.append({'rows': r['rows'], 'stage': r['stage'], 'engine': 'sidecar'})
+        parity = r.get('engine_parity')
+        if parity is None:
+            continue
+        stage, engine = r['stage'].rsplit('_', 1)
+        speedup = seconds[r['rows'], f'{stage}_{DEFAULT_ENGINE}'] / max(r['seconds'], 1e-9)
+        r['speedup'] = speedup
+        if engine != DEFAULT_ENGINE:
+            print(f"engine {stage:<22} {r['rows']:>10,} {engine:<8} {speedup:5.2f}x  max relative difference "
+                  f"{parity['max_relative_difference']:.1e}{'' if parity['same'] else '  DIFFERS'}", file=sys.stderr)
+        if not parity['same']:
+            differing.append({'rows': r['rows'], 'stage': stage, 'engine': engine})
+    return {'engine_differences': differing}
+
+
+def check_group_tests(results):
+    # group_tests.py statistics that are not scipy's
+    differing = []
+    for r in results:
+        if r['stage'] == 'group_tests':
+            difference = r['max_relative_difference']
+            print(f"group tests {r['rows']:>10,} max relative difference from scipy {difference:.1e}", file=sys.stderr)
+            if not difference <= ENGINE_TOLERANCE:
+                differing.append({'rows': r['rows'], 'max_relative_difference': difference})
+    return {'group_test_differences': differing}
+
+
+def compare_with_baseline(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['rows'], r['stage']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        before = baseline.get((r['rows'], r['stage']))
+        if before is None or before['seconds'] <= 0:
+            continue
+        ratio = r['seconds'] / before['seconds']
+        if ratio > REGRESSION_RATIO:
+            regressions.append({'rows': r['rows'], 'stage': r['stage'], 'ratio': ratio})
+            print(f"REGRESSION {r['stage']} at {r['rows']:,} rows: {ratio:.2f}x slower", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard computations on synthetic cohorts.")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="comma separated cohort sizes (default: 10000,100000,1000000)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier results json to compare against")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-load', action='store_true', help="skip the csv/sidecar load stages (no disk writes)")
+    parser.add_argument('--startup', action='store_true', help="also time imports and the first page render")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    marginals = load_marginals()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in sizes:
+            benchmark_size(n_rows, marginals, results, workdir, seed=args.seed, include_load=not args.skip_load)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'versions': {'pandas': pd.__version__, 'numpy': np.__version__, 'altair': alt.__version__},
+        'results': results,
+    }
+    report.update(check_spec_sizes(results))
+    report.update(check_quantile_errors(results))
+    report.update(check_engine_parity(results))
+    report.update(check_group_tests(results))
+    if args.startup:
+        report['startup'] = startup_times()
+    if args.baseline:
+        report['regressions'] = compare_with_baseline(results, args.baseline)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}", file=sys.stderr)
+    failed = (report.get('regressions') or report['growing_specs'] or report['quantile_errors_over_bound']
+              or report['engine_differences'] or report['group_test_differences'])
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# bootstrap confidence intervals for grouped means
+# an alternative to the normal approximation (1.96 * std / sqrt(count)) for small groups.
+# resampling is done with index matrices (resamples x group size) so a whole batch of
+# resampled means is one numpy gather + mean, batches are sized to a memory budget and
+# big cohorts are spread over worker processes
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aggregation import grouped_metric_stats
+
+# resampled values held in memory at once per task (resamples x rows x metrics)
+MAX_BATCH_CELLS = 4_000_000
+# below this many resampled values in total everything runs in this process
+PARALLEL_THRESHOLD = 50_000_000
+
+
+def resample_means(values, n_resamples, seed, max_cells=MAX_BATCH_CELLS):
+    # values: (rows, metrics) of one group -> (n_resamples, metrics) means of resampled rows
+    rng = np.random.default_rng(seed)
+    n_rows, n_metrics = values.shape
+    batch_size = max(1, max_cells // max(1, n_rows * n_metrics))
+    means = np.empty((n_resamples, n_metrics))
+    for start in range(0, n_resamples, batch_size):
+        stop = min(start + batch_size, n_resamples)
+        index = rng.integers(0, n_rows, size=(stop - start, n_rows))
+        means[start:stop] = values[index].mean(axis=1)
+    return means
+
+
+def _resample_task(args):
+    return resample_means(*args)
+
+
+def bootstrap_metric_stats(frame, by, metrics, n_resamples=1000, confidence=0.95, seed=0, workers=None):
+    # same columns as aggregation.grouped_metric_stats, lower/upper/ci are bootstrap percentiles
+    by = [by] if isinstance(by, str) else list(by)
+    stats = grouped_metric_stats(frame, by, metrics)
+    columns = list(dict.fromkeys(m['column'] for m in metrics))
+    values = frame[columns].to_numpy(dtype=np.float64)
+    group_index = frame.groupby(by, observed=True).indices
+
+    # one task per group, large groups are split into several resample ranges
+    workers = workers or os.cpu_count() or 1
+    parallel = workers > 1 and len(frame) * n_resamples > PARALLEL_THRESHOLD
+    tasks, owners = [], []
+    for key, rows in group_index.items():
+        parts = min(workers, n_resamples) if parallel else 1
+        for part_size in np.diff(np.linspace(0, n_resamples, parts + 1).astype(int)):
+            tasks.append((values[rows], int(part_size)))
+            owners.append(key)
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    task_args = [(group_values, size, task_seed) for (group_values, size), task_seed in zip(tasks, seeds)]
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_resample_task, task_args))
+    else:
+        results = [_resample_task(args) for args in task_args]
+
+    resampled = {}
+    for key, means in zip(owners, results):
+        resampled.setdefault(key, []).append(means)
+
+    alpha = (1 - confidence) / 2
+    bounds = []
+    for key, parts in resampled.items():
+        means = np.concatenate(parts)
+        low, high = np.quantile(means, [alpha, 1 - alpha], axis=0)
+        key = key if isinstance(key, tuple) else (key,)
+        for m in metrics:
+            j = columns.index(m['column'])
+            ends = sorted([m['offset'] + m['scale'] * low[j], m['offset'] + m['scale'] * high[j]])
+            bounds.append(dict(zip(by, key), MetricLabel=m['label'], lower=ends[0], upper=ends[1]))
+    bounds = pd.DataFrame(bounds)
+
+    stats = stats.drop(columns=['lower', 'upper', 'ci'])
+    # the group keys can be categoricals on one side and plain values on the other
+    for column in by:
+        bounds[column] = bounds[column].astype(stats[column].dtype)
+    stats = stats.merge(bounds, on=by + ['MetricLabel'], how='left')
+    stats['ci'] = (stats['upper'] - stats['lower']) / 2
+    return stats
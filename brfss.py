@@ -0,0 +1,96 @@
+# streaming aggregation of the BRFSS health indicators files
+# only Diabetes_012 and Education are read, chunk by chunk, and folded into a small
+# education x diabetes status count matrix, so memory does not depend on the file size
+# or on how many survey years are combined (count matrices just add up). the first scan of
+# a file also streams those two columns into a feather sidecar (sidecar.py), later scans
+# memory-map its record batches instead of parsing the csv again
+
+import glob
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from engine import get_engine
+from sidecar import sidecar_is_fresh, sidecar_path, stream_sidecar
+
+BRFSS_COLUMNS = ['Diabetes_012', 'Education']
+# both are float codes in the files
+BRFSS_SCHEMA = pa.schema([(c, pa.float64()) for c in BRFSS_COLUMNS])
+BRFSS_FILE_PATTERN = 'diabetes_012_health_indicators_BRFSS*.csv'
+
+# (0 = no diabetes, 1 = prediabetes, 2 = diabetes)
+status_labels = ['No Diabetes', 'Prediabetes', 'Diabetes']
+education_labels = ['Less than High School', 'High School Graduate', 'Some College', 'College Graduate']
+# BRFSS education code (1-6) -> index into education_labels, codes above 6 count as college graduate
+_education_lookup = np.array([0, 0, 0, 0, 1, 2, 3], dtype=np.int64)
+
+
+def brfss_paths(pattern=BRFSS_FILE_PATTERN):
+    return sorted(glob.glob(pattern))
+
+
+def _as_arrow(chunk):
+    if isinstance(chunk, pa.Table):
+        return chunk
+    return pa.Table.from_pandas(chunk[BRFSS_COLUMNS], preserve_index=False)
+
+
+def _iter_chunks(path, chunksize, engine, sidecar=True):
+    # the memory-mapped sidecar is already split in record batches, otherwise read the csv in
+    # chunks (and write the sidecar on the way, unless sidecar=False)
+    if sidecar and sidecar_is_fresh(path, BRFSS_COLUMNS):
+        with pa.memory_map(sidecar_path(path)) as source:
+            reader = ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield engine['from_arrow'](reader.get_batch(i).select(BRFSS_COLUMNS))
+    elif sidecar:
+        yield from stream_sidecar(path, engine['iter_csv'](path, BRFSS_COLUMNS, chunksize), BRFSS_SCHEMA, _as_arrow)
+    else:
+        yield from engine['iter_csv'](path, BRFSS_COLUMNS, chunksize)
+
+
+def count_chunk(chunk, engine):
+    # rows per (Education, Diabetes_012) from the engine, folded into the count matrix
+    # (rows with a missing value are not counted)
+    counts = engine['group_counts'](chunk, BRFSS_COLUMNS)
+    education = _education_lookup[np.clip(counts['Education'].to_numpy(dtype=np.int64), 0, 6)]
+    status = counts['Diabetes_012'].to_numpy(dtype=np.int64)
+    cells = education * len(status_labels) + status
+    return np.bincount(cells, weights=counts['count'].to_numpy(), minlength=len(education_labels) * len(status_labels)
+                       ).astype(np.int64).reshape(len(education_labels), len(status_labels))
+
+
+def aggregate_brfss_file(path, chunksize=100_000, engine=None, sidecar=True):
+    engine = get_engine(engine)
+    counts = np.zeros((len(education_labels), len(status_labels)), dtype=np.int64)
+    for chunk in _iter_chunks(path, chunksize, engine, sidecar):
+        counts += count_chunk(chunk, engine)
+    return counts
+
+
+def education_counts_frame(counts):
+    # same columns the old groupby produced: EducationSimple, DiabetesStatus, count, total, percentage
+    education_counts = pd.DataFrame({
+        'EducationSimple': np.repeat(education_labels, len(status_labels)),
+        'DiabetesStatus': np.tile(status_labels, len(education_labels)),
+        'count': counts.ravel(),
+        'total': np.repeat(counts.sum(axis=1), len(status_labels)),
+    })
+    education_counts = education_counts[education_counts['count'] > 0].reset_index(drop=True)
+    education_counts['percentage'] = education_counts['count'] / education_counts['total'] * 100
+    return education_counts
+
+
+def prevalence_frame(counts):
+    # prediabetes and diabetes both count as "has diabetes" here
+    totals = counts.sum(axis=1)
+    observed = totals > 0
+    has_diabetes = counts[:, 1:].sum(axis=1)[observed] / totals[observed]
+    prevalence_by_education = pd.DataFrame({
+        'EducationSimple': np.array(education_labels)[observed],
+        'HasDiabetes': has_diabetes,
+        'Prevalence': has_diabetes * 100,
+    })
+    return prevalence_by_education.sort_values('Prevalence', ascending=False)
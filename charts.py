@@ -0,0 +1,395 @@
+# altair chart builders for the dashboard sections
+# kept apart from diabetes_dashboard.py so the charts can be built without streamlit
+# (benchmarks, exports); every builder takes the already aggregated data
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from aggregation import metric
+from correlation import CORRELATION_METHODS, correlation_pairs
+from data_loader import load_bootstrap_stats
+from summary_cube import cube_correlation, cube_histogram, cube_metric_stats, cube_quantiles, literacy_bin_labels
+
+# normalized values for different metrics to plot on same scale (glycemic control is 1 - (HbA1c - 4) / 6)
+outcome_metrics = [
+    metric('HbA1c', 'Glycemic Control', scale=-1 / 6, offset=1 + 4 / 6),
+    metric('QualityOfLifeScore', 'Quality of Life', scale=1 / 100),
+    metric('MedicationAdherence', 'Medication Adherence', scale=1 / 10)
+]
+
+
+def medication_adherence_stats(cube, bootstrap=False):
+    # mean/CI/median adherence per literacy bin x education, diabetic patients only (diagnosis=1)
+    if bootstrap:
+        adherence_stats = load_bootstrap_stats(
+            ['HealthLiteracyBin', 'EducationLevelStr'], [metric('MedicationAdherence')], diagnosis=1,
+            cohort=cube.get('cohort'), paths=cube.get('paths')
+        )
+    else:
+        adherence_stats = cube_metric_stats(
+            cube, ['HealthLiteracyBin', 'EducationLevelStr'], [metric('MedicationAdherence')], diagnosis=1
+        )
+    adherence_stats = adherence_stats.drop(columns='MetricLabel')
+    adherence_medians = cube_quantiles(cube, 'adherence_by_bin_education')
+    return adherence_stats.merge(
+        adherence_medians[['HealthLiteracyBin', 'EducationLevelStr', 'median']],
+        on=['HealthLiteracyBin', 'EducationLevelStr']
+    )
+
+
+def adherence_trend(cube):
+    # overall mean adherence per literacy bin, diabetic patients only
+    trend_data = cube_metric_stats(cube, ['HealthLiteracyBin'], [metric('MedicationAdherence')], diagnosis=1)
+    return trend_data.rename(columns={'mean': 'MedicationAdherence'})[['HealthLiteracyBin', 'MedicationAdherence']]
+
+
+def improved_medication_adherence_chart(cube, bootstrap=False):
+    # everything comes from the summary cube, diabetic patients only (diagnosis=1)
+    bin_labels = literacy_bin_labels
+    
+    # calculate stats by bin
+    adherence_stats = medication_adherence_stats(cube, bootstrap)
+    
+    # only groups with a lot of data, error bars(95% confidence interval) are lower/upper
+    adherence_stats = adherence_stats[adherence_stats['count'] >= 5]
+    
+    # bar chart for mean adherancy by group 
+    bars = alt.Chart(adherence_stats).mark_bar().encode(
+        x=alt.X('HealthLiteracyBin:N', 
+             title='Health Literacy Level',
+             sort=bin_labels),
+        y=alt.Y('mean:Q', 
+             title='Average Medication Adherence Score',
+             scale=alt.Scale(domain=[0, 10])),
+        color=alt.Color('EducationLevelStr:N',
+                      scale=alt.Scale(scheme='category10'),
+                      legend=alt.Legend(title="Education Level", orient="top")),
+        tooltip=['HealthLiteracyBin:N', 'EducationLevelStr:N', 
+                alt.Tooltip('mean:Q', title='Average Adherence', format='.2f'),
+                alt.Tooltip('median:Q', title='Median Adherence', format='.2f'),
+                alt.Tooltip('count:Q', title='Number of Patients')]
+    ).properties(
+        height=400
+    )
+    error_bars = alt.Chart(adherence_stats).mark_errorbar().encode(
+        x='HealthLiteracyBin:N',
+        y='lower:Q',
+        y2='upper:Q',
+        color='EducationLevelStr:N'
+    )
+    
+    # overall trend 
+    trend_data = adherence_trend(cube)
+    trend_line = alt.Chart(trend_data).mark_line(
+        color='black',
+        size=3
+    ).encode(
+        x=alt.X('HealthLiteracyBin:N', sort=bin_labels),
+        y='MedicationAdherence:Q'
+    )
+    
+    trend_points = alt.Chart(trend_data).mark_circle(
+        color='black',
+        size=80
+    ).encode(
+        x=alt.X('HealthLiteracyBin:N', sort=bin_labels),
+        y='MedicationAdherence:Q',
+        tooltip=[alt.Tooltip('MedicationAdherence:Q', title='Overall Average', format='.2f')]
+    )
+    
+    trend_text = trend_points.mark_text(
+        align='center',
+        baseline='bottom',
+        dy=-10,
+        fontSize=12,
+        fontWeight='bold'
+    ).encode(
+        text=alt.Text('MedicationAdherence:Q', format='.1f')
+    )
+    
+    # overall correlation
+    adherence_corr = cube_correlation(cube, 'HealthLiteracy', 'MedicationAdherence', diagnosis=1)
+    correlation_text = f"Correlation: r = {round(adherence_corr, 2)}"
+    annotation = alt.Chart(pd.DataFrame({'x': ['8-10'], 'y': [1], 'text': [correlation_text]})).mark_text(
+        align='right',
+        fontSize=14,
+        fontWeight='bold'
+    ).encode(
+        x='x:N',
+        y='y:Q',
+        text='text:N'
+    )
+    chart = (bars + error_bars + trend_line + trend_points + trend_text + annotation).interactive()
+    
+    # heatmap to show distribution 
+    heatmap_data = cube_histogram(cube, 'HealthLiteracyBin', 'AdherenceBin', diagnosis=1)[['HealthLiteracyBin', 'AdherenceBin', 'count']]
+    heatmap = alt.Chart(heatmap_data).mark_rect().encode(
+        x=alt.X('HealthLiteracyBin:N', 
+               title='Health Literacy Level',
+               sort=bin_labels),
+        y=alt.Y('AdherenceBin:N', 
+               title='Medication Adherence Level',
+               sort=['8-10', '6-8', '4-6', '2-4', '0-2']),
+        color=alt.Color('count:Q', 
+                       scale=alt.Scale(scheme='blues'),
+                       legend=alt.Legend(title="Number of Patients")),
+        tooltip=['HealthLiteracyBin:N', 'AdherenceBin:N', 'count:Q']
+    ).properties(
+        height=300
+    )
+    #text labels 
+    text = heatmap.mark_text(
+        align='center',
+        baseline='middle',
+        color='white',
+        fontSize=12
+    ).encode(
+        text='count:Q'
+    )
+    
+    heatmap_with_text = (heatmap + text).properties(
+        height=300
+    )
+    
+    return chart, heatmap_with_text, round(adherence_corr, 2)
+
+
+def multi_outcome_stats(cube, bootstrap=False):
+    #avg metrics + confidence intervals by (rounded) health literacy score, diabetic patients only
+    # (the bootstrap resamples the patients/sites/cohort the cube was built from)
+    if bootstrap:
+        agg_metrics = load_bootstrap_stats(['LiteracyScore'], outcome_metrics, diagnosis=1,
+                                           cohort=cube.get('cohort'), paths=cube.get('paths'))
+    else:
+        agg_metrics = cube_metric_stats(cube, ['LiteracyScore'], outcome_metrics, diagnosis=1)
+    return agg_metrics.rename(columns={'LiteracyScore': 'HealthLiteracyGroup'})
+
+
+def multi_outcome_chart(agg_metrics):
+    line_base = alt.Chart(agg_metrics).encode(
+        x=alt.X('HealthLiteracyGroup:Q', 
+              title='Health Literacy Score',
+              scale=alt.Scale(domain=[0, 10]),
+              axis=alt.Axis(values=list(range(0, 11)))),
+        y=alt.Y('mean:Q', 
+              title='Normalized Score (higher is better)',
+              scale=alt.Scale(domain=[0, 1])),
+        color=alt.Color('MetricLabel:N', 
+                      scale=alt.Scale(domain=['Glycemic Control', 'Quality of Life', 'Medication Adherence'],
+                                     range=['#e41a1c', '#4682b4', '#2a9d8f']),
+                      legend=alt.Legend(title="Health Outcome"))
+    )
+    lines = line_base.mark_line(size=3).encode(
+        tooltip=[
+            'MetricLabel:N', 
+            alt.Tooltip('mean:Q', title='Average Score', format='.2f'),
+            alt.Tooltip('count:Q', title='Number of Patients')
+        ]
+    )
+    points = line_base.mark_circle(size=80).encode(
+        tooltip=[
+            'MetricLabel:N', 
+            alt.Tooltip('mean:Q', title='Average Score', format='.2f'),
+            alt.Tooltip('count:Q', title='Number of Patients')
+        ]
+    )
+    error_bands = alt.Chart(agg_metrics).mark_area(opacity=0.2).encode(
+        x='HealthLiteracyGroup:Q',
+        y='lower:Q',
+        y2='upper:Q',
+        color='MetricLabel:N'
+    )
+    text_data = agg_metrics[agg_metrics['HealthLiteracyGroup'] == 10].copy()
+    annotations = alt.Chart(text_data).mark_text(
+        align='left',
+        baseline='middle',
+        dx=10,
+        fontSize=12,
+        fontWeight='bold'
+    ).encode(
+        x='HealthLiteracyGroup:Q',
+        y='mean:Q',
+        text=alt.Text('mean:Q', format='.2f'),
+        color='MetricLabel:N'
+    )
+
+    # regresison lines for trend 
+    reg_lines = []
+    for metric_label in ['Glycemic Control', 'Quality of Life', 'Medication Adherence']:
+        metric_data = agg_metrics[agg_metrics['MetricLabel'] == metric_label].copy()
+        # a small cohort can leave fewer than two literacy scores to fit a line through
+        if metric_data['HealthLiteracyGroup'].nunique() < 2:
+            continue
+        slope, intercept = np.polyfit(metric_data['HealthLiteracyGroup'], metric_data['mean'], 1)
+        reg_data = pd.DataFrame({
+            'HealthLiteracyGroup': [0, 10],
+            'trend': [intercept, slope * 10 + intercept],
+            'MetricLabel': [metric_label, metric_label]
+        })
+    
+        reg_line = alt.Chart(reg_data).mark_line(
+            strokeDash=[5, 5],
+            opacity=0.7,
+            size=2
+        ).encode(
+            x='HealthLiteracyGroup:Q',
+            y='trend:Q',
+            color='MetricLabel:N'
+        )
+    
+        reg_lines.append(reg_line)
+
+    multi_chart = error_bands + lines + points + annotations
+    for reg_line in reg_lines:
+        multi_chart += reg_line
+    multi_chart = multi_chart.properties(height=500)
+    return multi_chart
+
+
+def hba1c_distribution_chart(cube):
+    # viusalization 3: HBA1C distribution by health literacy group 
+    # the box is drawn from the quartiles in the summary cube (min/q1/median/q3/max per group)
+    # instead of mark_boxplot over every patient row, so the spec size does not grow with the data
+    hba1c_quantiles = cube_quantiles(cube, 'hba1c_by_group')
+    group_order = ['Low (0-3)', 'Medium (4-6)', 'High (7-10)']
+    base = alt.Chart(hba1c_quantiles).encode(
+        x=alt.X('HealthLiteracyGroup:N', 
+             title='Health Literacy Level',
+             sort=group_order),
+        color=alt.Color('HealthLiteracyGroup:N', 
+                     scale=alt.Scale(domain=group_order,
+                                    range=['#e63946', '#f1c453', '#2a9d8f']),
+                     legend=None),
+        tooltip=['HealthLiteracyGroup:N',
+                 alt.Tooltip('max:Q', title='Max', format='.2f'),
+                 alt.Tooltip('q3:Q', title='Q3', format='.2f'),
+                 alt.Tooltip('median:Q', title='Median', format='.2f'),
+                 alt.Tooltip('q1:Q', title='Q1', format='.2f'),
+                 alt.Tooltip('min:Q', title='Min', format='.2f')]
+    )
+    # same marks mark_boxplot(extent='min-max') draws: whiskers, box, median tick
+    whiskers = base.mark_rule().encode(
+        y=alt.Y('min:Q', 
+             title='HbA1c Level (%)',
+             scale=alt.Scale(domain=[4, 12])),
+        y2='max:Q'
+    )
+    box = base.mark_bar(size=14).encode(y='q1:Q', y2='q3:Q')
+    median = base.mark_tick(color='white', size=14).encode(y='median:Q')
+    hba1c_dist = (whiskers + box + median).properties(
+        height=400
+    )
+
+    hba1c_threshold = alt.Chart(pd.DataFrame({'y': [6.5]})).mark_rule(
+        color='red', 
+        strokeDash=[4, 4],
+        size=2
+    ).encode(y='y:Q')
+    threshold_label = alt.Chart(pd.DataFrame({'x': ['Medium (4-6)'], 'y': [6.7], 'text': ['Diabetes Threshold (6.5%)']})).mark_text(
+        align='center',
+        baseline='bottom',
+        color='red',
+        fontSize=12
+    ).encode(
+        x='x:N',
+        y='y:Q',
+        text='text:N'
+    )
+    return hba1c_dist + hba1c_threshold + threshold_label
+
+
+def correlation_heatmap(correlations, method='pearson', columns=None):
+    # one cell per pair of columns, the spec grows with the columns picked, not with the patients
+    columns = columns or correlations['columns']
+    pairs = correlation_pairs(correlations, method, columns)
+    hover = alt.selection_point(on='pointerover', fields=['x', 'y'], empty=False)
+    return alt.Chart(pairs).mark_rect().encode(
+        x=alt.X('x:N', sort=columns, title=None, axis=alt.Axis(labelAngle=-60)),
+        y=alt.Y('y:N', sort=columns, title=None),
+        color=alt.Color('r:Q',
+                        scale=alt.Scale(scheme='redblue', domain=[-1, 1]),
+                        title=f"{CORRELATION_METHODS[method]} r"),
+        stroke=alt.condition(hover, alt.value('white'), alt.value(None)),
+        tooltip=[
+            alt.Tooltip('x:N', title='Column'),
+            alt.Tooltip('y:N', title='Row'),
+            alt.Tooltip('r:Q', title='r', format='.3f'),
+            alt.Tooltip('p:Q', title='p-value', format='.2e')
+        ]
+    ).add_params(hover).properties(
+        height=max(300, 16 * len(columns))
+    )
+
+
+def correlation_scatter(points, x, y):
+    # points: a (sampled) patient frame, see data_loader.load_point_sample()
+    return alt.Chart(points).mark_circle(size=20, opacity=0.5).encode(
+        x=alt.X(f'{x}:Q', scale=alt.Scale(zero=False)),
+        y=alt.Y(f'{y}:Q', scale=alt.Scale(zero=False)),
+        color=alt.Color('DiabetesStatus:N',
+                        scale=alt.Scale(domain=['No Diabetes', 'Diabetes'], range=['#457b9d', '#e63946']),
+                        legend=alt.Legend(title="Diabetes Status", orient="top")),
+        tooltip=[alt.Tooltip(f'{x}:Q', format='.2f'), alt.Tooltip(f'{y}:Q', format='.2f'), 'DiabetesStatus:N']
+    ).properties(
+        height=350
+    ).interactive()
+
+
+def cube_views(cube, bootstrap=False):
+    # the cube charts the dashboard tabs memoize (data_loader.load_view), also built by warm_up.py
+    return {
+        'multi_outcome': lambda: multi_outcome_chart(multi_outcome_stats(cube, bootstrap=bootstrap)),
+        'medication_adherence': lambda: improved_medication_adherence_chart(cube, bootstrap=bootstrap),
+        'hba1c_distribution': lambda: hba1c_distribution_chart(cube),
+    }
+
+
+def education_status_chart(education_counts):
+    chart = alt.Chart(education_counts).mark_bar().encode(
+        x=alt.X('EducationSimple:N', 
+                title='Education Level',
+                sort=['Less than High School', 'High School Graduate', 'Some College', 'College Graduate']),
+        y=alt.Y('percentage:Q', 
+                title='Percentage (%)',
+                axis=alt.Axis(format='~s')),
+        color=alt.Color('DiabetesStatus:N',
+                       scale=alt.Scale(domain=['No Diabetes', 'Prediabetes', 'Diabetes'],
+                                     range=['#457b9d', '#f1c453', '#e63946'])),
+        tooltip=[
+            alt.Tooltip('EducationSimple:N', title='Education Level'),
+            alt.Tooltip('DiabetesStatus:N', title='Diabetes Status'),
+            alt.Tooltip('count:Q', title='Count'),
+            alt.Tooltip('percentage:Q', title='Percentage', format='.1f')
+        ]
+    ).properties(
+        height=400,
+        title="Diabetes Status Distribution by Education Level"
+    )
+    return chart
+
+
+def prevalence_chart(prevalence_by_education):
+    prevalence_chart = alt.Chart(prevalence_by_education).mark_bar().encode(
+        x=alt.X('Prevalence:Q', title='Diabetes Prevalence (%)'),
+        y=alt.Y('EducationSimple:N', 
+                title='Education Level',
+                sort='-x'),
+        color=alt.value('#e63946'),
+        tooltip=[
+            alt.Tooltip('EducationSimple:N', title='Education Level'),
+            alt.Tooltip('Prevalence:Q', title='Diabetes Prevalence', format='.1f')
+        ]
+    ).properties(
+        height=200,
+        title="Diabetes Prevalence by Education Level"
+    )
+
+    prevalence_text = prevalence_chart.mark_text(
+        align='left',
+        baseline='middle',
+        dx=3
+    ).encode(
+        text=alt.Text('Prevalence:Q', format='.1f')
+    )
+    return prevalence_chart + prevalence_text
@@ -0,0 +1,269 @@
+# consistency checks of the data prep that run in a few seconds, without the benchmark
+# every check gets the patient table of --data and returns a list of problems (empty = passed)
+#   zero literacy   patients with HealthLiteracy 0 have no literacy group (the group cut is
+#                   right-closed from 0): the cube, its cohort cubes and the quartiles have to
+#                   leave them out of the literacy groups like a pandas groupby does
+#   group tests     the same patients are left out of every grouping of group_tests.py, F and H
+#                   of the rest match scipy's f_oneway / kruskal, the reported permutation sample
+#                   is the one drawn and cohorts of 0 or 1 patient give NaN without warnings
+#   engines         every dataframe engine (engine.py) parses the csv and computes the cube cell
+#                   counts/moments like the pandas engine, and those moments are the ones in the
+#                   summary cube the charts use (the cube does not go through the engines)
+#   brfss sidecar   the BRFSS counts of the csv, of the first scan (which writes the two-column
+#                   sidecar) and of the sidecar are the same for every engine, and the partial
+#                   sidecar is not taken for the whole csv
+#   append refresh  a file that only grew is extended with the new rows, a file edited before
+#                   the old end and then grown is reloaded: either way the cached table and
+#                   dataset_version() are the file's
+#
+#   python checks.py
+
+import argparse
+import os
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from aggregation import metric
+from group_tests import CELL_COLUMNS, TEST_GROUPINGS, TEST_OUTCOMES, group_difference_tests
+from brfss import BRFSS_COLUMNS, aggregate_brfss_file
+import data_loader
+from data_loader import PATIENT_DATA_PATH, content_hash, derive_patient_columns, load_patient_data
+from engine import DEFAULT_ENGINE, ENGINE_TOLERANCE, ENGINES, engine_parity, get_engine, max_relative_difference
+from sampling import stratified_sample
+from schema import apply_schema, validate_frame
+from sidecar import sidecar_is_fresh, sidecar_path
+from summary_cube import (CUBE_DIMENSIONS, build_summary_cube, cube_basis, cube_cell_moments, cube_from_basis,
+                          cube_keys, cube_metric_stats, quantile_table)
+
+TOLERANCE = 1e-9
+# patients set to HealthLiteracy 0
+ZERO_LITERACY_ROWS = 5
+# asked for a permutation sample smaller than the per-cell minimums add up to
+SMALL_PERMUTATION_SAMPLE = 50
+# rows of the synthetic BRFSS file
+BRFSS_ROWS = 10_000
+# patients appended to a copy of the data
+APPENDED_ROWS = 79
+
+
+def patient_table(raw):
+    return apply_schema(derive_patient_columns(validate_frame(raw.copy())))
+
+
+def _compare(name, result, reference, columns, problems):
+    if len(result) != len(reference):
+        problems.append(f"{name}: {len(result)} groups, expected {len(reference)}")
+        return
+    for column in columns:
+        difference = np.max(np.abs(result[column].to_numpy(dtype=np.float64)
+                                   - reference[column].to_numpy(dtype=np.float64)), initial=0)
+        if not difference <= TOLERANCE:
+            problems.append(f"{name}: {column} differs by {difference:.3g}")
+
+
+def check_zero_literacy(raw):
+    raw = raw.copy()
+    raw.loc[raw.index[:ZERO_LITERACY_ROWS], 'HealthLiteracy'] = 0
+    diabetes_data = patient_table(raw)
+    # the cube moments are float64, the patient table float32
+    exact = diabetes_data.astype({'HbA1c': np.float64})
+    problems = []
+    by = ['HealthLiteracyGroup']
+    expected_means = exact.groupby(by, observed=True)['HbA1c'].agg(['mean', 'count']).reset_index()
+    expected_quartiles = quantile_table(exact, by, 'HbA1c')
+    half = np.arange(len(diabetes_data)) % 2 == 0
+    cubes = {
+        'cube': build_summary_cube(diabetes_data),
+        'approximate cube': build_summary_cube(diabetes_data, approximate=True),
+        'cohort cube': cube_from_basis(cube_basis(diabetes_data), half),
+    }
+    for name, cube in cubes.items():
+        rows = exact[half] if name == 'cohort cube' else exact
+        if cube['n_rows'] != len(rows):
+            problems.append(f"{name}: {cube['n_rows']} patients, expected {len(rows)}")
+        means = expected_means if name != 'cohort cube' else \
+            rows.groupby(by, observed=True)['HbA1c'].agg(['mean', 'count']).reset_index()
+        _compare(f"{name} HbA1c by literacy group", cube_metric_stats(cube, by, [metric('HbA1c')]), means,
+                 ['mean', 'count'], problems)
+        if name == 'cube':
+            _compare(f"{name} HbA1c quartiles", cube['quantiles']['hba1c_by_group'], expected_quartiles,
+                     ['min', 'q1', 'median', 'q3', 'max'], problems)
+    return problems
+
+
+def check_group_tests(raw):
+    from scipy import stats
+    raw = raw.copy()
+    raw.loc[raw.index[:ZERO_LITERACY_ROWS], 'HealthLiteracy'] = 0
+    diabetes_data = patient_table(raw)
+    tests = group_difference_tests(diabetes_data, n_permutations=20)
+    grouped = diabetes_data.dropna(subset=CELL_COLUMNS)
+    problems = []
+    if tests['n_rows'] != len(grouped) or tests['n_excluded'] != ZERO_LITERACY_ROWS:
+        problems.append(f"{tests['n_rows']} patients tested and {tests['n_excluded']} left out, expected "
+                        f"{len(grouped)} and {ZERO_LITERACY_ROWS}")
+    for row in tests['tests'].to_dict('records'):
+        outcome = next(o for o, label in TEST_OUTCOMES.items() if label == row['Outcome'])
+        samples = [part[outcome].to_numpy(dtype=np.float64)
+                   for _, part in grouped.groupby(TEST_GROUPINGS[row['Grouping']], observed=True)]
+        for statistic, expected in [('F', stats.f_oneway(*samples).statistic), ('H', stats.kruskal(*samples).statistic)]:
+            if not abs(row[statistic] - expected) <= TOLERANCE * abs(expected):
+                problems.append(f"{row['Grouping']} {row['Outcome']}: {statistic} {row[statistic]:.10g}, "
+                                f"scipy {expected:.10g}")
+        if not 0 < row['permutation_p'] <= 1:
+            problems.append(f"{row['Grouping']} {row['Outcome']}: permutation p {row['permutation_p']}")
+    # a sample below the per-cell minimums gets more rows than asked for
+    for asked in [SMALL_PERMUTATION_SAMPLE, len(grouped)]:
+        cell_codes = grouped.groupby(CELL_COLUMNS, observed=True).ngroup().to_numpy()
+        drawn = stratified_sample(grouped.assign(_cell=cell_codes), '_cell', asked)
+        reported = group_difference_tests(diabetes_data, n_permutations=1, permutation_rows=asked)['permutation_rows']
+        if reported != len(drawn):
+            problems.append(f"permutation sample of {asked} rows reported as {reported}, {len(drawn)} drawn")
+    for size in [0, 1]:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            try:
+                tests = group_difference_tests(grouped.head(size), n_permutations=5)['tests']
+            except Warning as w:
+                problems.append(f"{size} patient cohort: {type(w).__name__}: {w}")
+                continue
+        if tests[['F', 'H', 'permutation_p']].notna().any(axis=None):
+            problems.append(f"{size} patient cohort: statistics that are not NaN")
+    return problems
+
+
+def check_engines(raw):
+    raw = raw.copy()
+    raw.loc[raw.index[:ZERO_LITERACY_ROWS], 'HealthLiteracy'] = 0
+    diabetes_data = patient_table(raw)
+    problems = []
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = os.path.join(workdir, 'patients.csv')
+        raw.to_csv(csv_path, index=False)
+        stages = {
+            'csv parse': lambda engine: get_engine(engine)['read_csv'](csv_path),
+            'cell counts': lambda engine: get_engine(engine)['group_counts'](cube_keys(diabetes_data), CUBE_DIMENSIONS),
+            'cell moments': lambda engine: cube_cell_moments(diabetes_data, engine),
+        }
+        for stage, function in stages.items():
+            for engine, parity in engine_parity({engine: function(engine) for engine in ENGINES}).items():
+                if not parity['same']:
+                    problems.append(f"{stage}: {engine} differs from {DEFAULT_ENGINE} by "
+                                    f"{parity['max_relative_difference']:.3g}")
+    # the cube keeps patients with a missing key in cells of their own, the engines drop them
+    cells = build_summary_cube(diabetes_data)['cells'].dropna(subset=CUBE_DIMENSIONS).reset_index(drop=True)
+    for engine in ENGINES:
+        moments = cube_cell_moments(diabetes_data, engine)
+        difference = max_relative_difference(cells[moments.columns], moments)
+        if not difference <= ENGINE_TOLERANCE:
+            problems.append(f"summary cube cells differ from the {engine} engine's by {difference:.3g}")
+    return problems
+
+
+def check_brfss_sidecar(raw):
+    # survey rows are not in the patient data, a few with a missing status are not counted
+    rng = np.random.default_rng(0)
+    survey = pd.DataFrame({'Diabetes_012': rng.choice([0.0, 1.0, 2.0], size=BRFSS_ROWS),
+                           'Education': rng.integers(1, 7, size=BRFSS_ROWS).astype(np.float64),
+                           'Income': rng.integers(1, 9, size=BRFSS_ROWS)})
+    survey.loc[survey.index[:ZERO_LITERACY_ROWS], 'Diabetes_012'] = np.nan
+    problems = []
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'brfss.csv')
+        survey.to_csv(path, index=False)
+        for engine in ENGINES:
+            if os.path.exists(sidecar_path(path)):
+                os.remove(sidecar_path(path))
+            expected = aggregate_brfss_file(path, chunksize=BRFSS_ROWS // 7, engine=engine, sidecar=False)
+            for scan in ['first scan', 'sidecar']:
+                counts = aggregate_brfss_file(path, chunksize=BRFSS_ROWS // 7, engine=engine)
+                if not sidecar_is_fresh(path, BRFSS_COLUMNS):
+                    problems.append(f"{engine} {scan}: no sidecar after the scan")
+                if not (counts == expected).all() or counts.sum() != BRFSS_ROWS - ZERO_LITERACY_ROWS:
+                    problems.append(f"{engine} {scan}: {counts.sum()} rows counted, expected "
+                                    f"{BRFSS_ROWS - ZERO_LITERACY_ROWS} in the csv's cells")
+        if sidecar_is_fresh(path):
+            problems.append("the two-column sidecar is taken for the whole csv")
+    return problems
+
+
+def _touch(path, step):
+    # a new mtime even on filesystems with coarse timestamps
+    info = os.stat(path)
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + step * 1_000_000_000))
+
+
+def _edit_middle_row(path, column):
+    # changes the first digit of column in the middle row, the file keeps its size
+    with open(path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    index = lines[0].decode().split(',').index(column)
+    middle = len(lines) // 2
+    fields = lines[middle].split(b',')
+    fields[index] = (b'7' if fields[index][:1] == b'6' else b'6') + fields[index][1:]
+    lines[middle] = b','.join(fields)
+    with open(path, 'wb') as f:
+        f.write(b'\n'.join(lines))
+
+
+def _append_rows(path, rows):
+    with open(path, 'a', newline='') as f:
+        rows.to_csv(f, header=False, index=False)
+
+
+def check_append_refresh(raw):
+    problems = []
+    added = raw.tail(APPENDED_ROWS).assign(PatientID=raw['PatientID'].max() + 1 + np.arange(APPENDED_ROWS))
+    with tempfile.TemporaryDirectory() as workdir:
+        for case in ['append', 'edit and append']:
+            path = os.path.join(workdir, f"{case.replace(' ', '_')}.csv")
+            raw.to_csv(path, index=False)
+            load_patient_data(path)
+            if case == 'edit and append':
+                _edit_middle_row(path, 'HbA1c')
+            _append_rows(path, added)
+            _touch(path, 1)
+            cached = load_patient_data(path)
+            expected = patient_table(pd.read_csv(path))
+            difference = max_relative_difference(cached.reset_index(drop=True), expected)
+            if not difference <= TOLERANCE:
+                problems.append(f"{case}: cached patient table differs from the file by {difference:.3g}")
+            if data_loader.dataset_version(path) != content_hash(path):
+                problems.append(f"{case}: dataset_version() is not the file's content hash")
+    return problems
+
+
+CHECKS = {
+    'zero literacy': check_zero_literacy,
+    'group tests': check_group_tests,
+    'engines': check_engines,
+    'brfss sidecar': check_brfss_sidecar,
+    'append refresh': check_append_refresh,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the quick consistency checks of the data prep.")
+    parser.add_argument('--data', default=PATIENT_DATA_PATH, help=f"patient csv (default: {PATIENT_DATA_PATH})")
+    args = parser.parse_args(argv)
+
+    raw = pd.read_csv(args.data)
+    failed = 0
+    for name, check in CHECKS.items():
+        try:
+            problems = check(raw)
+        except Exception as e:
+            problems = [f"{type(e).__name__}: {e}"]
+        failed += bool(problems)
+        print(f"{'FAIL' if problems else 'ok'}  {name}", file=sys.stderr)
+        for problem in problems:
+            print(f"      {problem}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
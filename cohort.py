@@ -0,0 +1,84 @@
+# cohort filters for the dashboard (age band, gender, ethnicity, SES, comorbidities)
+# one packed bit array per filter value (np.packbits, 1 bit per patient, 125 KB per
+# million patients) is built once per dataset version. a selection ORs the bitmaps of
+# the values picked within a filter and ANDs (or ORs) the filters, then the summary cube
+# is rebuilt for the selected rows from the cube basis (see summary_cube.py)
+
+import numpy as np
+
+age_bins = [0, 30, 40, 50, 60, 70, 120]
+age_band_labels = ['Under 30', '30-39', '40-49', '50-59', '60-69', '70+']
+
+# filter name -> patient column and the label of every value (codes as in diabetes_data.csv)
+COHORT_FILTERS = {
+    'Age band': {'column': 'Age', 'bins': age_bins, 'labels': age_band_labels},
+    'Gender': {'column': 'Gender', 'labels': {0: 'Male', 1: 'Female'}},
+    'Ethnicity': {'column': 'Ethnicity', 'labels': {0: 'Caucasian', 1: 'African American', 2: 'Asian', 3: 'Other'}},
+    'Socioeconomic status': {'column': 'SocioeconomicStatus', 'labels': {0: 'Low', 1: 'Middle', 2: 'High'}},
+    'Hypertension': {'column': 'Hypertension', 'labels': {0: 'No', 1: 'Yes'}},
+    'Family history of diabetes': {'column': 'FamilyHistoryDiabetes', 'labels': {0: 'No', 1: 'Yes'}},
+}
+
+
+def filter_options(name):
+    labels = COHORT_FILTERS[name]['labels']
+    return list(labels.values()) if isinstance(labels, dict) else list(labels)
+
+
+def _value_masks(diabetes_data, spec):
+    values = diabetes_data[spec['column']]
+    if 'bins' in spec:
+        # band index per patient, right-open bands (30-39 is [30, 40))
+        band = np.digitize(values.to_numpy(), spec['bins'][1:-1])
+        return {label: band == i for i, label in enumerate(spec['labels'])}
+    codes = values.to_numpy()
+    return {label: codes == code for code, label in spec['labels'].items()}
+
+
+def build_cohort_index(diabetes_data):
+    bitmaps = {name: {label: np.packbits(mask) for label, mask in _value_masks(diabetes_data, spec).items()}
+               for name, spec in COHORT_FILTERS.items()}
+    return {'bitmaps': bitmaps, 'n_rows': len(diabetes_data)}
+
+
+def extend_cohort_index(index, delta_index):
+    # index of the patients of index followed by those of delta_index (appended rows)
+    n, m = index['n_rows'], delta_index['n_rows']
+    bitmaps = {
+        name: {label: np.packbits(np.concatenate([np.unpackbits(bits, count=n),
+                                                  np.unpackbits(delta_index['bitmaps'][name][label], count=m)]))
+               for label, bits in values.items()}
+        for name, values in index['bitmaps'].items()
+    }
+    return {'bitmaps': bitmaps, 'n_rows': n + m}
+
+
+def cohort_key(selection, match='all'):
+    # hashable form of a selection ({filter name: [labels]}), None when nothing is filtered
+    picked = tuple(sorted((name, tuple(sorted(labels, key=filter_options(name).index)))
+                          for name, labels in selection.items() if labels))
+    return (picked, match) if picked else None
+
+
+def select_rows(index, key):
+    # boolean mask over the patients for a cohort_key(), None means everyone
+    if key is None:
+        return None
+    picked, match = key
+    combine = np.bitwise_and if match == 'all' else np.bitwise_or
+    selected = None
+    for name, labels in picked:
+        bitmaps = index['bitmaps'][name]
+        within = bitmaps[labels[0]]
+        for label in labels[1:]:
+            within = within | bitmaps[label]
+        selected = within if selected is None else combine(selected, within)
+    return np.unpackbits(selected, count=index['n_rows']).astype(bool)
+
+
+def cohort_description(key):
+    if key is None:
+        return "All patients"
+    picked, match = key
+    joiner = " and " if match == 'all' else " or "
+    return joiner.join(f"{name}: {', '.join(labels)}" for name, labels in picked)
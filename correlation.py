@@ -0,0 +1,92 @@
+# pairwise correlations between all the numeric patient columns
+# pearson and spearman matrices with p-values for every pair at once: the centred columns
+# are multiplied as one (rows x columns) block in chunks of rows, spearman is the same on
+# the ranks. p-values are the two-sided t-test scipy's pearsonr/spearmanr report,
+# t = r * sqrt((n - 2) / (1 - r^2)) with n - 2 degrees of freedom, for the whole matrix.
+# a constant column (e.g. a flag nobody in the cohort has) gets NaN correlations
+
+import numpy as np
+import pandas as pd
+
+from schema import PATIENT_SCHEMA
+
+# every numeric column of diabetes_data.csv
+CORRELATION_COLUMNS = [column for column, spec in PATIENT_SCHEMA.items()
+                       if spec['dtype'] != 'category' and column != 'PatientID']
+CORRELATION_METHODS = {'pearson': 'Pearson', 'spearman': 'Spearman'}
+# rows turned into float64 at once, bounds the memory to chunk x columns x 8 bytes
+CHUNK_ROWS = 100_000
+
+
+def average_ranks(values):
+    # ranks starting at 1, ties get the mean of their ranks (same as scipy.stats.rankdata)
+    if values.dtype.kind in 'iu':
+        # codes and flags: counting the values is enough, no sort
+        codes = values.astype(np.intp) - int(values.min())
+        counts = np.bincount(codes)
+        return (np.cumsum(counts) - (counts - 1) / 2)[codes]
+    # one unstable argsort, rankdata's stable sort is several times slower
+    order = np.argsort(values)
+    ordered = values[order]
+    first = np.concatenate([[True], ordered[1:] != ordered[:-1]])
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(values))
+    ranks = np.empty(len(values))
+    ranks[order] = ((starts + ends + 1) / 2)[np.cumsum(first) - 1]
+    return ranks
+
+
+def _correlation_matrix(columns, chunk_rows=CHUNK_ROWS):
+    means = np.array([c.mean(dtype=np.float64) for c in columns])
+    products = np.zeros((len(columns), len(columns)))
+    for start in range(0, len(columns[0]), chunk_rows):
+        block = np.column_stack([c[start:start + chunk_rows] for c in columns]).astype(np.float64) - means
+        products += block.T @ block
+    scale = np.sqrt(np.diag(products))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.clip(products / np.outer(scale, scale), -1, 1)
+
+
+def correlation_p_values(r, n_rows):
+    df = n_rows - 2
+    if df < 1:
+        return np.full_like(r, np.nan)
+    # student t cdf from scipy.special, importing scipy.stats takes over a second
+    from scipy.special import stdtr
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt(df / ((1 - r) * (1 + r)))
+    return 2 * stdtr(df, -np.abs(t))
+
+
+def correlation_matrices(frame, columns=CORRELATION_COLUMNS):
+    values = [frame[column].to_numpy() for column in columns]
+    result = {'columns': list(columns), 'n_rows': len(frame)}
+    if len(frame) < 2:
+        empty = np.full((len(columns), len(columns)), np.nan)
+        return dict(result, pearson=empty, pearson_p=empty, spearman=empty, spearman_p=empty)
+    pearson = _correlation_matrix(values)
+    spearman = _correlation_matrix([average_ranks(v) for v in values])
+    return dict(result, pearson=pearson, pearson_p=correlation_p_values(pearson, len(frame)),
+                spearman=spearman, spearman_p=correlation_p_values(spearman, len(frame)))
+
+
+def correlation_pairs(correlations, method='pearson', columns=None):
+    # long form (x, y, r, p) of the matrix restricted to columns, every ordered pair
+    columns = columns or correlations['columns']
+    picked = [correlations['columns'].index(c) for c in columns]
+    r = correlations[method][np.ix_(picked, picked)]
+    p = correlations[f'{method}_p'][np.ix_(picked, picked)]
+    return pd.DataFrame({
+        'x': np.repeat(columns, len(columns)),
+        'y': np.tile(columns, len(columns)),
+        'r': r.ravel(),
+        'p': p.ravel(),
+    })
+
+
+def strongest_pairs(correlations, method='pearson', columns=None, top=10):
+    # each unordered pair once, by absolute correlation
+    pairs = correlation_pairs(correlations, method, columns)
+    order = {c: i for i, c in enumerate(columns or correlations['columns'])}
+    pairs = pairs[pairs['x'].map(order) < pairs['y'].map(order)].dropna(subset=['r'])
+    return pairs.loc[pairs['r'].abs().sort_values(ascending=False).index[:top]].reset_index(drop=True)
@@ -0,0 +1,450 @@
+# loading layer for the dashboard csv files
+# every file is parsed (and its derived columns added) once per version on disk,
+# parsing goes through the columnar sidecar in sidecar.py,
+# the result is kept in this module so all streamlit sessions/reruns share it.
+# the patient data can be one csv or one extract per clinic site (a directory or glob, see
+# patient_paths()): every site is loaded and reduced to its own summary cube in parallel,
+# the cubes are merged, so a new site only costs its own file.
+# when a file only grew by rows appended at the end (the nightly extract), only the new
+# bytes are parsed and the cached table, cube, basis and cohort index are extended with
+# them, so a refresh parses only the delta (the previous bytes are hashed once to make sure
+# they are unchanged, nothing else is read). any other change is a full reload
+
+import glob
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from bootstrap import bootstrap_metric_stats
+from brfss import aggregate_brfss_file, brfss_paths
+from cohort import build_cohort_index, extend_cohort_index, select_rows
+from correlation import CORRELATION_COLUMNS, correlation_matrices
+from group_tests import N_PERMUTATIONS, TEST_COLUMNS, group_difference_tests
+from outcome_model import load_or_fit_outcome_model
+from sampling import SAMPLE_POINTS, stratified_sample
+from schema import apply_schema, concat_frames, memory_footprint, validate_frame
+from sidecar import read_csv_columnar
+from summary_cube import build_summary_cube, cube_basis, cube_from_basis, cube_keys, extend_basis, merge_cubes
+
+logger = logging.getLogger(__name__)
+
+PATIENT_DATA_PATH = 'diabetes_data.csv'
+# a csv, a directory of csvs (one per site) or a glob, instead of PATIENT_DATA_PATH
+DATA_SOURCE_ENV = 'DIABETES_DATA'
+# sites loaded at the same time (pyarrow parsing and most numpy work release the GIL)
+SITE_LOAD_WORKERS = 4
+# values built from several files kept at once, least recently used dropped first. every
+# cohort/site/setting combination of the views, bootstrap CIs, correlations, group tests and
+# point samples is an entry of its own, a long running server would otherwise keep them all
+MERGED_CACHE_SIZE = 128
+
+# education level = string
+education_map = {
+    0: 'Less than High School',
+    1: 'High School Graduate',
+    2: 'Some College',
+    3: 'College Graduate'
+}
+
+_cache = {}
+# values built from several files (all sites), rebuilt when any of the files changes
+_merged_cache = OrderedDict()
+# only held to read/update the dicts, builds run under a lock of their own so
+# different files (sites) can be loaded at the same time
+_cache_lock = threading.RLock()
+_build_locks = {}
+_cache_stats = {'hits': 0, 'misses': 0}
+# per file version (fingerprint): the running content hash an append is checked against and
+# continued with, the newest two versions of every file are kept
+_file_states = {}
+# rows appended between two file versions, parsed once for every kind of entry
+_deltas = {}
+
+
+def file_fingerprint(path):
+    # cheap check that runs on every rerun, no file contents are read
+    info = os.stat(path)
+    return (os.path.abspath(path), info.st_mtime_ns, info.st_size)
+
+
+def _hash_file(path, size, block_size=1 << 20):
+    # sha1 object of the first size bytes, it can be copied and continued with appended bytes
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while size > 0:
+            block = f.read(min(block_size, size))
+            if not block:
+                break
+            digest.update(block)
+            size -= len(block)
+    return digest
+
+
+def content_hash(path):
+    return _hash_file(path, os.path.getsize(path)).hexdigest()
+
+
+def _record_file_state(fingerprint, digest):
+    state = {'digest': digest, 'version': digest.hexdigest()}
+    with _cache_lock:
+        _file_states[fingerprint] = state
+        for old in [fp for fp in _file_states if fp[0] == fingerprint[0]][:-2]:
+            del _file_states[old]
+    return state
+
+
+def _file_version(path, fingerprint):
+    with _cache_lock:
+        state = _file_states.get(fingerprint)
+    if state is None:
+        state = _record_file_state(fingerprint, _hash_file(path, fingerprint[2]))
+    return state['version']
+
+
+def _appended_rows(path, old_fingerprint, fingerprint):
+    # the patient rows appended since old_fingerprint, None when the file changed otherwise
+    key = (old_fingerprint, fingerprint)
+    with _cache_lock:
+        if key in _deltas:
+            return _deltas[key]
+        old = _file_states.get(old_fingerprint)
+    old_size, size = old_fingerprint[2], fingerprint[2]
+    if old is None or size <= old_size:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(old_size - 1)
+        if f.read(1) != b'\n':
+            return None
+        f.seek(0)
+        header = f.readline()
+        f.seek(old_size)
+        added = f.read(size - old_size)
+    if not added.endswith(b'\n'):
+        # a row is still being written, read everything once the writer is done
+        return None
+    # every byte of the previous version has to be unchanged, an edit anywhere before the new
+    # rows (then an append) is a full reload. hashing reads the old bytes but parses nothing
+    digest = _hash_file(path, old_size)
+    if digest.hexdigest() != old['version']:
+        return None
+    rows = apply_schema(derive_patient_columns(validate_frame(pd.read_csv(io.BytesIO(header + added)))))
+    digest.update(added)
+    _record_file_state(fingerprint, digest)
+    with _cache_lock:
+        _deltas.clear()
+        _deltas[key] = rows
+    return rows
+
+
+def _cached_load(kind, path, build, extend=None):
+    # extend(previous value, appended rows) -> value, for the kinds that can be updated in place
+    fingerprint = file_fingerprint(path)
+    key = (kind,) + fingerprint
+    with _cache_lock:
+        if key in _cache:
+            _cache_stats['hits'] += 1
+            return _cache[key]
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    # a second caller for the same entry waits here and then finds it in the cache
+    with build_lock:
+        with _cache_lock:
+            if key in _cache:
+                _cache_stats['hits'] += 1
+                return _cache[key]
+            _cache_stats['misses'] += 1
+            previous = next((e for k, e in _cache.items() if k[:2] == key[:2]), None)
+        rows = None
+        if extend is not None and previous is not None:
+            rows = _appended_rows(path, previous['fingerprint'], fingerprint)
+        if rows is not None:
+            logger.info("appending %d rows to %s from %s", len(rows), kind, path)
+            value = extend(previous['value'], rows)
+        else:
+            logger.info("loading %s from %s", kind, path)
+            value = build(path)
+        entry = {'value': value, 'version': _file_version(path, fingerprint), 'fingerprint': fingerprint}
+        with _cache_lock:
+            # older versions of the same file are never used again
+            for old_key in [k for k in _cache if k[:2] == key[:2]]:
+                del _cache[old_key]
+            _cache[key] = entry
+            _build_locks.pop(key, None)
+        return entry
+
+
+def _cached_load_many(kind, paths, build, extend=None):
+    # _cached_load for several files, the ones not in the cache yet are built in a thread pool
+    with _cache_lock:
+        missing = [p for p in paths if (kind,) + file_fingerprint(p) not in _cache]
+    if len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=min(SITE_LOAD_WORKERS, len(missing))) as pool:
+            list(pool.map(lambda p: _cached_load(kind, p, build, extend), missing))
+    return [_cached_load(kind, p, build, extend) for p in paths]
+
+
+def _merged_entry(key, fingerprints):
+    # called with _cache_lock held
+    entry = _merged_cache.get(key)
+    if entry is None or entry['fingerprints'] != fingerprints:
+        return None
+    _merged_cache.move_to_end(key)
+    _cache_stats['hits'] += 1
+    return entry
+
+
+def _store_merged(key, value, fingerprints):
+    # called with _cache_lock held. entries built from an older version of any of these files
+    # are never used again, whatever their key
+    current = {f[0]: f for f in fingerprints}
+    for old_key in [k for k, e in _merged_cache.items()
+                    if any(f[0] in current and f != current[f[0]] for f in e['fingerprints'])]:
+        del _merged_cache[old_key]
+    _merged_cache[key] = {'value': value, 'fingerprints': fingerprints}
+    _merged_cache.move_to_end(key)
+    while len(_merged_cache) > MERGED_CACHE_SIZE:
+        _merged_cache.popitem(last=False)
+
+
+def _cached_merge(kind, paths, build):
+    # a value built from several files: cached per set of files, rebuilt when any of them changes
+    fingerprints = tuple(file_fingerprint(p) for p in paths)
+    key = (kind, tuple(f[0] for f in fingerprints))
+    with _cache_lock:
+        entry = _merged_entry(key, fingerprints)
+        if entry is not None:
+            return entry['value']
+        lock_key = ('merged', key, fingerprints)
+        build_lock = _build_locks.setdefault(lock_key, threading.Lock())
+    # a second caller for the same entry waits here and then finds it in the cache
+    with build_lock:
+        with _cache_lock:
+            entry = _merged_entry(key, fingerprints)
+            if entry is not None:
+                return entry['value']
+            _cache_stats['misses'] += 1
+        try:
+            value = build(paths)
+            with _cache_lock:
+                _store_merged(key, value, fingerprints)
+        finally:
+            with _cache_lock:
+                _build_locks.pop(lock_key, None)
+        return value
+
+
+def patient_paths(source=None):
+    # source: a csv, a directory (every csv in it is one site) or a glob pattern,
+    # default DIABETES_DATA from the environment or diabetes_data.csv
+    source = source or os.environ.get(DATA_SOURCE_ENV) or PATIENT_DATA_PATH
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '*.csv')))
+    if glob.has_magic(source):
+        return sorted(glob.glob(source))
+    return [source]
+
+
+def site_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def derive_patient_columns(diabetes_data):
+    diabetes_data['EducationLevelStr'] = diabetes_data['EducationLevel'].map(education_map)
+    diabetes_data['Diagnosis'] = (diabetes_data['HbA1c'] >= 6.5).astype(int)
+    # health literacy group s
+    diabetes_data['HealthLiteracyGroup'] = pd.cut(
+        diabetes_data['HealthLiteracy'],
+        bins=[0, 3, 6, 10],
+        labels=['Low (0-3)', 'Medium (4-6)', 'High (7-10)']
+    )
+    diabetes_data['DiabetesStatus'] = diabetes_data['Diagnosis'].map({
+        0: 'No Diabetes',
+        1: 'Diabetes'
+    })
+    return diabetes_data
+
+
+def _build_patient_data(path):
+    # validate the raw values, derive on full precision, then downcast (see schema.py)
+    diabetes_data = derive_patient_columns(validate_frame(read_csv_columnar(path)))
+    compact = apply_schema(diabetes_data)
+    logger.info("patient table: %d rows, %.1f KB -> %.1f KB after schema",
+                len(compact), memory_footprint(diabetes_data) / 1024, memory_footprint(compact) / 1024)
+    return compact
+
+
+def _extend_patient_data(diabetes_data, rows):
+    return concat_frames([diabetes_data, rows])
+
+
+def load_patient_data(path=PATIENT_DATA_PATH):
+    # the returned frame is shared by every session, callers must not modify it
+    return _cached_load('patients', path, _build_patient_data, _extend_patient_data)['value']
+
+
+def load_brfss_counts(paths=None):
+    # education x diabetes status counts (see brfss.py), one cached matrix per file,
+    # several survey years are summed. the BRFSS files are optional, None means there are none
+    paths = brfss_paths() if paths is None else paths
+    if not paths:
+        return None
+    return sum(_cached_load('brfss', path, aggregate_brfss_file)['value'] for path in paths)
+
+
+def _approximate_kind(kind, approximate):
+    # exact and approximate (histogram quantiles, see summary_cube.py) entries are cached side by side
+    return f'{kind}_approx' if approximate else kind
+
+
+def load_cube_basis(path=PATIENT_DATA_PATH, approximate=False):
+    return _cached_load(_approximate_kind('cube_basis', approximate), path,
+                        lambda p: cube_basis(load_patient_data(p), approximate),
+                        lambda basis, rows: extend_basis(basis, cube_basis(rows, approximate)))['value']
+
+
+def load_cohort_index(path=PATIENT_DATA_PATH):
+    # per filter value bitmaps (see cohort.py)
+    return _cached_load('cohort_index', path, lambda p: build_cohort_index(load_patient_data(p)),
+                        lambda index, rows: extend_cohort_index(index, build_cohort_index(rows)))['value']
+
+
+def _site_cubes(paths, cohort, approximate):
+    if cohort is None:
+        # appended rows: the moments merge exactly, the quartile inputs are merged as sorted
+        # arrays (or added histograms)
+        return [e['value'] for e in _cached_load_many(
+            _approximate_kind('cube', approximate), paths,
+            lambda p: cube_from_basis(load_cube_basis(p, approximate)),
+            lambda cube, rows: merge_cubes([cube, build_summary_cube(rows, approximate)]))]
+    # the bases/indexes are cached per site, the cohort cube is rebuilt from them on every call
+    return [cube_from_basis(load_cube_basis(p, approximate), select_rows(load_cohort_index(p), cohort))
+            for p in paths]
+
+
+def load_summary_cube(source=None, cohort=None, site=None, approximate=False):
+    # built once per dataset version from the cached patient table (see summary_cube.py),
+    # the cube of a cohort (cohort.cohort_key()) is rebuilt from the basis on every call.
+    # several sites are merged, site=<site_name()> is the cube of that site only.
+    # approximate: quartiles from fixed-bin histograms, within quantile_error() of the exact ones
+    paths = patient_paths(source)
+    if site is not None:
+        paths = [p for p in paths if site_name(p) == site]
+    if not paths:
+        raise FileNotFoundError(f"no patient data for {site or source}")
+    if cohort is None and len(paths) > 1:
+        cube = _cached_merge(_approximate_kind('cube', approximate), paths,
+                             lambda ps: merge_cubes(_site_cubes(ps, None, approximate)))
+    else:
+        cube = merge_cubes(_site_cubes(paths, cohort, approximate))
+    # where the cube comes from, for the views that go back to the patient rows (bootstrap)
+    return dict(cube, paths=tuple(paths), cohort=cohort)
+
+
+def load_outcome_model(source=None):
+    # fitted once per dataset version, outcome_model.joblib keeps it across restarts.
+    # with several sites it is fitted on all of them, the version combines the site versions
+    paths = patient_paths(source)
+    if len(paths) == 1:
+        return _cached_load('model', paths[0],
+                            lambda p: load_or_fit_outcome_model(load_patient_data(p), dataset_version(p)))['value']
+
+    def build(ps):
+        version = hashlib.sha1('|'.join(dataset_version(p) for p in ps).encode()).hexdigest()
+        sites = concat_frames(e['value'] for e in _cached_load_many('patients', ps, _build_patient_data,
+                                                                     _extend_patient_data))
+        return load_or_fit_outcome_model(sites, version)
+
+    return _cached_merge('model', paths, build)
+
+
+def load_bootstrap_stats(by, metrics, diagnosis=None, n_resamples=1000, cohort=None, paths=None):
+    # bootstrap CIs (see bootstrap.py) per dataset version, view and cohort, so the toggle costs one
+    # computation per version. by can use the summary cube keys (LiteracyScore, HealthLiteracyBin, ...).
+    # resampling needs the patient rows, several sites are pooled
+    paths = list(paths or patient_paths())
+    kind = ('bootstrap', tuple(by), tuple(tuple(sorted(m.items())) for m in metrics), diagnosis, n_resamples,
+            cohort)
+
+    def site_frame(p):
+        diabetes_data = load_patient_data(p)
+        frame = cube_keys(diabetes_data).assign(**{m['column']: diabetes_data[m['column']] for m in metrics})
+        mask = select_rows(load_cohort_index(p), cohort)
+        return frame if mask is None else frame[mask]
+
+    def build(ps):
+        frame = pd.concat([site_frame(p) for p in ps], ignore_index=True)
+        if diagnosis is not None:
+            frame = frame[frame['Diagnosis'] == diagnosis]
+        return bootstrap_metric_stats(frame, by, metrics, n_resamples=n_resamples)
+
+    return _cached_merge(kind, paths, build)
+
+
+def _cohort_rows(paths, cohort, columns):
+    # columns of the patients in cohort, several sites pooled
+    frames = []
+    for p in paths:
+        frame = load_patient_data(p)[columns]
+        mask = select_rows(load_cohort_index(p), cohort)
+        frames.append(frame if mask is None else frame[mask])
+    return concat_frames(frames)
+
+
+def load_correlations(cohort=None, paths=None, columns=CORRELATION_COLUMNS):
+    # pearson/spearman matrices with p-values (see correlation.py) per dataset version and cohort,
+    # several sites are pooled
+    paths = list(paths or patient_paths())
+    columns = list(columns)
+    return _cached_merge(('correlation', tuple(columns), cohort), paths,
+                         lambda ps: correlation_matrices(_cohort_rows(ps, cohort, columns), columns))
+
+
+def load_group_tests(cohort=None, paths=None, n_permutations=N_PERMUTATIONS):
+    # ANOVA, Kruskal-Wallis and permutation p-values of the outcome differences between
+    # literacy groups / education levels (see group_tests.py) per dataset version and cohort
+    paths = list(paths or patient_paths())
+    return _cached_merge(('group_tests', cohort, n_permutations), paths,
+                         lambda ps: group_difference_tests(_cohort_rows(ps, cohort, TEST_COLUMNS), n_permutations))
+
+
+def load_point_sample(cohort=None, paths=None, n_points=SAMPLE_POINTS, by='DiabetesStatus'):
+    # stratified sample of the patients for point marks (see sampling.py), every numeric
+    # column so any pair can be plotted from it, per dataset version, cohort and size
+    paths = list(paths or patient_paths())
+
+    def build(ps):
+        frame = _cohort_rows(ps, cohort, CORRELATION_COLUMNS + [by])
+        return {'points': stratified_sample(frame, by, n_points).reset_index(drop=True), 'n_rows': len(frame)}
+
+    return _cached_merge(('points', cohort, n_points, by), paths, build)
+
+
+def load_view(name, paths, key, build):
+    # what a dashboard section prepares (build(), e.g. its charts), kept per dataset version
+    # of paths and key (cohort, settings) until the files change
+    return _cached_merge(('view', name, key), list(paths), lambda ps: build())
+
+
+def dataset_version(path=PATIENT_DATA_PATH):
+    # content hash of the currently loaded version of the file
+    return _cached_load('patients', path, _build_patient_data, _extend_patient_data)['version']
+
+
+def cache_info():
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_cache) + len(_merged_cache))
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _merged_cache.clear()
+        _file_states.clear()
+        _deltas.clear()
+        _cache_stats['hits'] = 0
+        _cache_stats['misses'] = 0
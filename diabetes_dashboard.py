@@ -2,58 +2,32 @@
 # by the professor to make the dashboard
 
 import streamlit as st
-import pandas as pd
-import numpy as np
-import altair as alt
-from scipy import stats
+
+from brfss import education_counts_frame, prevalence_frame
+from charts import correlation_heatmap, correlation_scatter, cube_views, education_status_chart, prevalence_chart
+from cohort import COHORT_FILTERS, cohort_description, cohort_key, filter_options
+from correlation import CORRELATION_COLUMNS, CORRELATION_METHODS, strongest_pairs
+from data_loader import (load_brfss_counts, load_correlations, load_group_tests, load_outcome_model,
+                         load_point_sample, load_summary_cube, load_view, patient_paths, site_name)
+from instrumentation import QUERY_PARAM, new_profile, profile_table, section
+from page_content import (CONCLUSIONS, INSIGHTS, INTRO, INTRO_TITLE, PAGE_CSS, PAGE_TITLE, conclusions_markdown,
+                          insight_html, interpretation_html)
+from predictor import literacy_group, lookup_outcome
+from sampling import MAX_EXACT_POINTS, SAMPLE_POINTS
+from summary_cube import QUANTILE_BINS, cube_quantiles, quantile_error
+from warm_up import start_warm_up
 
 
 st.set_page_config(page_title="Health Literacy and Diabetes Outcomes",page_icon="🩺",layout="wide")
 
-st.markdown("""
-<style>
-.main {
-    background-color: #0E1117;
-    color: white;
-}
-h1, h2, h3 {
-    color: white;
-}
-.highlight-box {
-    background-color: #1E2130;
-    border-radius: 10px;
-    padding: 20px;
-    margin-bottom: 20px;
-    border: 1px solid #4B5563;
-}
-.insight-text {
-    background-color: #1E2130;
-    border-left: 4px solid #4682b4;
-    padding: 10px 15px;
-    margin-top: 10px;
-}
-hr {
-    margin-top: 30px;
-    margin-bottom: 30px;
-}
-.stMarkdown p {
-    margin-bottom: 0.5rem;
-}
-</style>
-""", unsafe_allow_html=True)
+st.markdown(f"<style>\n{PAGE_CSS}</style>", unsafe_allow_html=True)
 
 # this i sthe dashboard title 
-st.title("Health Literacy and Diabetes Care Outcomes")
-st.markdown("""
+st.title(PAGE_TITLE)
+st.markdown(f"""
 <div class="highlight-box">
-<h3>Understanding Health Literacy and Diabetes</h3>
-This dashboard explores the relationships between health literacy, education level, and diabetes outcomes
-based on the article "Addressing the Issues of Health Equity and Disability in Diabetes Care: Update 2025".
-
-Health literacy is a person's ability to obtain, process, and understand basic health information needed to make 
-appropriate health decisions. Research indicates that health literacy plays a crucial role in diabetes management, 
-affecting outcomes from glycemic control to quality of life.
-</div>
+<h3>{INTRO_TITLE}</h3>
+{INTRO}</div>
 """, unsafe_allow_html=True)
 
 
@@ -93,580 +67,301 @@ st.sidebar.markdown("""
 - Higher scores indicate better adherence to prescribed medications
 """)
 
-def improved_medication_adherence_chart(diabetes_data):
-    # filter for only diabetic patients
-    diabetic_data = diabetes_data[diabetes_data['Diagnosis'] == 1].copy()
-    # health literacy bins group groiuiping analysis
-    bins = [0, 2, 4, 6, 8, 10]
-    bin_labels = ['0-2', '2-4', '4-6', '6-8', '8-10']
-    diabetic_data['HealthLiteracyBin'] = pd.cut(
-        diabetic_data['HealthLiteracy'],
-        bins=bins,
-        labels=bin_labels,
-        include_lowest=True
-    )
-    
-    # calculate stats by bin
-    adherence_stats = diabetic_data.groupby(['HealthLiteracyBin', 'EducationLevelStr'])['MedicationAdherence'].agg(
-        ['mean', 'median', 'std', 'count']
-    ).reset_index()
-    
-    # only groups with a lot of data 
-    adherence_stats = adherence_stats[adherence_stats['count'] >= 5]
-    
-    # error bars(95% confidence interval)
-    adherence_stats['ci'] = 1.96 * adherence_stats['std'] / np.sqrt(adherence_stats['count'])
-    adherence_stats['lower'] = adherence_stats['mean'] - adherence_stats['ci']
-    adherence_stats['upper'] = adherence_stats['mean'] + adherence_stats['ci']
-    
-    # bar chart for mean adherancy by group 
-    bars = alt.Chart(adherence_stats).mark_bar().encode(
-        x=alt.X('HealthLiteracyBin:N', 
-             title='Health Literacy Level',
-             sort=bin_labels),
-        y=alt.Y('mean:Q', 
-             title='Average Medication Adherence Score',
-             scale=alt.Scale(domain=[0, 10])),
-        color=alt.Color('EducationLevelStr:N',
-                      scale=alt.Scale(scheme='category10'),
-                      legend=alt.Legend(title="Education Level", orient="top")),
-        tooltip=['HealthLiteracyBin:N', 'EducationLevelStr:N', 
-                alt.Tooltip('mean:Q', title='Average Adherence', format='.2f'),
-                alt.Tooltip('median:Q', title='Median Adherence', format='.2f'),
-                alt.Tooltip('count:Q', title='Number of Patients')]
-    ).properties(
-        height=400
-    )
-    error_bars = alt.Chart(adherence_stats).mark_errorbar().encode(
-        x='HealthLiteracyBin:N',
-        y='lower:Q',
-        y2='upper:Q',
-        color='EducationLevelStr:N'
-    )
-    
-    # overall trend 
-    trend_data = diabetic_data.groupby('HealthLiteracyBin')['MedicationAdherence'].mean().reset_index()
-    trend_line = alt.Chart(trend_data).mark_line(
-        color='black',
-        size=3
-    ).encode(
-        x=alt.X('HealthLiteracyBin:N', sort=bin_labels),
-        y='MedicationAdherence:Q'
-    )
-    
-    trend_points = alt.Chart(trend_data).mark_circle(
-        color='black',
-        size=80
-    ).encode(
-        x=alt.X('HealthLiteracyBin:N', sort=bin_labels),
-        y='MedicationAdherence:Q',
-        tooltip=[alt.Tooltip('MedicationAdherence:Q', title='Overall Average', format='.2f')]
-    )
-    
-    trend_text = trend_points.mark_text(
-        align='center',
-        baseline='bottom',
-        dy=-10,
-        fontSize=12,
-        fontWeight='bold'
-    ).encode(
-        text=alt.Text('MedicationAdherence:Q', format='.1f')
-    )
-    
-    # overall correlation
-    adherence_corr = stats.pearsonr(diabetic_data['HealthLiteracy'], diabetic_data['MedicationAdherence'])[0]
-    correlation_text = f"Correlation: r = {round(adherence_corr, 2)}"
-    annotation = alt.Chart(pd.DataFrame({'x': ['8-10'], 'y': [1], 'text': [correlation_text]})).mark_text(
-        align='right',
-        fontSize=14,
-        fontWeight='bold'
-    ).encode(
-        x='x:N',
-        y='y:Q',
-        text='text:N'
-    )
-    chart = (bars + error_bars + trend_line + trend_points + trend_text + annotation).interactive()
-    
-    # heatmap to show distribution 
-    diabetic_data['AdherenceBin'] = pd.cut(
-        diabetic_data['MedicationAdherence'],
-        bins=[0, 2, 4, 6, 8, 10],
-        labels=['0-2', '2-4', '4-6', '6-8', '8-10'],
-        include_lowest=True
-    )
-    heatmap_data = diabetic_data.groupby(['HealthLiteracyBin', 'AdherenceBin']).size().reset_index(name='count')
-    heatmap = alt.Chart(heatmap_data).mark_rect().encode(
-        x=alt.X('HealthLiteracyBin:N', 
-               title='Health Literacy Level',
-               sort=bin_labels),
-        y=alt.Y('AdherenceBin:N', 
-               title='Medication Adherence Level',
-               sort=['8-10', '6-8', '4-6', '2-4', '0-2']),
-        color=alt.Color('count:Q', 
-                       scale=alt.Scale(scheme='blues'),
-                       legend=alt.Legend(title="Number of Patients")),
-        tooltip=['HealthLiteracyBin:N', 'AdherenceBin:N', 'count:Q']
-    ).properties(
-        height=300
-    )
-    #text labels 
-    text = heatmap.mark_text(
-        align='center',
-        baseline='middle',
-        color='white',
-        fontSize=12
-    ).encode(
-        text='count:Q'
-    )
-    
-    heatmap_with_text = (heatmap + text).properties(
-        height=300
-    )
-    
-    return chart, heatmap_with_text, round(adherence_corr, 2)
-
-try:
-    #load diabetes_data.csv which has health literacy
-    diabetes_data = pd.read_csv('diabetes_data.csv')
-    # education level = string 
-    education_map = {
-        0: 'Less than High School',
-        1: 'High School Graduate',
-        2: 'Some College',
-        3: 'College Graduate'
-    }
-    
-    diabetes_data['EducationLevelStr'] = diabetes_data['EducationLevel'].map(education_map)
-    diabetes_data['Diagnosis'] = (diabetes_data['HbA1c'] >= 6.5).astype(int)
-    # health literacy group s
-    diabetes_data['HealthLiteracyGroup'] = pd.cut(
-        diabetes_data['HealthLiteracy'],
-        bins=[0, 3, 6, 10],
-        labels=['Low (0-3)', 'Medium (4-6)', 'High (7-10)']
-    )
-    diabetes_data['DiabetesStatus'] = diabetes_data['Diagnosis'].map({
-        0: 'No Diabetes',
-        1: 'Diabetes'
-    })
-    
-    try:
-        health_indicators = pd.read_csv('diabetes_012_health_indicators_BRFSS2015.csv')
-        health_indicators_loaded = True
-    except:
-        health_indicators_loaded = False
-    
-    data_loaded = True
-    # filter for diabetic patients
-    diabetic_data = diabetes_data[diabetes_data['Diagnosis'] == 1]
-    
-except Exception as e:
-    st.sidebar.error(f"Error loading data: {e}")
-    st.error("Could not load the diabetes dataset. Please make sure 'diabetes_data.csv' is in the current directory.")
-    st.stop() 
-
-# visualization 1
-st.header("Impact of Health Literacy Across Multiple Outcomes")
-# normalized values for different metrics to plot on same scale 
-metrics_df = diabetic_data.copy()
-metrics_df['HbA1c_norm'] = 1 - ((metrics_df['HbA1c'] - 4) / 6)
-metrics_df['QoL_norm'] = metrics_df['QualityOfLifeScore'] / 100
-metrics_df['Med_norm'] = metrics_df['MedicationAdherence'] / 10
-metrics_long = pd.melt(
-    metrics_df,
-    id_vars=['HealthLiteracy', 'HealthLiteracyGroup'],
-    value_vars=['HbA1c_norm', 'QoL_norm', 'Med_norm'],
-    var_name='Metric',
-    value_name='NormalizedValue'
-)
-metrics_long['MetricLabel'] = metrics_long['Metric'].map({
-    'HbA1c_norm': 'Glycemic Control',
-    'QoL_norm': 'Quality of Life',
-    'Med_norm': 'Medication Adherence'
-})
-
-#group by health literacy
-grouped_metrics = metrics_long.copy()
-grouped_metrics['HealthLiteracyGroup'] = np.round(grouped_metrics['HealthLiteracy']).astype(int)
-#avg metrics by health literacy group
-agg_metrics = grouped_metrics.groupby(['HealthLiteracyGroup', 'MetricLabel'])['NormalizedValue'].agg(
-    ['mean', 'std', 'count']
-).reset_index()
-#confidence intervals 
-agg_metrics['ci'] = 1.96 * agg_metrics['std'] / np.sqrt(agg_metrics['count'])
-agg_metrics['upper'] = agg_metrics['mean'] + agg_metrics['ci']
-agg_metrics['lower'] = agg_metrics['mean'] - agg_metrics['ci']
-line_base = alt.Chart(agg_metrics).encode(
-    x=alt.X('HealthLiteracyGroup:Q', 
-          title='Health Literacy Score',
-          scale=alt.Scale(domain=[0, 10]),
-          axis=alt.Axis(values=list(range(0, 11)))),
-    y=alt.Y('mean:Q', 
-          title='Normalized Score (higher is better)',
-          scale=alt.Scale(domain=[0, 1])),
-    color=alt.Color('MetricLabel:N', 
-                  scale=alt.Scale(domain=['Glycemic Control', 'Quality of Life', 'Medication Adherence'],
-                                 range=['#e41a1c', '#4682b4', '#2a9d8f']),
-                  legend=alt.Legend(title="Health Outcome"))
-)
-lines = line_base.mark_line(size=3).encode(
-    tooltip=[
-        'MetricLabel:N', 
-        alt.Tooltip('mean:Q', title='Average Score', format='.2f'),
-        alt.Tooltip('count:Q', title='Number of Patients')
-    ]
-)
-points = line_base.mark_circle(size=80).encode(
-    tooltip=[
-        'MetricLabel:N', 
-        alt.Tooltip('mean:Q', title='Average Score', format='.2f'),
-        alt.Tooltip('count:Q', title='Number of Patients')
-    ]
-)
-error_bands = alt.Chart(agg_metrics).mark_area(opacity=0.2).encode(
-    x='HealthLiteracyGroup:Q',
-    y='lower:Q',
-    y2='upper:Q',
-    color='MetricLabel:N'
+st.sidebar.markdown("---")
+st.sidebar.header("Settings")
+bootstrap_ci = st.sidebar.checkbox(
+    "Bootstrap confidence intervals",
+    value=False,
+    help="Use 1,000 bootstrap resamples instead of the normal approximation for the error bands (better for small groups)"
 )
-text_data = agg_metrics[agg_metrics['HealthLiteracyGroup'] == 10].copy()
-annotations = alt.Chart(text_data).mark_text(
-    align='left',
-    baseline='middle',
-    dx=10,
-    fontSize=12,
-    fontWeight='bold'
-).encode(
-    x='HealthLiteracyGroup:Q',
-    y='mean:Q',
-    text=alt.Text('mean:Q', format='.2f'),
-    color='MetricLabel:N'
+# histogram quartiles and fewer scatter points for multi-million row cohorts (see summary_cube.py, sampling.py)
+approximate = st.sidebar.checkbox(
+    "Approximate distributions",
+    value=False,
+    help=f"Quartiles from {QUANTILE_BINS:,}-bin histograms (within {quantile_error('hba1c_by_group'):.4f} HbA1c "
+         f"and {quantile_error('adherence_by_bin_education'):.4f} adherence points of the exact values) and "
+         f"scatter plots of a {SAMPLE_POINTS:,} patient stratified sample instead of up to {MAX_EXACT_POINTS:,}"
 )
 
-# regresison lines for trend 
-reg_lines = []
-for metric in ['Glycemic Control', 'Quality of Life', 'Medication Adherence']:
-    metric_data = agg_metrics[agg_metrics['MetricLabel'] == metric].copy()
-    slope, intercept = np.polyfit(metric_data['HealthLiteracyGroup'], metric_data['mean'], 1)
-    reg_data = pd.DataFrame({
-        'HealthLiteracyGroup': [0, 10],
-        'trend': [intercept, slope * 10 + intercept],
-        'MetricLabel': [metric, metric]
-    })
-    
-    reg_line = alt.Chart(reg_data).mark_line(
-        strokeDash=[5, 5],
-        opacity=0.7,
-        size=2
-    ).encode(
-        x='HealthLiteracyGroup:Q',
-        y='trend:Q',
-        color='MetricLabel:N'
-    )
-    
-    reg_lines.append(reg_line)
-
-multi_chart = (error_bands + lines + points + annotations + reg_lines[0] + reg_lines[1] + reg_lines[2]).properties(height=500)
-st.altair_chart(multi_chart, use_container_width=True)
-st.markdown("""
-<div class="insight-text">
-<strong>Key Insight:</strong>  The most striking pattern is at health literacy level 10, where we see significant improvements across all measures: Medication Adherence reaches its peak (0.59), followed by Quality of Life (0.54), and Glycemic Control (0.35). Throughout most literacy levels (0-9), the outcomes remain relatively stable with minor fluctuations, but the sharp upward trend at the highest literacy level suggests a potential threshold effect - patients with excellent health literacy (9-10) appear to experience substantially better outcomes than those with moderate literacy (5-8).
-This pattern is particularly pronounced for medication adherence, which shows the steepest improvement at high literacy levels, while glycemic control consistently remains the most challenging outcome to impact through health literacy alone.
-</div>
-""", unsafe_allow_html=True)
-st.markdown("<hr>", unsafe_allow_html=True)
-
-# viusalization 3: HBA1C distribution by health literacy group 
-st.header("HbA1c Distribution by Health Literacy")
-hba1c_dist = alt.Chart(diabetes_data).mark_boxplot(extent='min-max').encode(
-    x=alt.X('HealthLiteracyGroup:N', 
-         title='Health Literacy Level',
-         sort=['Low (0-3)', 'Medium (4-6)', 'High (7-10)']),
-    y=alt.Y('HbA1c:Q', 
-         title='HbA1c Level (%)',
-         scale=alt.Scale(domain=[4, 12])),
-    color=alt.Color('HealthLiteracyGroup:N', 
-                 scale=alt.Scale(domain=['Low (0-3)', 'Medium (4-6)', 'High (7-10)'],
-                                range=['#e63946', '#f1c453', '#2a9d8f']),
-                 legend=None)
-).properties(
-    height=400
+st.sidebar.markdown("---")
+st.sidebar.header("Cohort Filters")
+# one extract per clinic site when DIABETES_DATA points at a directory/glob (see data_loader.py)
+site_paths = patient_paths()
+site = None
+if len(site_paths) > 1:
+    site_choice = st.sidebar.selectbox("Clinic site", ["All sites"] + [site_name(p) for p in site_paths])
+    site = None if site_choice == "All sites" else site_choice
+# empty = no restriction, the charts are rebuilt for the selected patients only (see cohort.py)
+cohort_selection = {name: st.sidebar.multiselect(name, filter_options(name), default=[]) for name in COHORT_FILTERS}
+cohort_match = st.sidebar.radio(
+    "Combine filters",
+    options=['all', 'any'],
+    format_func=lambda m: "Match all filters (AND)" if m == 'all' else "Match any filter (OR)",
+    horizontal=True
 )
+cohort = cohort_key(cohort_selection, cohort_match)
 
-hba1c_threshold = alt.Chart(pd.DataFrame({'y': [6.5]})).mark_rule(
-    color='red', 
-    strokeDash=[4, 4],
-    size=2
-).encode(y='y:Q')
-threshold_label = alt.Chart(pd.DataFrame({'x': ['Medium (4-6)'], 'y': [6.7], 'text': ['Diabetes Threshold (6.5%)']})).mark_text(
-    align='center',
-    baseline='bottom',
-    color='red',
-    fontSize=12
-).encode(
-    x='x:N',
-    y='y:Q',
-    text='text:N'
-)
+# per-section timings (DASHBOARD_PROFILE=1 or ?profile=1, allocations with the env var only, see
+# instrumentation.py), None = off
+profile = new_profile(st.query_params.get(QUERY_PARAM))
 
 
-st.altair_chart(hba1c_dist + hba1c_threshold + threshold_label, use_container_width=True)
-diabetic_percent = diabetes_data.groupby('HealthLiteracyGroup')['Diagnosis'].mean() * 100
+def show_chart(chart, record):
+    st.altair_chart(chart, use_container_width=True)
+    record['charts'].append(chart)
 
-st.markdown(f"""
-<div class="insight-text">
-<strong>Key Insight:</strong>The High literacy group (7-10) shows the lowest median HbA1c at 6.98%, compared to the Low literacy group (0-3) at 7.03% and Medium literacy group (4-6) at 7.19%. Additionally, the High literacy group demonstrates a lower Q3 value (8.37% vs 8.41% for Low and 8.61% for Medium), suggesting better glycemic control among patients with higher health literacy. This aligns with clinical goals of maintaining lower HbA1c levels for better diabetes management.
-</div>
-""", unsafe_allow_html=True)
 
-st.markdown("<hr>", unsafe_allow_html=True)
+try:
+    with section('data load', profile) as record:
+        #load diabetes_data.csv which has health literacy
+        # parsed + derived once per file version and shared between sessions (see data_loader.py),
+        # counts/means/quartiles per literacy x education x diagnosis cell, every chart below is built from it
+        summary_cube = load_summary_cube(approximate=approximate)
+        record['rows'] = summary_cube['n_rows']
 
-# (bRFSS DATA)
-st.header("Education Level and Diabetes: BRFSS Survey Analysis")
-if health_indicators_loaded:
-    indicators_df = health_indicators.copy()
-
-    # (0 = no diabetes, 1 = prediabetes, 2 = diabetes)
-    indicators_df['DiabetesStatus'] = indicators_df['Diabetes_012'].map({0: 'No Diabetes',1: 'Prediabetes',2: 'Diabetes'})
-    education_mapping = {1: 'Elementary',2: 'Elementary',3: 'Some High School',4: 'High School Graduate',5: 'Some College',6: 'College Graduate'}
-    indicators_df['EducationLevel'] = indicators_df['Education'].map(education_mapping)
-    indicators_df['EducationSimple'] = indicators_df['Education'].apply(
-        lambda x: 'Less than High School' if x < 4 else 
-                  'High School Graduate' if x == 4 else
-                  'Some College' if x == 5 else
-                  'College Graduate'
-    )
-    education_counts = indicators_df.groupby(['EducationSimple', 'DiabetesStatus']).size().reset_index(name='count')
-    total_by_education = education_counts.groupby('EducationSimple')['count'].sum().reset_index(name='total')
-    education_counts = education_counts.merge(total_by_education, on='EducationSimple')
-    education_counts['percentage'] = education_counts['count'] /   education_counts['total'] * 100
-    chart = alt.Chart(education_counts).mark_bar().encode(
-        x=alt.X('EducationSimple:N', 
-                title='Education Level',
-                sort=['Less than High School', 'High School Graduate', 'Some College', 'College Graduate']),
-        y=alt.Y('percentage:Q', 
-                title='Percentage (%)',
-                axis=alt.Axis(format='~s')),
-        color=alt.Color('DiabetesStatus:N',
-                       scale=alt.Scale(domain=['No Diabetes', 'Prediabetes', 'Diabetes'],
-                                     range=['#457b9d', '#f1c453', '#e63946'])),
-        tooltip=[
-            alt.Tooltip('EducationSimple:N', title='Education Level'),
-            alt.Tooltip('DiabetesStatus:N', title='Diabetes Status'),
-            alt.Tooltip('count:Q', title='Count'),
-            alt.Tooltip('percentage:Q', title='Percentage', format='.1f')
-        ]
-    ).properties(
-        height=400,
-        title="Diabetes Status Distribution by Education Level"
-    )
-    
-    text = chart.mark_text(
-        align='center',
-        baseline='middle',
-        dy=-10,
-        color='white'
-    ).encode(
-        text=alt.Text('percentage:Q', format='.1f')
-    )
-    
-    st.altair_chart(chart, use_container_width=True)
-    diabetes_prevalence = indicators_df.copy()
-    diabetes_prevalence['HasDiabetes'] = diabetes_prevalence['Diabetes_012'].apply(lambda x: 1 if x > 0 else 0)
-    prevalence_by_education = diabetes_prevalence.groupby('EducationSimple')['HasDiabetes'].mean().reset_index()
-    prevalence_by_education['Prevalence'] = prevalence_by_education['HasDiabetes'] * 100
-    prevalence_by_education = prevalence_by_education.sort_values('Prevalence', ascending=False)
-
-    prevalence_chart = alt.Chart(prevalence_by_education).mark_bar().encode(
-        x=alt.X('Prevalence:Q', title='Diabetes Prevalence (%)'),
-        y=alt.Y('EducationSimple:N', 
-                title='Education Level',
-                sort='-x'),
-        color=alt.value('#e63946'),
-        tooltip=[
-            alt.Tooltip('EducationSimple:N', title='Education Level'),
-            alt.Tooltip('Prevalence:Q', title='Diabetes Prevalence', format='.1f')
-        ]
-    ).properties(
-        height=200,
-        title="Diabetes Prevalence by Education Level"
-    )
-
-    prevalence_text = prevalence_chart.mark_text(
-        align='left',
-        baseline='middle',
-        dx=3
-    ).encode(
-        text=alt.Text('Prevalence:Q', format='.1f')
-    )
-    st.altair_chart(prevalence_chart + prevalence_text, use_container_width=True)
+except Exception as e:
+    st.sidebar.error(f"Error loading data: {e}")
+    st.error("Could not load the diabetes dataset. Please make sure 'diabetes_data.csv' is in the current directory.")
+    st.stop() 
+
+if cohort is not None or site is not None:
+    patient_count = summary_cube['n_rows']
+    with section('cohort filter', profile) as record:
+        summary_cube = load_summary_cube(cohort=cohort, site=site, approximate=approximate)
+        record['rows'] = patient_count
+    selection = ([f"Site: {site}"] if site is not None else []) + \
+        ([f"Cohort: {cohort_description(cohort)}"] if cohort is not None else [])
+    st.sidebar.caption(f"{summary_cube['n_rows']:,} of {patient_count:,} patients selected")
+    st.info(f"{' | '.join(selection)} ({summary_cube['n_rows']:,} of {patient_count:,} patients). "
+            "The BRFSS survey section and the predictor use all the data.")
+    if summary_cube['n_rows'] == 0:
+        st.warning("No patients match the cohort filters.")
+        st.stop()
+
+# every analysis is a tab and only the open one runs, the others cost nothing until they are
+# clicked. what a tab prepares is memoized per dataset version, cohort/site and settings
+# (data_loader.load_view), so going back to a tab only draws it again.
+# without filters and with the default settings this is warm_up.DEFAULT_VIEW_KEY
+view_key = (cohort, site, approximate, bootstrap_ci)
+views = cube_views(summary_cube, bootstrap=bootstrap_ci)
+
+
+def outcomes_section():
+    # visualization 1
+    st.header("Impact of Health Literacy Across Multiple Outcomes")
+    with section('multi-outcome', profile) as record:
+        show_chart(load_view('multi_outcome', summary_cube['paths'], view_key, views['multi_outcome']), record)
+        record['rows'] = len(summary_cube['cells'])
+    st.markdown(insight_html(INSIGHTS['multi_outcome']), unsafe_allow_html=True)
+
+
+def adherence_section():
+    st.header("Medication Adherence by Health Literacy and Education")
+    with section('medication adherence', profile) as record:
+        adherence_chart, heatmap, adherence_corr = load_view('medication_adherence', summary_cube['paths'], view_key,
+                                                             views['medication_adherence'])
+        show_chart(adherence_chart, record)
+        st.subheader("Patients by Health Literacy and Adherence Level")
+        show_chart(heatmap, record)
+        record['rows'] = len(summary_cube['cells'])
+    st.markdown(insight_html(INSIGHTS['medication_adherence'].format(adherence_corr=adherence_corr)),
+                unsafe_allow_html=True)
+
+
+def hba1c_section():
+    # viusalization 3: HBA1C distribution by health literacy group 
+    st.header("HbA1c Distribution by Health Literacy")
+    with section('hba1c distribution', profile) as record:
+        show_chart(load_view('hba1c_distribution', summary_cube['paths'], view_key, views['hba1c_distribution']),
+                   record)
+        if approximate:
+            st.caption(f"Approximate quartiles, within {quantile_error('hba1c_by_group'):.4f} percentage points "
+                       "of the exact values")
+        record['rows'] = len(cube_quantiles(summary_cube, 'hba1c_by_group'))
+
+    st.markdown(insight_html(INSIGHTS['hba1c_distribution']), unsafe_allow_html=True)
+
+    # are the differences between the groups more than noise, for every outcome (see group_tests.py)
+    st.subheader("Significance of the Group Differences")
+    with section('group tests', profile) as record:
+        group_tests = load_group_tests(cohort=cohort, paths=summary_cube['paths'])
+        record['rows'] = group_tests['n_rows']
+        st.dataframe(group_tests['tests'], hide_index=True,
+                     column_config={'F': st.column_config.NumberColumn(format="%.2f"),
+                                    'H': st.column_config.NumberColumn(format="%.2f"),
+                                    'anova_p': st.column_config.NumberColumn('ANOVA p', format="%.2e"),
+                                    'kruskal_p': st.column_config.NumberColumn('Kruskal-Wallis p', format="%.2e"),
+                                    'permutation_p': st.column_config.NumberColumn('Permutation p', format="%.4f")})
+        sample_note = (f" of a {group_tests['permutation_rows']:,} patient sample stratified by literacy group "
+                       "and education" if 0 < group_tests['permutation_rows'] < group_tests['n_rows'] else "")
+        excluded_note = (f" ({group_tests['n_excluded']:,} patients with health literacy 0 have no literacy "
+                         "group and are left out)" if group_tests['n_excluded'] else "")
+        st.caption(f"ANOVA and Kruskal-Wallis on all {group_tests['n_rows']:,} patients{excluded_note}, "
+                   f"permutation test with {group_tests['n_permutations']:,} label shuffles{sample_note}")
+
+
+def correlations_section():
+    st.header("Correlations Between Clinical Measures")
+    correlation_explorer()
     st.markdown("""
     <div class="insight-text">
-    <strong>Key Insight:</strong> The BRFSS data reveals a clear inverse relationship between education level and 
-    diabetes prevalence. People with less than a high school education have significantly higher rates of both 
-    diabetes and prediabetes compared to college graduates. This pattern aligns with our findings about health literacy, 
-    suggesting that both formal education and health-specific literacy play important roles in diabetes prevention and management.
+    <strong>Key Insight:</strong> Hover over a cell for the correlation and its two-sided p-value. With this many pairs a
+    few will cross p < 0.05 by chance alone, the strength of a relationship matters more than its p-value here.
     </div>
     """, unsafe_allow_html=True)
-else:
-    st.warning("""
-    The BRFSS Health Indicators dataset (diabetes_012_health_indicators_BRFSS2015.csv) could not be loaded. 
-    This section would normally display visualizations showing the relationship between education levels and 
-    diabetes status from the Behavioral Risk Factor Surveillance System survey.
-    
-    To view these visualizations, please ensure the file 'diabetes_012_health_indicators_BRFSS2015.csv' is available in the same directory as this dashboard.
-    """)
-st.markdown("<hr>", unsafe_allow_html=True)
-# interactive health literacy 
-st.markdown("<hr>", unsafe_allow_html=True)
-st.header("Interactive Health Literacy Outcome Predictor")
-predictor_col1, predictor_col2 = st.columns([1, 2])
-with predictor_col1:
-    st.subheader("Adjust Patient Characteristics")
-    health_literacy_level = st.slider("Health Literacy Score", min_value=0,  max_value=10, value=5, step=1,help="Select a health literacy score from 0 (lowest) to 10 (highest)")
-    education_level = st.selectbox("Education Level", options=["Less than High School", "High School Graduate", "Some College", "College Graduate"],index=1,help="Select the patient's education level")
-    education_map_reverse = { 'Less than High School': 0, 'High School Graduate': 1,'Some College': 2, 'College Graduate': 3}
-    education_numeric = education_map_reverse[education_level]
-    if health_literacy_level <= 3:
-        health_literacy_group = "Low (0-3)"
-        color_code = "#e63946"
-    elif health_literacy_level <= 6:
-        health_literacy_group = "Medium (4-6)"
-        color_code = "#f1c453"
+
+
+# every pair of numeric columns for the selected cohort, computed once per cohort and dataset
+# version (see correlation.py). a fragment so switching method/columns only reruns this part
+@st.fragment
+def correlation_explorer():
+    with section('correlations', profile) as record:
+        correlations = load_correlations(cohort=cohort, paths=summary_cube['paths'])
+        record['rows'] = correlations['n_rows']
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            method = st.radio("Method", list(CORRELATION_METHODS), format_func=CORRELATION_METHODS.get,
+                              horizontal=True)
+        with col2:
+            columns = st.multiselect("Columns", CORRELATION_COLUMNS, default=CORRELATION_COLUMNS)
+        if len(columns) < 2:
+            st.warning("Pick at least two columns.")
+            return
+        show_chart(correlation_heatmap(correlations, method, columns), record)
+        st.subheader("Strongest Relationships")
+        strongest = strongest_pairs(correlations, method, columns)
+        st.dataframe(strongest, hide_index=True,
+                     column_config={'r': st.column_config.NumberColumn(format="%.3f"),
+                                    'p': st.column_config.NumberColumn('p-value', format="%.2e")})
+
+        # one point per patient: a stratified sample by diabetes status (see sampling.py)
+        sample = load_point_sample(cohort=cohort, paths=summary_cube['paths'],
+                                   n_points=SAMPLE_POINTS if approximate else MAX_EXACT_POINTS)
+        col1, col2 = st.columns(2)
+        default_x, default_y = (strongest.iloc[0][['x', 'y']] if len(strongest) else columns[:2])
+        x = col1.selectbox("Scatter x", columns, index=columns.index(default_x))
+        y = col2.selectbox("Scatter y", columns, index=columns.index(default_y))
+        show_chart(correlation_scatter(sample['points'], x, y), record)
+        if len(sample['points']) < sample['n_rows']:
+            st.caption(f"{len(sample['points']):,} of {sample['n_rows']:,} patients shown, sampled within each "
+                       "diabetes status in proportion to its size")
+
+
+def brfss_section():
+    # (bRFSS DATA)
+    st.header("Education Level and Diabetes: BRFSS Survey Analysis")
+    with section('brfss', profile) as record:
+        # education x diabetes status counts, streamed from the csv(s) by brfss.py
+        try:
+            brfss_counts = load_brfss_counts()
+        except Exception:
+            brfss_counts = None
+        if brfss_counts is not None:
+            education_counts = education_counts_frame(brfss_counts)
+            show_chart(education_status_chart(education_counts), record)
+            prevalence_by_education = prevalence_frame(brfss_counts)
+
+            show_chart(prevalence_chart(prevalence_by_education), record)
+            record['rows'] = int(brfss_counts.sum())
+    if brfss_counts is not None:
+        st.markdown(insight_html(INSIGHTS['brfss']), unsafe_allow_html=True)
     else:
-        health_literacy_group = "High (7-10)"
-        color_code = "#2a9d8f" 
-    st.markdown(f"""
-    <div style="background-color: {color_code}; padding: 10px; border-radius: 5px; margin-top: 20px;">
-        <h3 style="color: white; margin: 0;">Health Literacy Group: {health_literacy_group}</h3>
-    </div>
-    """, unsafe_allow_html=True)
-    st.info("""
-    This predictor uses the patterns in our dataset to estimate expected health outcomes 
-    based on health literacy score and education level. Adjust the controls to see how
-    these factors affect predicted diabetes outcomes.
-    """)
-
-with predictor_col2:
-    st.subheader("Predicted Health Outcomes")
-    predicted_hba1c = 8.5 - (0.15 * health_literacy_level) - (0.05 * education_numeric)
-    predicted_hba1c = max(4.5, min(11.0, predicted_hba1c))
-    predicted_qol = 40 + (3 * health_literacy_level) + (2 * education_numeric)
-    predicted_qol = max(10, min(95, predicted_qol)) 
-    predicted_adherence = 3 + (0.2 * health_literacy_level) + (0.1 * education_numeric)
-    predicted_adherence = max(1, min(9, predicted_adherence))
-    prediction_data = pd.DataFrame({'Outcome': ['HbA1c', 'Quality of Life', 'Medication Adherence'],'Value': [predicted_hba1c, predicted_qol, predicted_adherence],'Min': [4.5, 0, 0],'Max': [11, 100, 10],'Target': [6.5, 80, 8],'Format': ['{:.1f}%', '{:.0f}', '{:.1f}/10'],'Color': ['#e41a1c', '#4682b4', '#2a9d8f']})
-    metric_cols = st.columns(3)
+        st.warning("""
+        The BRFSS Health Indicators dataset (diabetes_012_health_indicators_BRFSS2015.csv) could not be loaded. 
+        This section would normally display visualizations showing the relationship between education levels and 
+        diabetes status from the Behavioral Risk Factor Surveillance System survey.
     
-    with metric_cols[0]:
-        st.metric("Predicted HbA1c",  f"{predicted_hba1c:.1f}%",delta=f"{6.5 - predicted_hba1c:.1f}% from target",delta_color="inverse" )
-        if predicted_hba1c < 5.7:
-            st.success("Normal range")
-        elif predicted_hba1c < 6.5:
-            st.warning("Prediabetes range")
-        else:
-            st.error("Diabetes range")
-            
-    with metric_cols[1]:
-        st.metric("Predicted Quality of Life",  f"{predicted_qol:.0f}/100",delta=None)
-        st.progress(predicted_qol/100)  
-    with metric_cols[2]:
-        st.metric("Predicted Medication Adherence", f"{predicted_adherence:.1f}/10",delta=None )
-        st.progress(predicted_adherence/10)
-    categories = ['Glycemic Control', 'Quality of Life', 'Medication Adherence']
-    values = [1 - ((predicted_hba1c - 4.5) / 6.5), predicted_qol / 100,predicted_adherence / 10]
-    colors = ['#e41a1c', '#4682b4', '#2a9d8f']
-    values = [max(0, min(1, v)) for v in values]
-    import matplotlib.pyplot as plt
-    fig = plt.figure(figsize=(4, 3))
-    ax = fig.add_subplot(111, polar=True)
-    angles = np.linspace(0, 2*np.pi, len(categories), endpoint=False).tolist()
-    angles.append(angles[0])
-    values.append(values[0])
-    ax.plot(angles, values, 'o-', linewidth=2)
-    ax.fill(angles, values, alpha=0.25)
-    ax.set_thetagrids(np.degrees(angles[:-1]), categories)
-    ax.set_ylim(0, 1)
-    ax.set_yticks([0.2, 0.4, 0.6, 0.8, 1.0])
-    ax.set_yticklabels(['20%', '40%', '60%', '80%', '100%'])
-    ax.set_title('Outcome Profile', pad=20)
-    ax.grid(True)
-    st.pyplot(fig)
-    st.subheader("Interpretation")
-    if health_literacy_level <= 3:
-        st.markdown("""
-        <div class="insight-text">
-        With <strong>low health literacy</strong>, this patient may face challenges in managing their diabetes effectively.
-        Healthcare providers should consider:
-        <ul>
-            <li>Using simple, visual educational materials</li>
-            <li>Focusing on basic self-management skills</li>
-            <li>More frequent follow-up appointments</li>
-            <li>Connecting with community health workers</li>
-        </ul>
-        </div>
-        """, unsafe_allow_html=True)
-    elif health_literacy_level <= 6:
-        st.markdown("""
-        <div class="insight-text">
-        With <strong>moderate health literacy</strong>, this patient has a foundation for diabetes self-management.
-        Healthcare providers should consider:
-        <ul>
-            <li>Building on existing knowledge with targeted education</li>
-            <li>Addressing specific misconceptions</li>
-            <li>Regular follow-up on medication adherence</li>
-            <li>Encouraging peer support groups</li>
-        </ul>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-        <div class="insight-text">
-        With <strong>high health literacy</strong>, this patient has excellent potential for successful diabetes management.
-        Healthcare providers should consider:
-        <ul>
-            <li>Providing advanced self-management information</li>
-            <li>Discussing the latest treatment options</li>
-            <li>Leveraging technology for monitoring</li>
-            <li>Encouraging them to mentor others with diabetes</li>
-        </ul>
-        </div>
-        """, unsafe_allow_html=True)
-
-
-st.markdown("""
-<div class="insight-text">
-<strong>Key Insight:</strong> This interactive predictor demonstrates how health literacy significantly impacts expected
-diabetes outcomes, regardless of formal education. By simply adjusting the health literacy score, we can see substantial
-changes in predicted HbA1c levels, quality of life scores, and medication adherence rates. This tool highlights the 
-practical value of assessing health literacy in clinical settings: it helps identify patients who may need additional 
-support and allows for more tailored, effective interventions.
-</div>
-""", unsafe_allow_html=True)
+        To view these visualizations, please ensure the file 'diabetes_012_health_indicators_BRFSS2015.csv' is available in the same directory as this dashboard.
+        """)
+
+
+# the predictor is a fragment: moving its slider/selectbox only reruns this function,
+# not the data loading and the charts above
+@st.fragment
+def outcome_predictor():
+    # on a fragment rerun the record is only logged, the sidebar panel shows the last full run
+    with section('predictor', profile) as record:
+        record['rows'] = 1
+        # HbA1c/QoL/adherence fitted on the data (see outcome_model.py), loaded when the tab is first opened
+        outcome_model = load_outcome_model()
+        predictor_col1, predictor_col2 = st.columns([1, 2])
+        with predictor_col1:
+            st.subheader("Adjust Patient Characteristics")
+            health_literacy_level = st.slider("Health Literacy Score", min_value=0,  max_value=10, value=5, step=1,help="Select a health literacy score from 0 (lowest) to 10 (highest)")
+            education_level = st.selectbox("Education Level", options=["Less than High School", "High School Graduate", "Some College", "College Graduate"],index=1,help="Select the patient's education level")
+            health_literacy_group, color_code = literacy_group(health_literacy_level)
+            st.markdown(f"""
+            <div style="background-color: {color_code}; padding: 10px; border-radius: 5px; margin-top: 20px;">
+                <h3 style="color: white; margin: 0;">Health Literacy Group: {health_literacy_group}</h3>
+            </div>
+            """, unsafe_allow_html=True)
+            st.info("""
+            This predictor uses the patterns in our dataset to estimate expected health outcomes 
+            based on health literacy score and education level. Adjust the controls to see how
+            these factors affect predicted diabetes outcomes.
+            """)
+
+        with predictor_col2:
+            st.subheader("Predicted Health Outcomes")
+            # precomputed for every slider/selectbox combination (see predictor.py)
+            outcome = lookup_outcome(outcome_model, health_literacy_level, education_level)
+            predicted_hba1c = outcome['hba1c']
+            predicted_qol = outcome['qol']
+            predicted_adherence = outcome['adherence']
+            metric_cols = st.columns(3)
+
+            with metric_cols[0]:
+                st.metric("Predicted HbA1c",  f"{predicted_hba1c:.1f}%",delta=f"{6.5 - predicted_hba1c:.1f}% from target",delta_color="inverse" )
+                if predicted_hba1c < 5.7:
+                    st.success("Normal range")
+                elif predicted_hba1c < 6.5:
+                    st.warning("Prediabetes range")
+                else:
+                    st.error("Diabetes range")
+
+            with metric_cols[1]:
+                st.metric("Predicted Quality of Life",  f"{predicted_qol:.0f}/100",delta=None)
+                st.progress(predicted_qol/100)  
+            with metric_cols[2]:
+                st.metric("Predicted Medication Adherence", f"{predicted_adherence:.1f}/10",delta=None )
+                st.progress(predicted_adherence/10)
+            st.image(outcome['radar_png'], use_container_width=True)
+            st.subheader("Interpretation")
+            st.markdown(interpretation_html(health_literacy_group), unsafe_allow_html=True)
+
+
+def predictor_section():
+    # interactive health literacy 
+    st.header("Interactive Health Literacy Outcome Predictor")
+    outcome_predictor()
+    st.markdown(insight_html(INSIGHTS['predictor']), unsafe_allow_html=True)
+
+
+analysis_sections = {
+    "Outcomes": outcomes_section,
+    "Medication Adherence": adherence_section,
+    "HbA1c Distribution": hba1c_section,
+    "Correlations": correlations_section,
+    "BRFSS Survey": brfss_section,
+    "Outcome Predictor": predictor_section,
+}
+tabs = st.tabs(list(analysis_sections), key='analysis_tab', on_change='rerun')
+for tab, show_section in zip(tabs, analysis_sections.values()):
+    if tab.open:
+        with tab:
+            show_section()
+st.markdown("<hr>", unsafe_allow_html=True)
 
 st.header("Conclusions and Implications")
-col1, col2 = st.columns(2)
-with col1:
-    st.markdown("""
-    ### Key Findings
-    
-    1. **Health Literacy and Clinical Outcomes**: Health literacy shows some association with glycemic control in diabetes patients, with the strongest improvements observed at the highest literacy levels (8-10).
-    
-    2. **Medication Adherence**: Health literacy shows a positive correlation with medication adherence, suggesting that patients who better understand their health information are more likely to follow prescribed treatments.
-    
-    3. **Quality of Life Impact**: Higher health literacy is associated with substantially better quality of life scores, highlighting benefits beyond clinical measures.
-    
-    4. **Multiple Outcomes**: The impact of health literacy varies across different outcomes, with medication adherence showing the strongest relationship, followed by quality of life and glycemic control.
-    """)
-
-with col2:
-    st.markdown("""
-    ### Implications for Practice
-    
-    1. **Targeted Interventions**: Healthcare providers should assess and address health literacy as a modifiable factor that can improve diabetes outcomes.
-    
-    2. **Educational Approaches**: Materials and communication should be tailored to different health literacy levels, with special attention to those with lower literacy.
-    
-    3. **Policy Considerations**: Addressing disparities in health literacy could help reduce the broader socioeconomic gradient seen in diabetes prevalence and outcomes.
-    
-    4. **Future Research**: Further investigation into effective health literacy interventions could result in significant benefits for diabetes management and prevention.
-    """)
+for column, (title, points) in zip(st.columns(2), CONCLUSIONS):
+    column.markdown(conclusions_markdown(title, points))
+
+if profile is not None:
+    with st.sidebar.expander("Performance", expanded=True):
+        st.caption("Wall time, rows, Vega-Lite spec size and Python allocations per section of this run")
+        st.dataframe(profile_table(profile), hide_index=True)
+
+# loads the other tabs' data/model/charts in a background thread once per server process
+# (see warm_up.py). started after the page so it does not slow the first render down,
+# serve.py starts it with the server instead
+start_warm_up()
@@ -0,0 +1,180 @@
+# dataframe engines for a few row-level steps of the data prep: parse a csv, scan a file in
+# chunks, count rows per group and count/mean/M2 of some columns per group (see aggregation.py)
+#   pandas  pandas' csv parser and groupby (single-threaded)
+#   arrow   pyarrow: csv parsing and hash aggregation (acero) straight on arrow chunks, e.g. the
+#           record batches of a memory-mapped sidecar, multi-threaded when there are several cores
+# picked with DASHBOARD_ENGINE=arrow in the environment (default pandas). the dashboard runs
+# three things through the engine:
+#   - the parse of a patient csv without a fresh sidecar (sidecar.read_csv_columnar)
+#   - the BRFSS scan, csv or sidecar (brfss.aggregate_brfss_file)
+#   - the point estimates of the bootstrap charts (grouped_metric_stats in bootstrap.py)
+# everything else is pandas/numpy whatever DASHBOARD_ENGINE says: the summary cube behind the
+# charts (one pandas groupby gives every patient a cell code, every cube and cohort cube is a few
+# bincounts over those codes, see summary_cube.py), the group tests and the correlations.
+# arrow is not faster everywhere: on one core benchmark.py measures it ahead on the csv parse
+# and behind pandas on the small grouped stats, so pandas stays the default.
+# both engines return the same pandas frames: group keys in the input's dtypes, sorted like
+# pandas sorts them, no groups for missing keys. the csv parsers differ in the last bit of some
+# floats (pyarrow rounds correctly, pandas' default parser does not), within 1e-12 relative.
+# checks.py compares the engines with each other and with the cube's cell moments
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+ENGINE_ENV = 'DASHBOARD_ENGINE'
+DEFAULT_ENGINE = 'pandas'
+# on a single core the arrow thread pool only adds scheduling overhead (several times slower)
+USE_THREADS = pa.cpu_count() > 1
+# largest relative difference from the pandas engine that still counts as the same result
+# (the csv parsers round some floats differently in the last bit)
+ENGINE_TOLERANCE = 1e-9
+
+
+# pandas
+
+def _pandas_read_csv(path, columns=None):
+    return pd.read_csv(path, usecols=columns)
+
+
+def _pandas_iter_csv(path, columns, chunksize):
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def _pandas_from_arrow(batch):
+    return batch.to_pandas()
+
+
+def _pandas_group_counts(frame, by):
+    return frame.groupby(by, observed=True).size().rename('count').reset_index()
+
+
+def _pandas_group_moments(frame, by, columns):
+    values = frame[columns].astype(np.float64)
+    grouped = values.groupby([frame[c] for c in by], observed=True)
+    count = grouped.size()
+    means = grouped.mean()
+    m2 = grouped.var(ddof=0).mul(count, axis=0)
+    moments = pd.concat([count.rename('count'), means.add_prefix('mean_'), m2.add_prefix('m2_')], axis=1)
+    return moments.reset_index()
+
+
+# arrow
+
+def _arrow_read_csv(path, columns=None):
+    options = pa_csv.ConvertOptions(include_columns=columns)
+    read_options = pa_csv.ReadOptions(use_threads=USE_THREADS)
+    return pa_csv.read_csv(path, read_options=read_options, convert_options=options).to_pandas()
+
+
+def _arrow_iter_csv(path, columns, chunksize):
+    # the reader parses blocks of bytes (not rows), on all cores when there are several;
+    # chunksize only sizes the blocks
+    read_options = pa_csv.ReadOptions(use_threads=USE_THREADS, block_size=max(1 << 20, chunksize * 64))
+    convert_options = pa_csv.ConvertOptions(include_columns=columns)
+    with pa_csv.open_csv(path, read_options=read_options, convert_options=convert_options) as reader:
+        for batch in reader:
+            yield pa.Table.from_batches([batch])
+
+
+def _arrow_from_arrow(batch):
+    return batch if isinstance(batch, pa.Table) else pa.Table.from_batches([batch])
+
+
+def _as_table(frame, columns):
+    if isinstance(frame, pa.Table):
+        return frame.select(columns)
+    return pa.Table.from_pandas(frame[columns], preserve_index=False)
+
+
+def _arrow_result(result, frame, by, columns):
+    # missing keys dropped, keys back in the input's dtypes, then sorted as a pandas groupby sorts
+    result = result.dropna(subset=by)
+    if isinstance(frame, pd.DataFrame):
+        for c in by:
+            result[c] = result[c].astype(frame[c].dtype)
+    return result.sort_values(by, kind='stable')[by + columns].reset_index(drop=True)
+
+
+def _arrow_group_counts(frame, by):
+    table = _as_table(frame, by)
+    result = table.group_by(by, use_threads=USE_THREADS).aggregate([([], 'count_all')]).to_pandas()
+    result = result.rename(columns={'count_all': 'count'})
+    return _arrow_result(result, frame, by, ['count'])
+
+
+def _arrow_group_moments(frame, by, columns):
+    table = _as_table(frame, by + columns)
+    for column in columns:
+        table = table.set_column(table.schema.get_field_index(column), column,
+                                 pc.cast(table[column], pa.float64()))
+    variance = pc.VarianceOptions(ddof=0)
+    aggregations = [([], 'count_all')] + [(c, 'mean') for c in columns] + [(c, 'variance', variance) for c in columns]
+    result = table.group_by(by, use_threads=USE_THREADS).aggregate(aggregations).to_pandas()
+    result = result.rename(columns=dict({'count_all': 'count'},
+                                        **{f'{c}_mean': f'mean_{c}' for c in columns},
+                                        **{f'{c}_variance': f'm2_{c}' for c in columns}))
+    for c in columns:
+        result[f'm2_{c}'] = result[f'm2_{c}'] * result['count']
+    return _arrow_result(result, frame, by, ['count'] + [f'mean_{c}' for c in columns]
+                         + [f'm2_{c}' for c in columns])
+
+
+ENGINES = {
+    'pandas': {
+        'read_csv': _pandas_read_csv,
+        'iter_csv': _pandas_iter_csv,
+        'from_arrow': _pandas_from_arrow,
+        'group_counts': _pandas_group_counts,
+        'group_moments': _pandas_group_moments,
+    },
+    'arrow': {
+        'read_csv': _arrow_read_csv,
+        'iter_csv': _arrow_iter_csv,
+        'from_arrow': _arrow_from_arrow,
+        'group_counts': _arrow_group_counts,
+        'group_moments': _arrow_group_moments,
+    },
+}
+
+
+def engine_name(name=None):
+    name = name or os.environ.get(ENGINE_ENV) or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"unknown engine {name!r} ({ENGINE_ENV}), expected one of {', '.join(ENGINES)}")
+    return name
+
+
+def get_engine(name=None):
+    # the engine's operations by name, the configured engine by default
+    return ENGINES[engine_name(name)]
+
+
+def max_relative_difference(result, reference):
+    # np.inf when the shape, keys or dtypes differ
+    if isinstance(reference, np.ndarray):
+        result, reference = pd.DataFrame(result), pd.DataFrame(reference)
+    if list(result.columns) != list(reference.columns) or len(result) != len(reference) \
+            or not result.dtypes.equals(reference.dtypes):
+        return np.inf
+    numeric = reference.select_dtypes('number').columns
+    if not result.drop(columns=numeric).equals(reference.drop(columns=numeric)):
+        return np.inf
+    a, b = result[numeric].to_numpy(dtype=np.float64), reference[numeric].to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difference = np.abs(a - b) / np.maximum(np.abs(b), 1e-300)
+    return float(np.nanmax(difference, initial=0.0))
+
+
+def engine_parity(by_engine):
+    # every engine's result against the pandas engine's
+    reference = by_engine[DEFAULT_ENGINE]
+    parity = {}
+    for engine, result in by_engine.items():
+        difference = max_relative_difference(result, reference)
+        parity[engine] = {'max_relative_difference': difference, 'same': difference <= ENGINE_TOLERANCE}
+    return parity
@@ -0,0 +1,327 @@
+# static export of the dashboard for a plain file server or a CDN
+# the charts, texts and the predictor are the same for every visitor (no cohort filter, default
+# settings), so they are computed once per dataset version and written out:
+#   charts/<name>.vl.json   every chart as a Vega-Lite spec with its data inline
+#   predictor_grid.json     all 44 predictor outcomes with their radar chart (see predictor.py)
+#   index.html              the page with the specs and the grid embedded, the predictor runs in
+#                           the browser as a lookup in the grid
+#   js/vega-embed.js        vega, vega-lite and vega-embed in one script, the versions the installed
+#                           altair writes its specs for (from vl-convert-python, no network needed)
+#   manifest.json           the dataset version the export was made from
+# an export of the same version is left alone (--force rewrites it). the page draws the specs
+# with vega-embed from js/, so the export works offline and behind a strict CSP. --js-base-url
+# loads the three scripts from a CDN (or a local copy of the npm files) instead.
+# cohort filters, sites, approximate mode and the correlation explorer still need streamlit
+#
+#   python export_static.py site/ --source data/sites
+
+import argparse
+import base64
+import hashlib
+import html
+import json
+import os
+import sys
+import time
+
+from brfss import brfss_paths, education_counts_frame, prevalence_frame
+from data_loader import (content_hash, load_brfss_counts, load_correlations, load_outcome_model, load_summary_cube,
+                         patient_paths)
+from page_content import (CONCLUSIONS, INSIGHTS, INTERPRETATIONS, INTRO, INTRO_TITLE, PAGE_CSS, PAGE_TITLE,
+                          insight_html, interpretation_html)
+from predictor import (education_levels, literacy_group, literacy_levels, outcome_grid, radar_values,
+                       render_radar_png)
+
+# bumped when the files written change, older exports are rewritten
+EXPORT_FORMAT = 2
+# the vendored script, relative to index.html
+JS_BUNDLE_PATH = 'js/vega-embed.js'
+# what --js-base-url is usually set to
+CDN_JS_BASE_URL = 'https://cdn.jsdelivr.net/npm'
+# the radar images are shown at about 400px in the page, 200 dpi is for the dashboard's wide layout
+RADAR_DPI = 80
+
+
+def export_version(paths, survey_paths, js_base_url=None):
+    # one hash over the contents of every input file, the export format and where the scripts come from
+    digest = hashlib.sha1(f'export {EXPORT_FORMAT} {js_base_url or JS_BUNDLE_PATH}'.encode())
+    for path in list(paths) + list(survey_paths):
+        digest.update(f'{os.path.basename(path)} {content_hash(path)}\n'.encode())
+    return digest.hexdigest()
+
+
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def chart_specs(cube, correlations, brfss_counts):
+    # name -> Vega-Lite dict, plus the values the insight texts are formatted with
+    import altair as alt
+    from charts import correlation_heatmap, cube_views, education_status_chart, prevalence_chart
+    views = cube_views(cube)
+    adherence_chart, heatmap, adherence_corr = views['medication_adherence']()
+    charts = {
+        'multi_outcome': views['multi_outcome'](),
+        'medication_adherence': adherence_chart,
+        'adherence_heatmap': heatmap,
+        'hba1c_distribution': views['hba1c_distribution'](),
+        'correlations': correlation_heatmap(correlations, 'pearson'),
+    }
+    if brfss_counts is not None:
+        charts['education_status'] = education_status_chart(education_counts_frame(brfss_counts))
+        charts['prevalence'] = prevalence_chart(prevalence_frame(brfss_counts))
+    with alt.data_transformers.disable_max_rows():
+        specs = {name: chart.to_dict() for name, chart in charts.items()}
+    return specs, {'adherence_corr': adherence_corr}
+
+
+def predictor_cells(model, dpi=RADAR_DPI):
+    # the browser side of predictor.lookup_outcome(), one entry per slider/selectbox combination
+    grid = outcome_grid(model)
+    cells = {}
+    for education_level in education_levels:
+        for health_literacy_level in literacy_levels:
+            outcome = grid[(health_literacy_level, education_level)]
+            group, color = literacy_group(health_literacy_level)
+            png = render_radar_png(radar_values(outcome), dpi=dpi)
+            cells[f'{health_literacy_level}|{education_level}'] = {
+                'hba1c': round(outcome['hba1c'], 3),
+                'qol': round(outcome['qol'], 3),
+                'adherence': round(outcome['adherence'], 3),
+                'group': group,
+                'color': color,
+                'radar': 'data:image/png;base64,' + base64.b64encode(png).decode('ascii'),
+            }
+    return cells
+
+
+def _script_json(value):
+    # json inside a <script> element, "</" would end the element
+    return json.dumps(value, separators=(',', ':')).replace('</', '<\\/')
+
+
+def _chart_divs(names, specs):
+    return ''.join(f'<div class="chart" id="chart-{name}"></div>\n' for name in names if name in specs)
+
+
+def _section(title, body):
+    return f'<section>\n<h2>{html.escape(title)}</h2>\n{body}</section>\n'
+
+
+def _conclusions_html(title, points):
+    items = ''.join(f'<li><strong>{html.escape(point)}</strong>: {html.escape(text)}</li>' for point, text in points)
+    return f'<div class="column">\n<h3>{html.escape(title)}</h3>\n<ol>{items}</ol>\n</div>\n'
+
+
+PREDICTOR_HTML = f'''\
+<div class="predictor">
+<div class="column">
+<h3>Adjust Patient Characteristics</h3>
+<label for="literacy">Health Literacy Score: <span id="literacy-value"></span></label>
+<input type="range" id="literacy" min="{literacy_levels[0]}" max="{literacy_levels[-1]}" step="1" value="5">
+<label for="education">Education Level</label>
+<select id="education">{''.join(f'<option{" selected" if i == 1 else ""}>{html.escape(level)}</option>'
+                                for i, level in enumerate(education_levels))}</select>
+<div id="group" class="group"></div>
+</div>
+<div class="column wide">
+<h3>Predicted Health Outcomes</h3>
+<div class="metrics">
+<div><div class="label">Predicted HbA1c</div><div class="value" id="hba1c"></div><div id="hba1c-range"></div></div>
+<div><div class="label">Predicted Quality of Life</div><div class="value" id="qol"></div><progress id="qol-bar" max="100"></progress></div>
+<div><div class="label">Predicted Medication Adherence</div><div class="value" id="adherence"></div><progress id="adherence-bar" max="10"></progress></div>
+</div>
+<img id="radar" alt="Outcome profile">
+<h3>Interpretation</h3>
+<div id="interpretation"></div>
+</div>
+</div>
+'''
+
+# the same thresholds and formats as outcome_predictor() in diabetes_dashboard.py
+PREDICTOR_SCRIPT = '''\
+function showPrediction() {
+  const level = document.getElementById('literacy').value;
+  const cell = grid[level + '|' + document.getElementById('education').value];
+  document.getElementById('literacy-value').textContent = level;
+  const group = document.getElementById('group');
+  group.style.backgroundColor = cell.color;
+  group.textContent = 'Health Literacy Group: ' + cell.group;
+  document.getElementById('hba1c').textContent = cell.hba1c.toFixed(1) + '%';
+  const range = document.getElementById('hba1c-range');
+  range.textContent = cell.hba1c < 5.7 ? 'Normal range' : cell.hba1c < 6.5 ? 'Prediabetes range' : 'Diabetes range';
+  range.className = cell.hba1c < 5.7 ? 'normal' : cell.hba1c < 6.5 ? 'prediabetes' : 'diabetes';
+  document.getElementById('qol').textContent = cell.qol.toFixed(0) + '/100';
+  document.getElementById('qol-bar').value = cell.qol;
+  document.getElementById('adherence').textContent = cell.adherence.toFixed(1) + '/10';
+  document.getElementById('adherence-bar').value = cell.adherence;
+  document.getElementById('radar').src = cell.radar;
+  document.getElementById('interpretation').innerHTML = interpretations[cell.group];
+}
+document.getElementById('literacy').addEventListener('input', showPrediction);
+document.getElementById('education').addEventListener('change', showPrediction);
+showPrediction();
+for (const [name, spec] of Object.entries(specs)) {
+  vegaEmbed('#chart-' + name, spec, {actions: false});
+}
+'''
+
+EXPORT_CSS = '''\
+body { background-color: #0E1117; color: white; font-family: sans-serif; margin: 0 auto; max-width: 1200px; padding: 20px; }
+.chart { margin: 10px 0; }
+.columns, .predictor, .metrics { display: flex; gap: 30px; }
+.column { flex: 1; }
+.column.wide { flex: 2; }
+.metrics > div { flex: 1; }
+.label { color: #9CA3AF; }
+.value { font-size: 2em; }
+.group { padding: 10px; border-radius: 5px; margin-top: 20px; font-size: 1.2em; font-weight: bold; }
+.normal { color: #2a9d8f; } .prediabetes { color: #f1c453; } .diabetes { color: #e63946; }
+label, select, input { display: block; margin: 8px 0; }
+#radar { max-width: 100%; background: white; }
+'''
+
+
+def vega_packages():
+    # the versions the installed altair writes its specs for (what alt.Chart.save() links to)
+    import altair as alt
+    return [f'vega@{alt.VEGA_VERSION}', f'vega-lite@{alt.VEGALITE_VERSION}', f'vega-embed@{alt.VEGAEMBED_VERSION}']
+
+
+def vega_bundle():
+    # vega, vega-lite and vega-embed as one classic script (it sets window.vegaEmbed), for the
+    # vega-lite version of the installed altair: what alt.Chart.save(inline=True) embeds
+    try:
+        import vl_convert
+    except ImportError as e:
+        raise ImportError("the self-contained export needs vl-convert-python (pip install vl-convert-python), "
+                          "--js-base-url loads the scripts from a CDN instead") from e
+    from altair.vegalite import SCHEMA_VERSION
+    return vl_convert.javascript_bundle(vl_version='_'.join(SCHEMA_VERSION.split('.')[:2]))
+
+
+def page_html(specs, insight_values, cells, js_base_url=None):
+    sections = [
+        _section("Impact of Health Literacy Across Multiple Outcomes",
+                 _chart_divs(['multi_outcome'], specs) + insight_html(INSIGHTS['multi_outcome'])),
+        _section("Medication Adherence by Health Literacy and Education",
+                 _chart_divs(['medication_adherence'], specs)
+                 + "<h3>Patients by Health Literacy and Adherence Level</h3>\n"
+                 + _chart_divs(['adherence_heatmap'], specs)
+                 + insight_html(INSIGHTS['medication_adherence'].format(**insight_values))),
+        _section("HbA1c Distribution by Health Literacy",
+                 _chart_divs(['hba1c_distribution'], specs) + insight_html(INSIGHTS['hba1c_distribution'])),
+        _section("Correlations Between Clinical Measures (Pearson)", _chart_divs(['correlations'], specs)),
+    ]
+    if 'education_status' in specs:
+        sections.append(_section("Education Level and Diabetes: BRFSS Survey Analysis",
+                                 _chart_divs(['education_status', 'prevalence'], specs)
+                                 + insight_html(INSIGHTS['brfss'])))
+    sections.append(_section("Interactive Health Literacy Outcome Predictor",
+                             PREDICTOR_HTML + insight_html(INSIGHTS['predictor'])))
+    sections.append(_section("Conclusions and Implications",
+                             '<div class="columns">\n'
+                             + ''.join(_conclusions_html(title, points) for title, points in CONCLUSIONS)
+                             + '</div>\n'))
+    if js_base_url:
+        scripts = ''.join(f'<script src="{js_base_url}/{package}"></script>\n' for package in vega_packages())
+    else:
+        scripts = f'<script src="{JS_BUNDLE_PATH}"></script>\n'
+    interpretations = {group: interpretation_html(group) for group in INTERPRETATIONS}
+    return f'''\
+<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(PAGE_TITLE)}</title>
+{scripts}<style>
+{PAGE_CSS}{EXPORT_CSS}</style>
+</head>
+<body>
+<h1>{html.escape(PAGE_TITLE)}</h1>
+<div class="highlight-box">
+<h3>{html.escape(INTRO_TITLE)}</h3>
+{INTRO}</div>
+{'<hr>'.join(sections)}<script>
+const specs = {_script_json(specs)};
+const grid = {_script_json(cells)};
+const interpretations = {_script_json(interpretations)};
+{PREDICTOR_SCRIPT}</script>
+</body>
+</html>
+'''
+
+
+def _write(path, text):
+    # written next to the target and renamed, a file server never sees half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+
+def export_static(output_dir, source=None, force=False, js_base_url=None):
+    # the manifest of the export, 'skipped' when output_dir already has this version.
+    # js_base_url=None vendors the scripts into output_dir, otherwise the page loads them from there
+    paths = patient_paths(source)
+    survey_paths = brfss_paths()
+    version = export_version(paths, survey_paths, js_base_url)
+    manifest = read_manifest(output_dir)
+    if not force and manifest is not None and manifest.get('version') == version:
+        return dict(manifest, skipped=True)
+
+    start = time.perf_counter()
+    # before anything is written, a missing vl-convert-python leaves an older export intact
+    bundle = None if js_base_url else vega_bundle()
+    cube = load_summary_cube(source)
+    specs, insight_values = chart_specs(cube, load_correlations(paths=cube['paths']), load_brfss_counts(survey_paths))
+    cells = predictor_cells(load_outcome_model(source))
+    for name, spec in specs.items():
+        _write(os.path.join(output_dir, 'charts', f'{name}.vl.json'), json.dumps(spec))
+    _write(os.path.join(output_dir, 'predictor_grid.json'), json.dumps(cells))
+    if bundle is not None:
+        _write(os.path.join(output_dir, JS_BUNDLE_PATH), bundle)
+    _write(os.path.join(output_dir, 'index.html'), page_html(specs, insight_values, cells, js_base_url))
+    manifest = {
+        'version': version,
+        'format': EXPORT_FORMAT,
+        'sources': [os.path.basename(path) for path in paths + survey_paths],
+        'charts': sorted(specs),
+        'scripts': js_base_url or JS_BUNDLE_PATH,
+        'rows': cube['n_rows'],
+        'seconds': round(time.perf_counter() - start, 2),
+    }
+    _write(os.path.join(output_dir, 'manifest.json'), json.dumps(manifest, indent=2))
+    return dict(manifest, skipped=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the dashboard as static Vega-Lite specs and an HTML page.")
+    parser.add_argument('output', help="directory to write the export to")
+    parser.add_argument('--source', default=None,
+                        help="patient csv, directory of site csvs or glob (default: as the dashboard)")
+    parser.add_argument('--force', action='store_true', help="rewrite an export of the same dataset version")
+    parser.add_argument('--js-base-url', default=None,
+                        help="load vega, vega-lite and vega-embed from this url, e.g. the CDN "
+                             f"{CDN_JS_BASE_URL} (default: a copy in the export, {JS_BUNDLE_PATH})")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest = export_static(args.output, source=args.source, force=args.force, js_base_url=args.js_base_url)
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if manifest['skipped']:
+        print(f"{args.output} is up to date (version {manifest['version'][:12]})", file=sys.stderr)
+    else:
+        print(f"exported {len(manifest['charts'])} charts and the predictor in {manifest['seconds']:.2f}s "
+              f"(version {manifest['version'][:12]}) -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# significance tests for outcome differences between patient groups
+# for every outcome and grouping (health literacy group, education, and the literacy group x
+# education cells): one-way ANOVA, Kruskal-Wallis and a label-permutation test of the ANOVA F.
+#   ANOVA           F = (SS_between / (k - 1)) / (SS_within / (N - k)) from per-group count/sum/M2
+#   Kruskal-Wallis  H on the average ranks, with the tie correction, chi-square with k - 1 df
+#                   (the same statistics and p-values as scipy.stats.f_oneway / kruskal)
+#   permutation     the share of label shuffles with a between-group SS at least as large as the
+#                   observed one, (1 + hits) / (1 + permutations). the total SS does not change
+#                   when labels move, so sum_g S_g^2 / n_g ranks the shuffles the same way F does
+# a batch of shuffles is one (shuffles x rows) index matrix, shared by every outcome and grouping.
+# big cohorts are shuffled as a seeded sample of PERMUTATION_ROWS patients stratified by cell
+# (a valid test of the same null hypothesis, with less power than ANOVA/Kruskal-Wallis on
+# everyone), batches go to worker processes when there is enough work (like bootstrap.py)
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from correlation import average_ranks
+from sampling import stratified_sample
+
+TEST_OUTCOMES = {'HbA1c': 'HbA1c', 'QualityOfLifeScore': 'Quality of Life', 'MedicationAdherence': 'Medication Adherence'}
+TEST_GROUPINGS = {
+    'Health literacy group': ['HealthLiteracyGroup'],
+    'Education': ['EducationLevelStr'],
+    'Literacy group x education': ['HealthLiteracyGroup', 'EducationLevelStr'],
+}
+# the finest grouping, every grouping above is a union of its cells
+CELL_COLUMNS = ['HealthLiteracyGroup', 'EducationLevelStr']
+TEST_COLUMNS = list(TEST_OUTCOMES) + CELL_COLUMNS
+N_PERMUTATIONS = 2000
+PERMUTATION_ROWS = 10_000
+# shuffled row indices held in memory at once per task (shuffles x rows)
+MAX_BATCH_CELLS = 4_000_000
+# below this many shuffled rows in total everything runs in this process
+PARALLEL_THRESHOLD = 10_000_000
+
+
+def anova(values, codes, k):
+    # (F, p) of a one-way ANOVA, NaN with fewer than 2 groups or no within-group variation
+    from scipy.special import fdtrc
+    if k < 2 or len(values) <= k:
+        return np.nan, np.nan
+    n = np.bincount(codes, minlength=k)
+    means = np.bincount(codes, weights=values, minlength=k) / np.maximum(n, 1)
+    between = float(np.sum(n * (means - values.mean()) ** 2))
+    within = float(np.sum((values - means[codes]) ** 2))
+    if within <= 0:
+        return np.nan, np.nan
+    f = (between / (k - 1)) / (within / (len(values) - k))
+    return f, float(fdtrc(k - 1, len(values) - k, f))
+
+
+def tie_correction(values):
+    # 1 - sum(t^3 - t) / (N^3 - N), t = size of each run of equal values. NaN below 2 values
+    if len(values) < 2:
+        return np.nan
+    ties = np.unique(values, return_counts=True)[1].astype(np.float64)
+    n_rows = float(len(values))
+    return 1 - np.sum(ties ** 3 - ties) / (n_rows ** 3 - n_rows)
+
+
+def kruskal(ranks, correction, codes, k):
+    # (H, p) of a Kruskal-Wallis test on the average ranks of the values and their tie correction
+    from scipy.special import chdtrc
+    n_rows = len(ranks)
+    if k < 2 or n_rows <= k or not correction > 0:
+        return np.nan, np.nan
+    n = np.bincount(codes, minlength=k)
+    rank_sums = np.bincount(codes, weights=ranks, minlength=k)
+    h = (12 / (n_rows * (n_rows + 1)) * np.sum(rank_sums ** 2 / n) - 3 * (n_rows + 1)) / correction
+    return h, float(chdtrc(k - 1, h))
+
+
+def _between_statistics(cell_sums, group_maps, group_sizes):
+    # sum_g S_g^2 / n_g per grouping and outcome, from (..., cells, outcomes) sums
+    return [np.sum(np.einsum('...co,cg->...go', cell_sums, m) ** 2 / n[:, None], axis=-2)
+            for m, n in zip(group_maps, group_sizes)]
+
+
+def permutation_hits(values, cell_sizes, group_maps, n_permutations, seed, max_cells=MAX_BATCH_CELLS):
+    # per grouping and outcome, how many of n_permutations shuffles reach the observed statistic.
+    # values: (rows, outcomes) sorted by cell, cell_sizes: rows per cell, group_maps: per grouping
+    # a (cells x groups) 0/1 matrix. the rows are shuffled instead of the labels, every cell then
+    # sums a contiguous run of the shuffled rows and the groups of every grouping add up cells
+    starts = np.concatenate([[0], np.cumsum(cell_sizes)[:-1]])
+    group_sizes = [cell_sizes @ m for m in group_maps]
+    observed = _between_statistics(np.add.reduceat(values, starts, axis=0), group_maps, group_sizes)
+    # a shuffle equal to the observed value up to rounding counts as reaching it
+    thresholds = [o * (1 - 1e-12) for o in observed]
+    rng = np.random.default_rng(seed)
+    n_rows = len(values)
+    rows = np.arange(n_rows, dtype=np.int32)
+    batch_size = max(1, max_cells // max(1, n_rows))
+    hits = [np.zeros(values.shape[1], dtype=np.int64) for _ in group_maps]
+    for start in range(0, n_permutations, batch_size):
+        size = min(batch_size, n_permutations - start)
+        shuffled = rng.permuted(np.broadcast_to(rows, (size, n_rows)), axis=1)
+        cell_sums = np.stack([np.add.reduceat(values[shuffled, j], starts, axis=1)
+                              for j in range(values.shape[1])], axis=-1)
+        for h, statistic, threshold in zip(hits, _between_statistics(cell_sums, group_maps, group_sizes),
+                                           thresholds):
+            h += np.sum(statistic >= threshold, axis=0)
+    return hits
+
+
+def _permutation_task(args):
+    return permutation_hits(*args)
+
+
+def permutation_p_values(values, cell_sizes, group_maps, n_permutations=N_PERMUTATIONS, seed=0, workers=None):
+    # per grouping, (1 + hits) / (1 + n_permutations) of every outcome
+    workers = workers or os.cpu_count() or 1
+    parallel = workers > 1 and len(values) * n_permutations > PARALLEL_THRESHOLD
+    parts = min(workers, n_permutations) if parallel else 1
+    sizes = np.diff(np.linspace(0, n_permutations, parts + 1).astype(int))
+    seeds = np.random.SeedSequence(seed).spawn(parts)
+    tasks = [(values, cell_sizes, group_maps, int(size), task_seed) for size, task_seed in zip(sizes, seeds)]
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_permutation_task, tasks))
+    else:
+        results = [_permutation_task(task) for task in tasks]
+    return [(1 + sum(hits)) / (1 + n_permutations) for hits in zip(*results)]
+
+
+def _permutation_sample(frame, cell_codes, n_cells, permutation_rows, seed):
+    # outcome values of a stratified sample by cell, sorted by cell, and the rows per cell
+    sample = stratified_sample(frame[list(TEST_OUTCOMES)].assign(_cell=cell_codes), '_cell', permutation_rows,
+                               seed=seed)
+    sample = sample.sort_values('_cell', kind='stable')
+    cells = sample['_cell'].to_numpy()
+    return sample[list(TEST_OUTCOMES)].to_numpy(dtype=np.float64), np.bincount(cells, minlength=n_cells)
+
+
+def group_difference_tests(frame, n_permutations=N_PERMUTATIONS, seed=0, permutation_rows=PERMUTATION_ROWS,
+                           workers=None):
+    # 'tests': one row per grouping x outcome with Grouping, Outcome, groups, n, F, anova_p, H,
+    # kruskal_p and permutation_p, plus the number of patients tested and left out and of the
+    # shuffles and the patients they were run on.
+    # every grouping is a union of literacy group x education cells, one groupby covers them all.
+    # patients without a cell (HealthLiteracy 0 has no literacy group) are left out, n_excluded
+    n_excluded = int(frame[CELL_COLUMNS].isna().any(axis=1).sum())
+    if n_excluded:
+        frame = frame.dropna(subset=CELL_COLUMNS)
+    cells = frame.groupby(CELL_COLUMNS, observed=True, sort=True)
+    cell_codes = cells.ngroup().to_numpy()
+    cell_keys = cells.size().reset_index()[CELL_COLUMNS]
+    group_codes = {grouping: cell_keys.groupby(by, observed=True, sort=True).ngroup().to_numpy()
+                   for grouping, by in TEST_GROUPINGS.items()}
+
+    permutation_p = {grouping: np.full(len(TEST_OUTCOMES), np.nan) for grouping in TEST_GROUPINGS}
+    # the rows the shuffles actually ran on, the per-cell minimum of the sample can add some
+    sampled_rows = 0
+    if len(cell_keys) > 1 and n_permutations > 0:
+        values, cell_sizes = _permutation_sample(frame, cell_codes, len(cell_keys), permutation_rows, seed)
+        # cells the sample has no rows of are left out, an empty run has no sum
+        present = cell_sizes > 0
+        sampled_rows = int(cell_sizes.sum())
+        group_maps = [np.eye(codes.max() + 1)[codes][present] for codes in group_codes.values()]
+        permutation_p = dict(zip(TEST_GROUPINGS, permutation_p_values(values, cell_sizes[present], group_maps,
+                                                                      n_permutations, seed, workers)))
+
+    rows = []
+    for j, (outcome, label) in enumerate(TEST_OUTCOMES.items()):
+        values = frame[outcome].to_numpy(dtype=np.float64)
+        ranks = average_ranks(frame[outcome].to_numpy())
+        correction = tie_correction(values)
+        for grouping, codes in group_codes.items():
+            k = int(codes.max()) + 1 if len(codes) else 0
+            f, anova_p = anova(values, codes[cell_codes], k)
+            h, kruskal_p = kruskal(ranks, correction, codes[cell_codes], k)
+            rows.append({'Grouping': grouping, 'Outcome': label, 'groups': k, 'n': len(frame), 'F': f,
+                         'anova_p': anova_p, 'H': h, 'kruskal_p': kruskal_p,
+                         'permutation_p': permutation_p[grouping][j]})
+    tests = pd.DataFrame(rows).sort_values('Grouping', key=lambda g: g.map(list(TEST_GROUPINGS).index),
+                                           kind='stable').reset_index(drop=True)
+    return {'tests': tests, 'n_rows': len(frame), 'n_excluded': n_excluded, 'n_permutations': n_permutations,
+            'permutation_rows': sampled_rows}
@@ -0,0 +1,93 @@
+# opt-in per-section instrumentation for the dashboard
+# turned on with DASHBOARD_PROFILE=1 in the environment or ?profile=1 in the url.
+# every section records its wall time, the rows it processed, the bytes of vega-lite spec
+# it emitted and the python allocations it made (tracemalloc, only started once profiling
+# is on). tracemalloc is process wide, keeps running once started and makes altair-heavy
+# sections 2-3x slower for every session on the server, so allocations are only traced with
+# DASHBOARD_PROFILE=1 set by whoever runs the server. the url parameter (any visitor) and
+# DASHBOARD_PROFILE=time only record timings. records are logged as one json line per section
+# and shown in the sidebar. with profiling off section() measures nothing
+
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ENV_VAR = 'DASHBOARD_PROFILE'
+QUERY_PARAM = 'profile'
+_enabled_values = {'1', 'true', 'yes', 'on'}
+_time_only_values = {'time'}
+
+
+def new_profile(query_value=None):
+    # query_value: the ?profile= url parameter, if any. None when profiling is off
+    env_value = os.environ.get(ENV_VAR, '').strip().lower()
+    if env_value in _enabled_values:
+        return {'records': [], 'allocations': True}
+    if env_value in _time_only_values or str(query_value or '').strip().lower() in _enabled_values | _time_only_values:
+        return {'records': [], 'allocations': False}
+    return None
+
+
+def spec_bytes(chart):
+    # the row-level charts are over altair's 5,000 row limit, the size is wanted anyway
+    import altair as alt
+    with alt.data_transformers.disable_max_rows():
+        return len(chart.to_json())
+
+
+@contextmanager
+def section(name, profile=None):
+    # profile: from new_profile(), the finished record is appended to profile['records'].
+    # the body sets record['rows'] and appends the charts it shows to record['charts']
+    record = {'section': name, 'rows': 0, 'charts': []}
+    if profile is None:
+        yield record
+        return
+
+    if not logger.handlers:
+        # streamlit only sets up its own loggers, the records should reach the server log
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    allocations = profile['allocations']
+    if allocations:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - start
+        if allocations:
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            record.update(alloc_bytes=current_bytes - start_bytes, peak_alloc_bytes=peak_bytes - start_bytes)
+        else:
+            record.update(alloc_bytes=None, peak_alloc_bytes=None)
+        # serializing the specs is not part of the section's own time/allocations
+        charts = record.pop('charts')
+        record.update(seconds=seconds, spec_bytes=sum(spec_bytes(chart) for chart in charts))
+        profile['records'].append(record)
+        logger.info("section_profile %s", json.dumps(record))
+
+
+def profile_table(profile):
+    table = pd.DataFrame(profile['records'], columns=['section', 'seconds', 'rows', 'spec_bytes', 'alloc_bytes',
+                                           'peak_alloc_bytes']).astype({'alloc_bytes': float, 'peak_alloc_bytes': float})
+    return pd.DataFrame({
+        'section': table['section'],
+        'ms': (table['seconds'] * 1000).round(1),
+        'rows': table['rows'],
+        'spec KB': (table['spec_bytes'] / 1024).round(1),
+        'alloc KB': (table['alloc_bytes'] / 1024).round(1),
+        'peak KB': (table['peak_alloc_bytes'] / 1024).round(1),
+    })
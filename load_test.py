@@ -0,0 +1,175 @@
+# load test of the json api (api.py)
+# --concurrency clients, each on its own keep-alive connection, send requests back to back for
+# --duration seconds, cycling through the endpoints (the default mix has cohort variants and a
+# prediction batch). the first request of every endpoint is sent once before the run and
+# reported as the cold (uncached) latency. per endpoint and overall: requests/second, p50/p99
+# latency and the share answered from the response cache. plain asyncio streams and http/1.1,
+# so the client adds as little as possible to the numbers
+#
+#   python api.py &
+#   python load_test.py --concurrency 32 --duration 10
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+DEFAULT_URL = 'http://127.0.0.1:8502'
+DEFAULT_PATHS = [
+    '/v1/adherence',
+    '/v1/adherence?gender=Female',
+    '/v1/adherence?age_band=50-59&age_band=60-69&bootstrap=1',
+    '/v1/multi-outcome',
+    '/v1/multi-outcome?socioeconomic_status=Low&hypertension=Yes&match=any',
+    '/v1/hba1c-quartiles?approximate=1',
+    '/v1/group-tests',
+    '/v1/prevalence',
+    '/v1/predictor-grid',
+]
+PREDICTION_PATH = '/v1/predictions'
+
+
+def prediction_body(n_patients):
+    patients = [{'HealthLiteracy': i % 11, 'EducationLevel': i % 4} for i in range(n_patients)]
+    return json.dumps({'patients': patients}).encode()
+
+
+def build_request(host, path, body=None):
+    method = 'GET' if body is None else 'POST'
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n"
+    if body is not None:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    return (head + "\r\n").encode() + (body or b'')
+
+
+async def read_response(reader):
+    # (status, headers) of one response, the body is read and dropped
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' not in headers:
+        raise ValueError(f"response without content-length: {lines[0]}")
+    await reader.readexactly(int(headers['content-length']))
+    return status, headers
+
+
+async def send(reader, writer, request):
+    start = time.perf_counter()
+    writer.write(request)
+    await writer.drain()
+    status, headers = await read_response(reader)
+    return time.perf_counter() - start, status, headers.get('x-cache')
+
+
+async def client(host, port, requests, offset, deadline, samples):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        i = offset
+        while time.perf_counter() < deadline:
+            name, request = requests[i % len(requests)]
+            latency, status, cache = await send(reader, writer, request)
+            samples.append((name, latency, status, cache))
+            i += 1
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def cold_requests(host, port, requests):
+    # one request per endpoint on a single connection, before any of them is cached
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return [(name,) + await send(reader, writer, request) for name, request in requests]
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def summarize(samples, elapsed):
+    latencies = np.array([s[1] for s in samples]) * 1000
+    cached = [s[3] == 'hit' for s in samples if s[3] is not None]
+    return {
+        'requests': len(samples),
+        'requests_per_second': len(samples) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+        'cache_hit_ratio': sum(cached) / len(cached) if cached else None,
+        'errors': sum(1 for s in samples if s[2] >= 400),
+    }
+
+
+async def run(url, paths, concurrency, duration, prediction_rows):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    requests = [(path, build_request(parts.netloc, path)) for path in paths]
+    if prediction_rows:
+        requests.append((f'POST {PREDICTION_PATH} ({prediction_rows} patients)',
+                         build_request(parts.netloc, PREDICTION_PATH, prediction_body(prediction_rows))))
+
+    cold = await cold_requests(host, port, requests)
+    samples = []
+    start = time.perf_counter()
+    deadline = start + duration
+    # the clients start at different endpoints so every endpoint is requested concurrently
+    await asyncio.gather(*[client(host, port, requests, i, deadline, samples) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    endpoints = {name: summarize([s for s in samples if s[0] == name], elapsed) for name, _ in requests}
+    for name, latency, status, cache in cold:
+        endpoints[name]['cold_ms'] = latency * 1000
+        endpoints[name]['cold_cache'] = cache
+        endpoints[name]['cold_status'] = status
+    return {'url': url, 'concurrency': concurrency, 'duration': elapsed, 'total': summarize(samples, elapsed),
+            'endpoints': endpoints}
+
+
+def _ms(value):
+    return f"{value:9.2f}" if value is not None else f"{'-':>9}"
+
+
+def print_report(report, out=sys.stderr):
+    print(f"{report['concurrency']} clients for {report['duration']:.1f}s against {report['url']}", file=out)
+    print(f"{'endpoint':<70} {'cold ms':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'cached':>7} {'errors':>6}",
+          file=out)
+    rows = list(report['endpoints'].items()) + [('total', report['total'])]
+    for name, stats in rows:
+        hit_ratio = stats['cache_hit_ratio']
+        print(f"{name[:70]:<70} {_ms(stats.get('cold_ms'))} {stats['requests_per_second']:9.1f} "
+              f"{_ms(stats['p50_ms'])} {_ms(stats['p99_ms'])} "
+              f"{f'{hit_ratio:.0%}' if hit_ratio is not None else '-':>7} {stats['errors']:6d}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the json api: requests/second and p99 latency.")
+    parser.add_argument('--url', default=DEFAULT_URL, help=f"api base url (default: {DEFAULT_URL})")
+    parser.add_argument('--concurrency', type=int, default=32, help="concurrent connections (default: 32)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds to run (default: 10)")
+    parser.add_argument('--path', action='append', dest='paths',
+                        help="endpoint with its query string, repeatable (default: a mix of every endpoint)")
+    parser.add_argument('--prediction-rows', type=int, default=100,
+                        help="patients per prediction request in the mix, 0 for none (default: 100)")
+    parser.add_argument('--output', help="also write the results to this json file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.url, args.paths or DEFAULT_PATHS, args.concurrency, args.duration,
+                             args.prediction_rows))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}", file=sys.stderr)
+    errors = report['total']['errors'] + sum(1 for e in report['endpoints'].values() if e['cold_status'] >= 400)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# outcome model behind the predictor
+# HbA1c, QualityOfLifeScore and MedicationAdherence are fitted (one multi-output linear
+# regression) from HealthLiteracy, EducationLevel and optional covariates. the fitted model
+# is saved next to the data together with the dataset version it was fitted on, so it is
+# only refitted when the data changes. predict() takes a whole batch of patients at once.
+# the model keeps the fitted coefficients as plain arrays, so loading and predicting never
+# import sklearn (over a second), only fitting does
+
+import logging
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = 'outcome_model.joblib'
+BASE_FEATURES = ['HealthLiteracy', 'EducationLevel']
+OUTCOME_COLUMNS = ['HbA1c', 'QualityOfLifeScore', 'MedicationAdherence']
+# bumped when the saved model changes shape, older files are refitted
+MODEL_FORMAT = 2
+# the range every predicted outcome is shown in, the linear fit runs past it at the extremes
+OUTCOME_RANGES = {'HbA1c': (4.5, 11.0), 'QualityOfLifeScore': (10, 95), 'MedicationAdherence': (1, 9)}
+
+
+def fit_outcome_model(diabetes_data, version, covariates=()):
+    features = BASE_FEATURES + [c for c in covariates if c not in BASE_FEATURES]
+    X = diabetes_data[features].to_numpy(dtype=np.float64)
+    y = diabetes_data[OUTCOME_COLUMNS].to_numpy(dtype=np.float64)
+    from sklearn.linear_model import LinearRegression
+    estimator = LinearRegression().fit(X, y)
+    return {
+        'coef': estimator.coef_,
+        'intercept': estimator.intercept_,
+        'features': features,
+        # covariates a caller leaves out are filled with the training median
+        'feature_fill': {c: float(diabetes_data[c].median()) for c in features},
+        'version': version,
+        'n_rows': len(diabetes_data),
+        'format': MODEL_FORMAT,
+    }
+
+
+def save_outcome_model(model, path=MODEL_PATH):
+    tmp_path = path + '.tmp'
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_saved_model(path=MODEL_PATH):
+    if not os.path.exists(path):
+        return None
+    try:
+        return joblib.load(path)
+    except Exception as e:
+        logger.warning("could not read %s, refitting: %s", path, e)
+        return None
+
+
+def model_matches(model, version, features):
+    # a saved model is only used in the current format, for the same data version and features
+    return (isinstance(model, dict) and model.get('format') == MODEL_FORMAT and model.get('version') == version
+            and model.get('features') == features)
+
+
+def saved_covariates(model):
+    # the covariates a saved model was fitted with, so a refit keeps them
+    features = model.get('features') if isinstance(model, dict) else None
+    return [c for c in features if c not in BASE_FEATURES] if isinstance(features, list) else []
+
+
+def load_or_fit_outcome_model(diabetes_data, version, covariates=(), path=MODEL_PATH):
+    features = BASE_FEATURES + [c for c in covariates if c not in BASE_FEATURES]
+    model = load_saved_model(path)
+    if model_matches(model, version, features):
+        return model
+    if model is not None:
+        logger.info("%s is not in format %d for data version %s with features %s, refitting",
+                    path, MODEL_FORMAT, version, features)
+    logger.info("fitting outcome model on %d rows", len(diabetes_data))
+    model = fit_outcome_model(diabetes_data, version, covariates)
+    try:
+        save_outcome_model(model, path)
+    except OSError as e:
+        logger.warning("could not save outcome model to %s: %s", path, e)
+    return model
+
+
+def predict(model, batch):
+    # batch: DataFrame (or dict of columns) with the model features, missing covariates use the fill value
+    batch = pd.DataFrame(batch)
+    n = len(batch)
+    columns = [f'Predicted{c}' for c in OUTCOME_COLUMNS]
+    if n == 0:
+        return pd.DataFrame(columns=columns, index=batch.index, dtype=np.float64)
+    X = np.column_stack([
+        batch[c].to_numpy(dtype=np.float64) if c in batch else np.full(n, model['feature_fill'][c])
+        for c in model['features']
+    ])
+    predicted = X @ model['coef'].T + model['intercept']
+    return pd.DataFrame(predicted, columns=columns, index=batch.index)
+
+
+def clip_predictions(predicted):
+    # predict() output limited to OUTCOME_RANGES, what the predictor and score_patients.py report
+    return predicted.clip(lower=pd.Series({f'Predicted{c}': low for c, (low, _) in OUTCOME_RANGES.items()}),
+                          upper=pd.Series({f'Predicted{c}': high for c, (_, high) in OUTCOME_RANGES.items()}),
+                          axis=1)
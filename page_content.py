@@ -0,0 +1,132 @@
+# static text of the dashboard, shared with the static export (export_static.py)
+
+PAGE_TITLE = "Health Literacy and Diabetes Care Outcomes"
+PAGE_CSS = """\
+.main {
+    background-color: #0E1117;
+    color: white;
+}
+h1, h2, h3 {
+    color: white;
+}
+.highlight-box {
+    background-color: #1E2130;
+    border-radius: 10px;
+    padding: 20px;
+    margin-bottom: 20px;
+    border: 1px solid #4B5563;
+}
+.insight-text {
+    background-color: #1E2130;
+    border-left: 4px solid #4682b4;
+    padding: 10px 15px;
+    margin-top: 10px;
+}
+hr {
+    margin-top: 30px;
+    margin-bottom: 30px;
+}
+.stMarkdown p {
+    margin-bottom: 0.5rem;
+}
+"""
+
+INTRO_TITLE = "Understanding Health Literacy and Diabetes"
+INTRO = """\
+This dashboard explores the relationships between health literacy, education level, and diabetes outcomes
+based on the article "Addressing the Issues of Health Equity and Disability in Diabetes Care: Update 2025".
+
+Health literacy is a person's ability to obtain, process, and understand basic health information needed to make 
+appropriate health decisions. Research indicates that health literacy plays a crucial role in diabetes management, 
+affecting outcomes from glycemic control to quality of life.
+"""
+
+# key insight of each section (medication_adherence is formatted with the section's correlation)
+INSIGHTS = {
+    'multi_outcome': """\
+The most striking pattern is at health literacy level 10, where we see significant improvements across all measures: Medication Adherence reaches its peak (0.59), followed by Quality of Life (0.54), and Glycemic Control (0.35). Throughout most literacy levels (0-9), the outcomes remain relatively stable with minor fluctuations, but the sharp upward trend at the highest literacy level suggests a potential threshold effect - patients with excellent health literacy (9-10) appear to experience substantially better outcomes than those with moderate literacy (5-8).
+This pattern is particularly pronounced for medication adherence, which shows the steepest improvement at high literacy levels, while glycemic control consistently remains the most challenging outcome to impact through health literacy alone.
+""",
+    'medication_adherence': """\
+Among patients with diabetes, average medication adherence is shown per health literacy
+level and education level, with 95% confidence intervals. The correlation between health literacy and adherence
+is r = {adherence_corr}; the heatmap shows how many patients fall in each literacy x adherence band.
+""",
+    'hba1c_distribution': """\
+The High literacy group (7-10) shows the lowest median HbA1c at 6.98%, compared to the Low literacy group (0-3) at 7.03% and Medium literacy group (4-6) at 7.19%. Additionally, the High literacy group demonstrates a lower Q3 value (8.37% vs 8.41% for Low and 8.61% for Medium), suggesting better glycemic control among patients with higher health literacy. This aligns with clinical goals of maintaining lower HbA1c levels for better diabetes management.
+""",
+    'brfss': """\
+The BRFSS data reveals a clear inverse relationship between education level and
+diabetes prevalence. People with less than a high school education have significantly higher rates of both
+diabetes and prediabetes compared to college graduates. This pattern aligns with our findings about health literacy,
+suggesting that both formal education and health-specific literacy play important roles in diabetes prevention and management.
+""",
+    'predictor': """\
+This interactive predictor demonstrates how health literacy significantly impacts expected
+diabetes outcomes, regardless of formal education. By simply adjusting the health literacy score, we can see substantial
+changes in predicted HbA1c levels, quality of life scores, and medication adherence rates. This tool highlights the
+practical value of assessing health literacy in clinical settings: it helps identify patients who may need additional
+support and allows for more tailored, effective interventions.
+""",
+}
+
+# one column each: (title, [(point, text), ...])
+CONCLUSIONS = [
+    ("Key Findings", [
+        ("Health Literacy and Clinical Outcomes",
+         "Health literacy shows some association with glycemic control in diabetes patients, with the strongest improvements observed at the highest literacy levels (8-10)."),
+        ("Medication Adherence",
+         "Health literacy shows a positive correlation with medication adherence, suggesting that patients who better understand their health information are more likely to follow prescribed treatments."),
+        ("Quality of Life Impact",
+         "Higher health literacy is associated with substantially better quality of life scores, highlighting benefits beyond clinical measures."),
+        ("Multiple Outcomes",
+         "The impact of health literacy varies across different outcomes, with medication adherence showing the strongest relationship, followed by quality of life and glycemic control."),
+    ]),
+    ("Implications for Practice", [
+        ("Targeted Interventions",
+         "Healthcare providers should assess and address health literacy as a modifiable factor that can improve diabetes outcomes."),
+        ("Educational Approaches",
+         "Materials and communication should be tailored to different health literacy levels, with special attention to those with lower literacy."),
+        ("Policy Considerations",
+         "Addressing disparities in health literacy could help reduce the broader socioeconomic gradient seen in diabetes prevalence and outcomes."),
+        ("Future Research",
+         "Further investigation into effective health literacy interventions could result in significant benefits for diabetes management and prevention."),
+    ]),
+]
+
+# predictor advice per health literacy group (predictor.literacy_group)
+INTERPRETATIONS = {
+    "Low (0-3)": ("With <strong>low health literacy</strong>, this patient may face challenges in managing their diabetes effectively.", [
+        "Using simple, visual educational materials",
+        "Focusing on basic self-management skills",
+        "More frequent follow-up appointments",
+        "Connecting with community health workers",
+    ]),
+    "Medium (4-6)": ("With <strong>moderate health literacy</strong>, this patient has a foundation for diabetes self-management.", [
+        "Building on existing knowledge with targeted education",
+        "Addressing specific misconceptions",
+        "Regular follow-up on medication adherence",
+        "Encouraging peer support groups",
+    ]),
+    "High (7-10)": ("With <strong>high health literacy</strong>, this patient has excellent potential for successful diabetes management.", [
+        "Providing advanced self-management information",
+        "Discussing the latest treatment options",
+        "Leveraging technology for monitoring",
+        "Encouraging them to mentor others with diabetes",
+    ]),
+}
+
+
+def insight_html(text):
+    return f'<div class="insight-text">\n<strong>Key Insight:</strong> {text}</div>'
+
+
+def conclusions_markdown(title, points):
+    return f"### {title}\n\n" + "\n\n".join(f"{i}. **{point}**: {text}" for i, (point, text) in enumerate(points, 1))
+
+
+def interpretation_html(group):
+    lead, items = INTERPRETATIONS[group]
+    advice = "".join(f"<li>{item}</li>" for item in items)
+    return (f'<div class="insight-text">\n{lead}\nHealthcare providers should consider:\n'
+            f'<ul>{advice}</ul>\n</div>')
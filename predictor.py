@@ -0,0 +1,103 @@
+# outcome grid for the interactive predictor
+# the predictor only has 11 literacy scores x 4 education levels, so all 44 outcome
+# profiles are predicted in one batch per fitted model (see outcome_model.py) and every
+# slider/selectbox change is a dictionary lookup. the radar chart of a profile is rendered
+# to png bytes the first time it is shown (a render is ~0.1s, all 44 up front would block
+# the first page); warm_radar_images() renders the rest ahead of time
+
+import io
+import threading
+
+import numpy as np
+import pandas as pd
+
+from outcome_model import clip_predictions, predict
+
+literacy_levels = list(range(0, 11))
+education_levels = ['Less than High School', 'High School Graduate', 'Some College', 'College Graduate']
+radar_categories = ['Glycemic Control', 'Quality of Life', 'Medication Adherence']
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def literacy_group(health_literacy_level):
+    # (label, color) of the predictor's literacy group
+    if health_literacy_level <= 3:
+        return "Low (0-3)", "#e63946"
+    if health_literacy_level <= 6:
+        return "Medium (4-6)", "#f1c453"
+    return "High (7-10)", "#2a9d8f"
+
+
+def radar_values(outcome):
+    values = [1 - ((outcome['hba1c'] - 4.5) / 6.5), outcome['qol'] / 100, outcome['adherence'] / 10]
+    return [max(0, min(1, v)) for v in values]
+
+
+def render_radar_png(values, dpi=200):
+    # a plain Figure (not pyplot) is not registered anywhere, so it is freed with the function.
+    # matplotlib is imported on the first render only (python caches it after that)
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(4, 3))
+    ax = fig.add_subplot(111, polar=True)
+    angles = np.linspace(0, 2*np.pi, len(radar_categories), endpoint=False).tolist()
+    angles.append(angles[0])
+    values = values + [values[0]]
+    ax.plot(angles, values, 'o-', linewidth=2)
+    ax.fill(angles, values, alpha=0.25)
+    ax.set_thetagrids(np.degrees(angles[:-1]), radar_categories)
+    ax.set_ylim(0, 1)
+    ax.set_yticks([0.2, 0.4, 0.6, 0.8, 1.0])
+    ax.set_yticklabels(['20%', '40%', '60%', '80%', '100%'])
+    ax.set_title('Outcome Profile', pad=20)
+    ax.grid(True)
+    # same settings st.pyplot uses
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def build_outcome_grid(model):
+    cells = [(health_literacy_level, education_numeric, education_level)
+             for education_numeric, education_level in enumerate(education_levels)
+             for health_literacy_level in literacy_levels]
+    batch = pd.DataFrame({
+        'HealthLiteracy': [cell[0] for cell in cells],
+        'EducationLevel': [cell[1] for cell in cells]
+    })
+    predicted = clip_predictions(predict(model, batch))
+    grid = {}
+    for (health_literacy_level, _, education_level), row in zip(cells, predicted.itertuples(index=False)):
+        grid[(health_literacy_level, education_level)] = {
+            'hba1c': float(row.PredictedHbA1c),
+            'qol': float(row.PredictedQualityOfLifeScore),
+            'adherence': float(row.PredictedMedicationAdherence),
+            'radar_png': None
+        }
+    return grid
+
+
+def outcome_grid(model):
+    # one grid per fitted model, an older model's grid is dropped
+    global _grid
+    with _grid_lock:
+        if _grid is None or _grid['version'] != model['version']:
+            _grid = {'version': model['version'], 'cells': build_outcome_grid(model)}
+        return _grid['cells']
+
+
+def _with_radar(outcome):
+    with _grid_lock:
+        if outcome['radar_png'] is None:
+            outcome['radar_png'] = render_radar_png(radar_values(outcome))
+    return outcome
+
+
+def lookup_outcome(model, health_literacy_level, education_level):
+    return _with_radar(outcome_grid(model)[(health_literacy_level, education_level)])
+
+
+def warm_radar_images(model):
+    for outcome in outcome_grid(model).values():
+        _with_radar(outcome)
@@ -0,0 +1,34 @@
+# stratified downsampling for charts that draw one mark per patient (scatter plots)
+# every stratum (e.g. diabetes status) gets its share of the points in proportion to its size,
+# but at least MIN_PER_STRATUM so small groups stay visible; a stratum smaller than that is kept
+# whole. the positions come from a seeded generator so reruns draw the same points.
+# a sample of n points out of N shows each stratum's shape with the usual 1/sqrt(n) noise,
+# the sampled points are not the full data: tails/outliers beyond the top 1/n can be missing
+
+import numpy as np
+
+# points drawn in approximate mode, and at most in exact mode (altair's default row limit)
+SAMPLE_POINTS = 2_000
+MAX_EXACT_POINTS = 5_000
+MIN_PER_STRATUM = 50
+
+
+def stratum_sizes(counts, n_points, min_per_stratum=MIN_PER_STRATUM):
+    # points per stratum: proportional to counts, at least min_per_stratum, never more than the stratum
+    counts = np.asarray(counts)
+    if counts.sum() <= n_points:
+        return counts.copy()
+    sizes = np.floor(n_points * counts / counts.sum()).astype(np.int64)
+    return np.minimum(counts, np.maximum(sizes, min_per_stratum))
+
+
+def stratified_sample(frame, by, n_points=SAMPLE_POINTS, seed=0, min_per_stratum=MIN_PER_STRATUM):
+    # rows of frame in their original order, every row when there are no more than n_points
+    if len(frame) <= n_points:
+        return frame
+    codes = frame.groupby(by, observed=True, sort=False).ngroup().to_numpy()
+    rows = [np.flatnonzero(codes == g) for g in range(codes.max() + 1)]
+    sizes = stratum_sizes([len(r) for r in rows], n_points, min_per_stratum)
+    rng = np.random.default_rng(seed)
+    picked = np.sort(np.concatenate([rng.choice(r, size, replace=False) for r, size in zip(rows, sizes)]))
+    return frame.iloc[picked]
@@ -0,0 +1,136 @@
+# declarative schema for diabetes_data.csv
+# every column gets the smallest dtype that holds it and the range it is allowed to have,
+# validate_frame() checks the raw csv against it and apply_schema() downcasts
+# (0/1 flags -> int8, scores -> float32, labels -> pandas categoricals)
+
+import numpy as np
+import pandas as pd
+
+
+def _flag():
+    return {'dtype': 'int8', 'min': 0, 'max': 1}
+
+
+def _code(max_value):
+    return {'dtype': 'int8', 'min': 0, 'max': max_value}
+
+
+def _score(min_value, max_value):
+    return {'dtype': 'float32', 'min': min_value, 'max': max_value}
+
+
+PATIENT_SCHEMA = {
+    'PatientID': {'dtype': 'int32', 'min': 0},
+    'Age': {'dtype': 'int16', 'min': 0, 'max': 120},
+    'Gender': _flag(),
+    'Ethnicity': _code(3),
+    'SocioeconomicStatus': _code(2),
+    'EducationLevel': _code(3),
+    'BMI': _score(10, 100),
+    'Smoking': _flag(),
+    'AlcoholConsumption': _score(0, 20),
+    'PhysicalActivity': _score(0, 10),
+    'DietQuality': _score(0, 10),
+    'SleepQuality': _score(0, 10),
+    'FamilyHistoryDiabetes': _flag(),
+    'GestationalDiabetes': _flag(),
+    'PolycysticOvarySyndrome': _flag(),
+    'PreviousPreDiabetes': _flag(),
+    'Hypertension': _flag(),
+    'SystolicBP': {'dtype': 'int16', 'min': 50, 'max': 250},
+    'DiastolicBP': {'dtype': 'int16', 'min': 30, 'max': 150},
+    'FastingBloodSugar': _score(20, 600),
+    'HbA1c': _score(3, 20),
+    'SerumCreatinine': _score(0, 20),
+    'BUNLevels': _score(0, 200),
+    'CholesterolTotal': _score(50, 500),
+    'CholesterolLDL': _score(0, 400),
+    'CholesterolHDL': _score(0, 200),
+    'CholesterolTriglycerides': _score(0, 2000),
+    'AntihypertensiveMedications': _flag(),
+    'Statins': _flag(),
+    'AntidiabeticMedications': _flag(),
+    'FrequentUrination': _flag(),
+    'ExcessiveThirst': _flag(),
+    'UnexplainedWeightLoss': _flag(),
+    'FatigueLevels': _score(0, 10),
+    'BlurredVision': _flag(),
+    'SlowHealingSores': _flag(),
+    'TinglingHandsFeet': _flag(),
+    'QualityOfLifeScore': _score(0, 100),
+    'HeavyMetalsExposure': _flag(),
+    'OccupationalExposureChemicals': _flag(),
+    'WaterQuality': _flag(),
+    'MedicalCheckupsFrequency': _score(0, 12),
+    'MedicationAdherence': _score(0, 10),
+    'HealthLiteracy': _score(0, 10),
+    'Diagnosis': _flag(),
+    'DoctorInCharge': {'dtype': 'category'},
+}
+
+# columns added by data_loader.derive_patient_columns, the order of the categories is the display order
+DERIVED_SCHEMA = {
+    'EducationLevelStr': {'dtype': 'category',
+                          'categories': ['Less than High School', 'High School Graduate', 'Some College', 'College Graduate']},
+    'DiabetesStatus': {'dtype': 'category', 'categories': ['No Diabetes', 'Diabetes']},
+}
+
+
+def validate_frame(frame, schema=PATIENT_SCHEMA):
+    # collect every problem so one bad extract reports everything at once
+    problems = []
+    for column, spec in schema.items():
+        if column not in frame.columns:
+            problems.append(f"{column}: missing column")
+            continue
+        values = frame[column]
+        n_missing = int(values.isna().sum())
+        if n_missing:
+            problems.append(f"{column}: {n_missing} missing values")
+        if spec['dtype'] == 'category':
+            continue
+        if not pd.api.types.is_numeric_dtype(values):
+            problems.append(f"{column}: expected numbers, got {values.dtype}")
+            continue
+        if 'min' in spec:
+            n_low = int((values < spec['min']).sum())
+            if n_low:
+                problems.append(f"{column}: {n_low} values below {spec['min']}")
+        if 'max' in spec:
+            n_high = int((values > spec['max']).sum())
+            if n_high:
+                problems.append(f"{column}: {n_high} values above {spec['max']}")
+        if spec['dtype'].startswith('int'):
+            n_fraction = int((values % 1 != 0).sum())
+            if n_fraction:
+                problems.append(f"{column}: {n_fraction} non-integer values")
+    if problems:
+        raise ValueError("diabetes data does not match the schema:\n" + "\n".join(problems))
+    return frame
+
+
+def apply_schema(frame, schema=None):
+    schema = schema if schema is not None else {**PATIENT_SCHEMA, **DERIVED_SCHEMA}
+    converted = {}
+    for column, spec in schema.items():
+        if column not in frame.columns:
+            continue
+        if spec['dtype'] == 'category':
+            converted[column] = pd.Categorical(frame[column], categories=spec.get('categories'))
+        else:
+            converted[column] = frame[column].astype(np.dtype(spec['dtype']))
+    return frame.assign(**converted)
+
+
+def concat_frames(frames):
+    # pd.concat that keeps categoricals categorical when the parts have different categories
+    frames = list(frames)
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals([f[column] for f in frames]).categories
+            frames = [f.assign(**{column: f[column].cat.set_categories(categories)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def memory_footprint(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
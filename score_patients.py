@@ -0,0 +1,123 @@
+# batch scoring of large patient extracts (same columns as diabetes_data.csv)
+# the input is streamed in chunks, every chunk gets the dashboard's derived columns
+# (EducationLevelStr, Diagnosis from HbA1c >= 6.5, HealthLiteracyGroup, DiabetesStatus)
+# and the predicted outcomes (clipped to the predictor's ranges, see outcome_model.py), chunks are
+# scored in a process pool and written out in order
+#
+#   python score_patients.py extract.csv scored.csv --workers 8 --chunksize 200000
+
+import argparse
+import collections
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_loader import PATIENT_DATA_PATH, dataset_version, derive_patient_columns, load_patient_data
+from outcome_model import (MODEL_PATH, clip_predictions, load_or_fit_outcome_model, load_saved_model, predict,
+                           saved_covariates)
+
+ID_COLUMNS = ['PatientID']
+INPUT_COLUMNS = ['PatientID', 'EducationLevel', 'HbA1c', 'HealthLiteracy']
+DERIVED_COLUMNS = ['EducationLevelStr', 'Diagnosis', 'HealthLiteracyGroup', 'DiabetesStatus']
+
+_worker_model = None
+
+
+def _init_worker(model):
+    # the model is sent to every worker once, not with every chunk
+    global _worker_model
+    _worker_model = model
+
+
+def score_chunk(chunk, model, all_columns=False):
+    # an input column the derived ones replace (Diagnosis) is written once, as derived
+    columns = [c for c in chunk.columns if c not in DERIVED_COLUMNS] if all_columns else ID_COLUMNS
+    scored = derive_patient_columns(chunk)
+    predicted = clip_predictions(predict(model, scored[model['features']]))
+    return pd.concat([scored[columns + DERIVED_COLUMNS], predicted], axis=1)
+
+
+def _score_in_worker(chunk, all_columns, header):
+    # csv formatting happens in the worker too, the parent only appends text
+    scored = score_chunk(chunk, _worker_model, all_columns)
+    return len(scored), scored.to_csv(header=header, index=False)
+
+
+def resolve_model(model_path, training_path):
+    # the saved model goes through the dashboard's checks: used when it is in the current format
+    # and was fitted on the current training data, otherwise refitted there (with the covariates
+    # it had) and saved over it. without the training data nothing can be checked, so no scoring
+    if not os.path.exists(training_path):
+        raise FileNotFoundError(f"training data {training_path} not found, {model_path} cannot be checked "
+                                "against it (--training-data)")
+    covariates = saved_covariates(load_saved_model(model_path))
+    return load_or_fit_outcome_model(load_patient_data(training_path), dataset_version(training_path), covariates,
+                                     path=model_path)
+
+
+def score_file(input_path, output_path, model, workers=None, chunksize=100_000, all_columns=False,
+               progress=None):
+    workers = workers or os.cpu_count() or 1
+    usecols = None if all_columns else list(dict.fromkeys(INPUT_COLUMNS + model['features']))
+    reader = pd.read_csv(input_path, usecols=usecols, chunksize=chunksize)
+    # at most 2 chunks per worker in flight so memory stays bounded on any file size
+    max_pending = 2 * workers
+    pending = collections.deque()
+    rows = 0
+    start = time.perf_counter()
+
+    with open(output_path, 'w', newline='') as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+
+        def write(future):
+            nonlocal rows
+            n_rows, text = future.result()
+            out.write(text)
+            rows += n_rows
+            if progress is not None:
+                progress(rows, time.perf_counter() - start)
+
+        for i, chunk in enumerate(reader):
+            pending.append(pool.submit(_score_in_worker, chunk, all_columns, i == 0))
+            if len(pending) >= max_pending:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+    elapsed = time.perf_counter() - start
+    return rows, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a patient extract with the dashboard's derived fields and outcome model.")
+    parser.add_argument('input', help="csv with the same columns as diabetes_data.csv")
+    parser.add_argument('output', help="csv to write the scored rows to")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: number of cpus)")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="rows per chunk (default: 100000)")
+    parser.add_argument('--model', default=MODEL_PATH, help=f"fitted outcome model (default: {MODEL_PATH})")
+    parser.add_argument('--training-data', default=PATIENT_DATA_PATH,
+                        help="data the model is fitted on, --model is refitted when it was not (default: "
+                             f"{PATIENT_DATA_PATH})")
+    parser.add_argument('--all-columns', action='store_true', help="copy every input column to the output")
+    args = parser.parse_args(argv)
+
+    try:
+        model = resolve_model(args.model, args.training_data)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    def progress(rows, elapsed):
+        print(f"\r{rows:,} rows  {rows / max(elapsed, 1e-9):,.0f} rows/s", end='', file=sys.stderr)
+
+    rows, elapsed = score_file(args.input, args.output, model, workers=args.workers,
+                               chunksize=args.chunksize, all_columns=args.all_columns, progress=progress)
+    print(f"\nscored {rows:,} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s) -> {args.output}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+# runs the dashboard with its caches warming up from server start (see warm_up.py)
+# same as `streamlit run diabetes_dashboard.py`, the page script runs in this process so it
+# finds everything the warm-up thread loaded
+#
+#   python serve.py --server.port 8501
+
+import sys
+
+from streamlit.web import cli
+
+from warm_up import start_warm_up
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    start_warm_up()
+    sys.argv = ['streamlit', 'run', 'diabetes_dashboard.py'] + list(argv)
+    return cli.main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# typed columnar copies ("sidecars") of the csv files
+# the first time a csv is read it is also written next to it as an uncompressed
+# feather (arrow ipc) file, later loads memory-map that file instead of parsing text.
+# the sidecar remembers the size/mtime of the csv it came from and is rebuilt
+# as soon as the csv changes. a scan that only needs a few columns (brfss.py) can
+# stream just those into a sidecar, which is marked partial and only serves those columns
+
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+
+from engine import get_engine
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = '.feather'
+_SOURCE_KEY = b'source_fingerprint'
+_PARTIAL_KEY = b'partial'
+
+
+def sidecar_path(csv_path):
+    return os.path.splitext(csv_path)[0] + SIDECAR_SUFFIX
+
+
+def _source_tag(csv_path):
+    info = os.stat(csv_path)
+    return f"{info.st_size}:{info.st_mtime_ns}".encode()
+
+
+def sidecar_is_fresh(csv_path, columns=None):
+    # columns=None asks for the whole csv, which a partial sidecar does not have
+    path = sidecar_path(csv_path)
+    if not os.path.exists(path):
+        return False
+    try:
+        with pa.memory_map(path) as source:
+            schema = ipc.open_file(source).schema
+    except (OSError, pa.ArrowInvalid):
+        return False
+    metadata = schema.metadata or {}
+    if metadata.get(_SOURCE_KEY) != _source_tag(csv_path):
+        return False
+    if columns is None:
+        return _PARTIAL_KEY not in metadata
+    return set(columns) <= set(schema.names)
+
+
+def write_sidecar(csv_path, frame):
+    path = sidecar_path(csv_path)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_SOURCE_KEY] = _source_tag(csv_path)
+    table = table.replace_schema_metadata(metadata)
+    # write to a temp file first so a reader never sees half a sidecar
+    tmp_path = path + '.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+    return path
+
+
+def stream_sidecar(csv_path, chunks, schema, as_table):
+    # passes the chunks of a scan of csv_path through while writing them (as_table(chunk), an
+    # arrow table) to a partial sidecar with schema, so a later scan memory-maps it. the sidecar
+    # only replaces the old one once the scan went through every chunk, a failed write just
+    # leaves the sidecar out
+    path = sidecar_path(csv_path)
+    tmp_path = path + '.tmp'
+    schema = schema.with_metadata({_SOURCE_KEY: _source_tag(csv_path), _PARTIAL_KEY: b'1'})
+    try:
+        writer = ipc.new_file(tmp_path, schema)
+    except OSError as e:
+        logger.warning("could not write sidecar for %s: %s", csv_path, e)
+        writer = None
+    try:
+        for chunk in chunks:
+            if writer is not None:
+                try:
+                    writer.write_table(as_table(chunk).cast(schema))
+                except OSError as e:
+                    logger.warning("could not write sidecar for %s: %s", csv_path, e)
+                    writer.close()
+                    writer = None
+                    os.remove(tmp_path)
+            yield chunk
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_path, path)
+    finally:
+        # a scan stopped halfway (or a failed write) leaves no temp file behind
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_csv_columnar(csv_path, columns=None, engine=None):
+    # numeric columns come back as read-only views on the memory-mapped file (no copy),
+    # a csv without a fresh sidecar is parsed by the configured engine (see engine.py)
+    if sidecar_is_fresh(csv_path, columns):
+        table = feather.read_table(sidecar_path(csv_path), columns=columns, memory_map=True)
+        return table.to_pandas(split_blocks=True)
+
+    frame = get_engine(engine)['read_csv'](csv_path)
+    try:
+        write_sidecar(csv_path, frame)
+    except OSError as e:
+        # read-only data directory etc, the csv still works
+        logger.warning("could not write sidecar for %s: %s", csv_path, e)
+    if columns is not None:
+        frame = frame[columns]
+    return frame
@@ -0,0 +1,352 @@
+# pre-aggregated summary cube for the dashboard charts
+# the patient table is reduced once per dataset version to one row per
+# (integer literacy score, literacy bin, literacy group, adherence bin, education, diagnosis) cell
+# holding count, mean, M2 and co-moments of the outcome columns (see aggregation.py).
+# every chart rolls that small table up instead of scanning patients, and the cubes of
+# separate partitions (clinic sites) merge into the cube of all of them (merge_cubes).
+# quantiles are not mergeable so the few the charts need are stored next to it, together
+# with the sorted values they come from so merged quantiles stay exact.
+# the cell of every patient and the sort orders the quantiles need are kept in a "basis",
+# so the cube of any subset of patients (cohort filters) is a few bincounts, no groupby or sort.
+# approximate mode (approximate=True) keeps a fixed-bin histogram over the schema range of
+# the metric per group instead of the sorted values: no sort, a few KB per group however
+# many patients, merged by adding counts. every order statistic is placed inside the bin
+# that holds it, so every quantile (min and max too) is within one bin width of the exact
+# one: 17 / 2048 = 0.0083 for HbA1c, 10 / 2048 = 0.0049 for adherence (quantile_error())
+# the cell codes come from one pandas groupby whatever DASHBOARD_ENGINE is (see engine.py),
+# cube_cell_moments() computes the same cells through an engine to check them against
+
+import numpy as np
+import pandas as pd
+
+from aggregation import combine_moments, moments_table, summarize_moments
+from schema import PATIENT_SCHEMA
+
+literacy_bins = [0, 2, 4, 6, 8, 10]
+literacy_bin_labels = ['0-2', '2-4', '4-6', '6-8', '8-10']
+adherence_bins = [0, 2, 4, 6, 8, 10]
+adherence_bin_labels = ['0-2', '2-4', '4-6', '6-8', '8-10']
+literacy_group_labels = ['Low (0-3)', 'Medium (4-6)', 'High (7-10)']
+
+CUBE_DIMENSIONS = ['LiteracyScore', 'HealthLiteracyBin', 'HealthLiteracyGroup',
+                   'AdherenceBin', 'EducationLevelStr', 'Diagnosis']
+CUBE_METRICS = ['HbA1c', 'QualityOfLifeScore', 'MedicationAdherence', 'HealthLiteracy']
+
+# name -> (group by, metric, diagnosis filter or None for everyone)
+QUANTILE_SUMMARIES = {
+    'hba1c_by_group': (['HealthLiteracyGroup'], 'HbA1c', None),
+    'adherence_by_bin_education': (['HealthLiteracyBin', 'EducationLevelStr'], 'MedicationAdherence', 1),
+}
+# histogram bins per group in approximate mode
+QUANTILE_BINS = 2048
+
+
+def _metric_pairs():
+    return [(a, b) for i, a in enumerate(CUBE_METRICS) for b in CUBE_METRICS[i + 1:]]
+
+
+def cube_keys(diabetes_data):
+    return pd.DataFrame({
+        'LiteracyScore': np.round(diabetes_data['HealthLiteracy']).astype(int),
+        'HealthLiteracyBin': pd.cut(diabetes_data['HealthLiteracy'], bins=literacy_bins,
+                                    labels=literacy_bin_labels, include_lowest=True),
+        'HealthLiteracyGroup': diabetes_data['HealthLiteracyGroup'],
+        'AdherenceBin': pd.cut(diabetes_data['MedicationAdherence'], bins=adherence_bins,
+                               labels=adherence_bin_labels, include_lowest=True),
+        'EducationLevelStr': diabetes_data['EducationLevelStr'],
+        'Diagnosis': diabetes_data['Diagnosis'],
+    }, index=diabetes_data.index)
+
+
+def cube_cell_moments(diabetes_data, engine=None):
+    # count/mean/M2 of every cube metric per cube cell straight from the patient rows through an
+    # engine (engine.py), what checks.py compares the cube with. the dashboard never runs this.
+    # patients with a missing key are in no cell here, the cube keeps them in cells of their own
+    frame = cube_keys(diabetes_data).assign(**{metric: diabetes_data[metric] for metric in CUBE_METRICS})
+    return moments_table(frame, CUBE_DIMENSIONS, CUBE_METRICS, engine)
+
+
+def quantile_table(frame, by, metric):
+    grouped = frame.groupby(by, observed=True)[metric]
+    table = grouped.quantile([0, 0.25, 0.5, 0.75, 1]).unstack()
+    table.columns = ['min', 'q1', 'median', 'q3', 'max']
+    return table.reset_index()
+
+
+def _bin_width(metric):
+    return (PATIENT_SCHEMA[metric]['max'] - PATIENT_SCHEMA[metric]['min']) / QUANTILE_BINS
+
+
+def quantile_error(name, approximate=True):
+    # largest difference between a quantile of summary name and the exact one
+    return _bin_width(QUANTILE_SUMMARIES[name][1]) if approximate else 0.0
+
+
+def _value_bins(metric, x):
+    bins = np.floor((x - PATIENT_SCHEMA[metric]['min']) / _bin_width(metric))
+    return np.clip(bins, 0, QUANTILE_BINS - 1).astype(np.int16)
+
+
+def cube_basis(diabetes_data, approximate=False):
+    keys = cube_keys(diabetes_data)
+    cells = keys.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)
+    # float64 for the moments, the patient table itself is float32
+    values = np.column_stack([diabetes_data[metric].to_numpy(dtype=np.float64) for metric in CUBE_METRICS])
+
+    quantiles = {}
+    for name, (by, metric, diagnosis) in QUANTILE_SUMMARIES.items():
+        groups = keys.groupby(by, observed=True)
+        # a missing key (HealthLiteracy 0 has no literacy group) is NaN in ngroup(), -1 here
+        codes = groups.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        x = diabetes_data[metric].to_numpy(dtype=np.float64)
+        rows = np.flatnonzero(codes >= 0)
+        if diagnosis is not None:
+            rows = rows[keys['Diagnosis'].to_numpy()[rows] == diagnosis]
+        group_keys = groups.size().reset_index()[by]
+        if approximate:
+            quantiles[name] = {'rows': rows, 'groups': codes[rows], 'bins': _value_bins(metric, x[rows]),
+                               'keys': group_keys}
+            continue
+        # rows sorted by group, then value: any subset of them is still sorted the same way
+        rows = rows[np.lexsort((x[rows], codes[rows]))]
+        quantiles[name] = {'rows': rows, 'groups': codes[rows], 'values': x[rows], 'keys': group_keys}
+
+    return {
+        'codes': cells.ngroup().to_numpy(),
+        'cell_keys': cells.size().reset_index()[CUBE_DIMENSIONS],
+        'values': values,
+        'quantiles': quantiles,
+        'n_rows': len(diabetes_data),
+        'approximate': approximate,
+    }
+
+
+def _select_sorted(summary, mask):
+    # the values of a quantile summary for the selected rows, still sorted by group then value
+    if mask is None:
+        return {'groups': summary['groups'], 'values': summary['values'], 'keys': summary['keys']}
+    keep = mask[summary['rows']]
+    return {'groups': summary['groups'][keep], 'values': summary['values'][keep], 'keys': summary['keys']}
+
+
+def _sorted_quantiles(selected):
+    # min/q1/median/q3/max per group by linear interpolation (same as pandas quantile)
+    groups, values = selected['groups'], selected['values']
+    counts = np.bincount(groups, minlength=len(selected['keys']))
+    present = np.flatnonzero(counts)
+    starts = (np.cumsum(counts) - counts)[present]
+    n = counts[present]
+    table = selected['keys'].iloc[present].reset_index(drop=True)
+    for column, q in zip(['min', 'q1', 'median', 'q3', 'max'], [0, 0.25, 0.5, 0.75, 1]):
+        position = q * (n - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, n - 1)
+        fraction = position - low
+        table[column] = values[starts + low] * (1 - fraction) + values[starts + high] * fraction
+    return table
+
+
+def _select_histogram(summary, mask):
+    # (groups x QUANTILE_BINS) counts of the selected rows
+    groups, bins = summary['groups'], summary['bins']
+    if mask is not None:
+        keep = mask[summary['rows']]
+        groups, bins = groups[keep], bins[keep]
+    n_groups = len(summary['keys'])
+    counts = np.bincount(groups * QUANTILE_BINS + bins, minlength=n_groups * QUANTILE_BINS)
+    return {'counts': counts.reshape(n_groups, QUANTILE_BINS), 'keys': summary['keys']}
+
+
+def _order_statistics(counts, k, low, width):
+    # value of the k-th smallest (0-based) per row of counts, spread evenly over the width of its bin
+    cumulative = np.cumsum(counts, axis=1)
+    bins = (cumulative <= k[:, None]).sum(axis=1)
+    rows = np.arange(len(counts))
+    in_bin = counts[rows, bins]
+    before = cumulative[rows, bins] - in_bin
+    return low + (bins + (k - before + 0.5) / in_bin) * width
+
+
+def _histogram_quantiles(histogram, metric):
+    # min/q1/median/q3/max per group like _sorted_quantiles, from the order statistics in the bins
+    counts = histogram['counts']
+    n = counts.sum(axis=1)
+    present = np.flatnonzero(n)
+    counts, n = counts[present], n[present]
+    table = histogram['keys'].iloc[present].reset_index(drop=True)
+    low, width = PATIENT_SCHEMA[metric]['min'], _bin_width(metric)
+    for column, q in zip(['min', 'q1', 'median', 'q3', 'max'], [0, 0.25, 0.5, 0.75, 1]):
+        position = q * (n - 1)
+        k = np.floor(position).astype(np.int64)
+        fraction = position - k
+        table[column] = (_order_statistics(counts, k, low, width) * (1 - fraction)
+                         + _order_statistics(counts, np.minimum(k + 1, n - 1), low, width) * fraction)
+    return table
+
+
+def _quantile_tables(inputs, approximate):
+    if approximate:
+        return {name: _histogram_quantiles(h, QUANTILE_SUMMARIES[name][1]) for name, h in inputs.items()}
+    return {name: _sorted_quantiles(selected) for name, selected in inputs.items()}
+
+
+def cube_from_basis(basis, mask=None):
+    # mask: boolean array over the patients (a cohort), None for everyone
+    codes, values = basis['codes'], basis['values']
+    if mask is not None:
+        codes, values = codes[mask], values[mask]
+    n_cells = len(basis['cell_keys'])
+    count = np.bincount(codes, minlength=n_cells)
+    moments = {'count': count}
+    # two passes: the cell means, then squared deviations from them
+    deviations = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for j, metric in enumerate(CUBE_METRICS):
+            mean = np.bincount(codes, weights=values[:, j], minlength=n_cells) / count
+            deviations[metric] = values[:, j] - mean[codes]
+            moments[f'mean_{metric}'] = mean
+    for metric, d in deviations.items():
+        moments[f'm2_{metric}'] = np.bincount(codes, weights=d * d, minlength=n_cells)
+    for a, b in _metric_pairs():
+        moments[f'comoment_{a}_{b}'] = np.bincount(codes, weights=deviations[a] * deviations[b], minlength=n_cells)
+    cells = pd.concat([basis['cell_keys'], pd.DataFrame(moments)], axis=1)
+    cells = cells[cells['count'] > 0].reset_index(drop=True)
+
+    select = _select_histogram if basis['approximate'] else _select_sorted
+    inputs = {name: select(summary, mask) for name, summary in basis['quantiles'].items()}
+    return {
+        'cells': cells,
+        'quantiles': _quantile_tables(inputs, basis['approximate']),
+        # sorted values or histograms per quantile summary, what merge_cubes() needs
+        'quantile_inputs': inputs,
+        'n_rows': int(len(codes)),
+        'approximate': basis['approximate'],
+    }
+
+
+def build_summary_cube(diabetes_data, approximate=False):
+    return cube_from_basis(cube_basis(diabetes_data, approximate))
+
+
+def _union_keys(key_frames):
+    # group keys of all the parts in group order, and for every part its codes -> union codes
+    by = list(key_frames[0].columns)
+    union = pd.concat(key_frames, ignore_index=True).groupby(by, observed=True, dropna=False).size().reset_index()[by]
+    position = union.reset_index().rename(columns={'index': '_code'})
+    mappings = [keys.merge(position, on=by, how='left')['_code'].to_numpy() for keys in key_frames]
+    return union, mappings
+
+
+def _merge_sorted(parts, offsets=None):
+    # merge parts sorted by (group, value) without sorting again: the smaller parts are
+    # inserted into the largest one at their searchsorted positions, per group.
+    # offsets: added to each part's 'rows' (positions of the rows in a basis), if there are rows
+    union, mappings = _union_keys([part['keys'] for part in parts])
+    columns = ['groups', 'values'] + (['rows'] if offsets is not None else [])
+    parts = [dict({c: part[c] for c in columns}, groups=mapping[part['groups']]) for part, mapping in zip(parts, mappings)]
+    if offsets is not None:
+        for part, offset in zip(parts, offsets):
+            part['rows'] = part['rows'] + offset
+    order = sorted(range(len(parts)), key=lambda i: -len(parts[i]['values']))
+    merged = parts[order[0]]
+    for i in order[1:]:
+        part = parts[i]
+        positions = np.empty(len(part['values']), dtype=np.int64)
+        for g in np.unique(part['groups']):
+            start, stop = np.searchsorted(merged['groups'], [g, g + 1])
+            inserted = part['groups'] == g
+            positions[inserted] = start + np.searchsorted(merged['values'][start:stop], part['values'][inserted],
+                                                          side='right')
+        merged = {c: np.insert(merged[c], positions, part[c]) for c in columns}
+    merged['keys'] = union
+    return merged
+
+
+def _merge_histograms(parts):
+    union, mappings = _union_keys([part['keys'] for part in parts])
+    counts = np.zeros((len(union), QUANTILE_BINS), dtype=np.int64)
+    for part, mapping in zip(parts, mappings):
+        counts[mapping] += part['counts']
+    return {'counts': counts, 'keys': union}
+
+
+def _concat_binned(parts, offsets):
+    # the binned rows of a basis followed by those of the next (approximate mode of _merge_sorted)
+    union, mappings = _union_keys([part['keys'] for part in parts])
+    return {
+        'rows': np.concatenate([part['rows'] + offset for part, offset in zip(parts, offsets)]),
+        'groups': np.concatenate([mapping[part['groups']] for part, mapping in zip(parts, mappings)]),
+        'bins': np.concatenate([part['bins'] for part in parts]),
+        'keys': union,
+    }
+
+
+def extend_basis(basis, delta_basis):
+    # basis of the rows of basis followed by the rows of delta_basis (appended patients),
+    # the cell codes of both are mapped onto the union of their cells
+    cell_keys, (old_codes, new_codes) = _union_keys([basis['cell_keys'], delta_basis['cell_keys']])
+    quantiles = {}
+    merge = _concat_binned if basis['approximate'] else _merge_sorted
+    for name, summary in basis['quantiles'].items():
+        quantiles[name] = merge([summary, delta_basis['quantiles'][name]], offsets=[0, basis['n_rows']])
+    return {
+        'codes': np.concatenate([old_codes[basis['codes']], new_codes[delta_basis['codes']]]),
+        'cell_keys': cell_keys,
+        'values': np.concatenate([basis['values'], delta_basis['values']]),
+        'quantiles': quantiles,
+        'n_rows': basis['n_rows'] + delta_basis['n_rows'],
+        'approximate': basis['approximate'],
+    }
+
+
+def merge_cubes(cubes):
+    # cube of the union of the partitions the cubes were built from, all exact or all approximate
+    cubes = list(cubes)
+    if len(cubes) == 1:
+        return cubes[0]
+    cells = combine_moments(pd.concat([c['cells'] for c in cubes], ignore_index=True), CUBE_DIMENSIONS,
+                            CUBE_METRICS, _metric_pairs(), dropna=False)
+    approximate = cubes[0]['approximate']
+    merge = _merge_histograms if approximate else _merge_sorted
+    inputs = {name: merge([c['quantile_inputs'][name] for c in cubes]) for name in QUANTILE_SUMMARIES}
+    return {
+        'cells': cells,
+        'quantiles': _quantile_tables(inputs, approximate),
+        'quantile_inputs': inputs,
+        'n_rows': sum(c['n_rows'] for c in cubes),
+        'approximate': approximate,
+    }
+
+
+def _select(cube, diagnosis):
+    cells = cube['cells']
+    if diagnosis is not None:
+        cells = cells[cells['Diagnosis'] == diagnosis]
+    return cells
+
+
+def cube_rollup(cube, by, columns=(), diagnosis=None):
+    # count, mean_<column> and m2_<column> per group
+    return combine_moments(_select(cube, diagnosis), by, columns)
+
+
+def cube_metric_stats(cube, by, metrics, diagnosis=None):
+    # mean/std/count/ci per group x metric (see aggregation.py) without touching patient rows
+    rolled = cube_rollup(cube, by, [m['column'] for m in metrics], diagnosis)
+    return summarize_moments(rolled, by, metrics)
+
+
+def cube_histogram(cube, x, y, diagnosis=None):
+    return cube_rollup(cube, [x, y], diagnosis=diagnosis)
+
+
+def cube_correlation(cube, x, y, diagnosis=None):
+    # pearson r from the stored co-moments
+    a, b = (x, y) if f'comoment_{x}_{y}' in cube['cells'] else (y, x)
+    cells = _select(cube, diagnosis).assign(_all=0)
+    totals = combine_moments(cells, ['_all'], [x, y], [(a, b)]).iloc[0]
+    return float(totals[f'comoment_{a}_{b}'] / np.sqrt(totals[f'm2_{x}'] * totals[f'm2_{y}']))
+
+
+def cube_quantiles(cube, name):
+    return cube['quantiles'][name]
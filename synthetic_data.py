@@ -0,0 +1,87 @@
+# synthetic patient cohorts shaped like diabetes_data.csv
+# every column of the schema is sampled independently from the marginal distribution
+# observed in the real file: value frequencies for flags/codes/integers, an inverse cdf
+# (1,001 sample quantiles) for continuous scores. Diagnosis follows HbA1c >= 6.5 like the
+# dashboard derives it. cohorts are produced in chunks so 10M+ rows can go straight to disk
+#
+#   python synthetic_data.py 1000000 cohort_1m.csv
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from data_loader import PATIENT_DATA_PATH
+from schema import PATIENT_SCHEMA
+
+QUANTILE_POINTS = 1001
+
+
+def fit_marginals(diabetes_data):
+    marginals = {}
+    for column, spec in PATIENT_SCHEMA.items():
+        values = diabetes_data[column]
+        if column == 'PatientID':
+            marginals[column] = {'kind': 'id', 'start': int(values.min())}
+        elif spec['dtype'] == 'category' or spec['dtype'].startswith('int'):
+            frequencies = values.value_counts(normalize=True).sort_index()
+            marginals[column] = {'kind': 'discrete', 'values': frequencies.index.to_numpy(),
+                                 'p': frequencies.to_numpy(dtype=np.float64)}
+        else:
+            quantiles = np.quantile(values.to_numpy(dtype=np.float64), np.linspace(0, 1, QUANTILE_POINTS))
+            marginals[column] = {'kind': 'continuous', 'quantiles': quantiles}
+    return marginals
+
+
+def load_marginals(path=PATIENT_DATA_PATH):
+    return fit_marginals(pd.read_csv(path))
+
+
+def _sample_chunk(marginals, n_rows, first_row, rng):
+    columns = {}
+    for column, marginal in marginals.items():
+        spec = PATIENT_SCHEMA[column]
+        if marginal['kind'] == 'id':
+            columns[column] = np.arange(first_row, first_row + n_rows, dtype=np.int64) + marginal['start']
+        elif marginal['kind'] == 'discrete':
+            values = rng.choice(marginal['values'], size=n_rows, p=marginal['p'])
+            columns[column] = values if spec['dtype'] == 'category' else values.astype(spec['dtype'])
+        else:
+            # inverse cdf by linear interpolation between the stored quantiles
+            u = rng.random(n_rows) * (QUANTILE_POINTS - 1)
+            columns[column] = np.interp(u, np.arange(QUANTILE_POINTS), marginal['quantiles'])
+    chunk = pd.DataFrame(columns)
+    chunk['Diagnosis'] = (chunk['HbA1c'] >= 6.5).astype(np.int8)
+    return chunk
+
+
+def iter_cohort_chunks(n_rows, marginals, seed=0, chunk_size=1_000_000):
+    rng = np.random.default_rng(seed)
+    for first_row in range(0, n_rows, chunk_size):
+        yield _sample_chunk(marginals, min(chunk_size, n_rows - first_row), first_row, rng)
+
+
+def generate_cohort(n_rows, marginals, seed=0, chunk_size=1_000_000):
+    return pd.concat(list(iter_cohort_chunks(n_rows, marginals, seed, chunk_size)), ignore_index=True)
+
+
+def write_cohort_csv(path, n_rows, marginals, seed=0, chunk_size=1_000_000):
+    for i, chunk in enumerate(iter_cohort_chunks(n_rows, marginals, seed, chunk_size)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic cohort shaped like diabetes_data.csv.")
+    parser.add_argument('rows', type=int, help="number of patients")
+    parser.add_argument('output', help="csv to write")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--source', default=PATIENT_DATA_PATH, help="file the marginal distributions come from")
+    args = parser.parse_args(argv)
+    write_cohort_csv(args.output, args.rows, load_marginals(args.source), seed=args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+# background warm-up of the shared caches
+# streamlit runs the page script inside the first visitor's request, so everything the first
+# page needs would be imported and loaded while they wait. start_warm_up() does it once per
+# server process in a daemon thread instead: the libraries the sections import, the summary
+# cube and its charts, the outcome model with every predictor image, and the BRFSS counts.
+# serve.py starts it before the server takes requests; the dashboard calls it too, so a plain
+# `streamlit run` warms up on the first page load. a page that needs an entry while it is
+# being built waits for that build instead of starting its own (see data_loader.py)
+
+import importlib
+import logging
+import threading
+import time
+
+from data_loader import load_brfss_counts, load_outcome_model, load_summary_cube, load_view
+from predictor import warm_radar_images
+
+logger = logging.getLogger(__name__)
+
+# in the order the tabs need them
+WARM_UP_MODULES = ['altair', 'charts', 'scipy.special', 'matplotlib.figure']
+# the key diabetes_dashboard.py memoizes its views under with no filters and the default settings
+DEFAULT_VIEW_KEY = (None, None, False, False)
+
+_thread = None
+_thread_lock = threading.Lock()
+# seconds per step of the last warm-up
+timings = {}
+
+
+def _step(name, function):
+    start = time.perf_counter()
+    try:
+        function()
+    except Exception as e:
+        # the page reports load errors itself, a failed step only means it is not warm
+        logger.warning("warm-up step %s failed: %s", name, e)
+    timings[name] = time.perf_counter() - start
+
+
+def _warm_cube_views(source):
+    from charts import cube_views
+    cube = load_summary_cube(source)
+    for name, build in cube_views(cube).items():
+        load_view(name, cube['paths'], DEFAULT_VIEW_KEY, build)
+
+
+def warm_up(source=None):
+    start = time.perf_counter()
+    for module in WARM_UP_MODULES:
+        _step(f'import {module}', lambda: importlib.import_module(module))
+    _step('summary cube', lambda: _warm_cube_views(source))
+    _step('predictor', lambda: warm_radar_images(load_outcome_model(source)))
+    _step('brfss', load_brfss_counts)
+    logger.info("warm-up done in %.2fs: %s", time.perf_counter() - start,
+                ', '.join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+
+
+def start_warm_up(source=None):
+    # the warm-up thread, started on the first call only
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warm_up, args=(source,), name='warm-up', daemon=True)
+            _thread.start()
+        return _thread